@@ -2,10 +2,38 @@
 from ckeditor_uploader.widgets import CKEditorUploadingWidget
 from django.contrib import admin
 from django import forms
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
 from .models import *
+from .paginators import EstimatedCountPaginator
+from . import directory, ledger, search
 import nested_admin
 
 
+def count_subquery(queryset, field):
+    # Đếm bằng subquery tương quan: chỉ tính cho các dòng của trang hiện tại, không GROUP BY cả bảng
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+# Bảng lớn: không hiện tổng số dòng chưa lọc (thêm 1 câu COUNT(*)), số dòng ước lượng khi không lọc
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+# Tìm cư dân / khách (cả ô tìm kiếm và autocomplete) theo đầu tên không dấu, số điện thoại, CCCD trên index
+class DirectorySearchMixin:
+    search_fields = ['^search_name', '^phone', '^identity_card']
+    search_help_text = 'Tên (gõ không dấu cũng được), số điện thoại hoặc CCCD, khớp phần đầu'
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(directory.condition(search_term)), False
+
+
 class BuildingForm(forms.ModelForm):
     description = forms.CharField(widget=CKEditorUploadingWidget)
     class Meta:
@@ -15,7 +43,7 @@ class BuildingForm(forms.ModelForm):
 class BuildingAdmin(admin.ModelAdmin):
     form = BuildingForm
     list_display = ['id', 'name', 'address','total_apartment','create_time', 'active']
-    list_filter = ['name', 'address']
+    list_filter = ['active']
     search_fields = ['name','address']
 
 class ApartmentForm(forms.ModelForm):
@@ -24,31 +52,79 @@ class ApartmentForm(forms.ModelForm):
         model = Apartment
         fields = '__all__'
 
-class ApartmentAdmin(admin.ModelAdmin):
+class ApartmentAdmin(LargeTableAdmin):
     form = ApartmentForm
-    list_display = ['id', 'number','household_head', 'building', 'active']
-    list_filter = ['number', 'building', 'active']
-    search_fields = ['number']
+    list_display = ['id', 'number', 'floor', 'household_head', 'building', 'resident_count', 'active']
+    list_select_related = ['household_head', 'building']
+    list_filter = ['building', 'active']
+    search_fields = ['^number']  # index unique (number, building)
+    autocomplete_fields = ['household_head']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(resident_count=count_subquery(Resident.objects, 'apartment'))
+
+    @admin.display(description='Số cư dân', ordering='resident_count')
+    def resident_count(self, obj):
+        return obj.resident_count
+
+class ResidentAdmin(DirectorySearchMixin, LargeTableAdmin):
+    list_display = ['id', 'name', 'user__username', 'relationship_to_head', 'apartment__number',
+                    'apartment__building__name', 'active']
+    list_select_related = ['user', 'apartment__building']
+    list_filter = ['relationship_to_head', 'gender', 'active', 'apartment__building']
+    autocomplete_fields = ['apartment']
+    raw_id_fields = ['user']  # User không đăng ký trong admin_site nên không dùng autocomplete được
+
+class LockerItemAdmin(LargeTableAdmin):
+    list_display = ['id', 'locker_number', 'resident__name', 'waiting_items']
+    list_select_related = ['resident']
+    search_fields = ['=locker_number']
+    autocomplete_fields = ['resident']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            waiting_items=count_subquery(Item.objects.filter(status='waiting'), 'locker_item'))
+
+    @admin.display(description='Đồ chờ nhận', ordering='waiting_items')
+    def waiting_items(self, obj):
+        return obj.waiting_items
 
-class ResidentAdmin(admin.ModelAdmin):
-    list_filter = list_display = ['id', 'name','user__username', 'relationship_to_head', 'apartment__number']
-    search_fields = ['name','apartment__number','user__username']
+class ItemAdmin(LargeTableAdmin):
+    list_display = ['id', 'name_item', 'locker_item__locker_number', 'locker_item__resident__name', 'status',
+                    'create_time', 'received_at']
+    list_select_related = ['locker_item__resident']
+    list_filter = ['status']
+    search_fields = ['=locker_item__locker_number']
+    raw_id_fields = ['locker_item']
 
-class LockerItemAdmin(admin.ModelAdmin):
-    list_filter = list_display = ['id', 'locker_number', 'resident__name']
-    search_fields = ['locker_number', 'resident__name']
+class VisitorAdmin(DirectorySearchMixin, LargeTableAdmin):
+    list_display = ['id', 'full_name', 'resident__name', 'relationship_to_resident', 'is_approved', 'active']
+    list_select_related = ['resident']
+    list_filter = ['is_approved', 'active']
+    autocomplete_fields = ['resident']
 
-class ItemAdmin(admin.ModelAdmin):
-    list_filter = list_display =  ['id', 'name_item', 'locker_item__resident__name', 'status']
-    search_fields = ['name_item', 'locker_item__resident__name']
+class ParkingCardAdmin(LargeTableAdmin):
+    list_display = ['id', 'card_number', 'resident__name', 'visitor__full_name', 'license_plate', 'vehicle_type']
+    list_select_related = ['resident', 'visitor']
+    list_filter = ['vehicle_type']
+    search_fields = ['^card_number', '^plate_key']
+    search_help_text = 'Số thẻ hoặc biển số (gõ kiểu nào cũng được), khớp phần đầu'
+    autocomplete_fields = ['resident', 'visitor']
 
-class VisitorAdmin(admin.ModelAdmin):
-    list_filter = list_display = ['id', 'full_name', 'resident__name','relationship_to_resident','is_approved']
-    search_fields = ['full_name','resident__name']
+    def get_search_results(self, request, queryset, search_term):
+        # biển số gõ kiểu nào ('51f-123.45', '51F 12345') cũng so với plate_key đã chuẩn hoá
+        term, key = search_term.strip(), plate_key(search_term)
+        if not term:
+            return queryset, False
+        match = Q(card_number__istartswith=term)
+        if key:
+            match |= Q(plate_key__istartswith=key)
+        return queryset.filter(match), False
 
-class ParkingCardAdmin(admin.ModelAdmin):
-    list_filter = list_display = ['id', 'card_number','resident__name','visitor__full_name', 'license_plate']
-    search_fields = ['card_number', 'resident__name']
+class CardNumberAdmin(LargeTableAdmin):
+    list_display = ['id', 'number', 'issued', 'update_time']
+    list_filter = ['issued']
+    search_fields = ['^number']
 
 class FeeTypeForm(forms.ModelForm):
     description = forms.CharField(widget=CKEditorUploadingWidget)
@@ -58,16 +134,33 @@ class FeeTypeForm(forms.ModelForm):
 
 class FeeTypeAdmin(admin.ModelAdmin):
     form = FeeTypeForm
-    list_filter = list_display = ['id', 'name', 'create_time']
+    list_display = ['id', 'name', 'create_time']
     search_fields = ['name']
 
-class InvoiceAdmin(admin.ModelAdmin):
-    list_filter = list_display = ['id','resident__name', 'fee_type__name','amount','paid']
-    search_fields = ['resident__name','fee_type__name']
+class InvoiceAdmin(LargeTableAdmin):
+    list_display = ['id', 'resident__name', 'apartment__number', 'fee_type__name', 'period', 'amount', 'due_date',
+                    'paid']
+    list_select_related = ['resident', 'apartment', 'fee_type']
+    list_filter = ['paid', 'fee_type']
+    search_fields = ['=id', '^apartment__number']
+    autocomplete_fields = ['resident', 'apartment']
 
-class PaymentAdmin(admin.ModelAdmin):
-    list_filter = list_display = ['id', 'resident__name', 'invoice__fee_type__name', 'method']
-    search_fields = ['resident__name', 'create_time']
+    # Thêm / sửa / xoá hoá đơn đi qua ledger để Balance không lệch
+    def save_model(self, request, obj, form, change):
+        ledger.save_invoice(obj)
+
+    def delete_model(self, request, obj):
+        ledger.delete_invoices(Invoice.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        ledger.delete_invoices(queryset)
+
+class PaymentAdmin(LargeTableAdmin):
+    list_display = ['id', 'resident__name', 'invoice__fee_type__name', 'method', 'status', 'create_time']
+    list_select_related = ['resident', 'invoice__fee_type']
+    list_filter = ['method', 'status']
+    search_fields = ['=id', '=invoice__id']
+    autocomplete_fields = ['resident', 'invoice']
 
 class ComplaintForm(forms.ModelForm):
     content = forms.CharField(widget=CKEditorUploadingWidget)
@@ -75,10 +168,29 @@ class ComplaintForm(forms.ModelForm):
         model = Complaint
         fields = '__all__'
 
-class ComplaintAdmin(admin.ModelAdmin):
+class ComplaintAdmin(LargeTableAdmin):
     form = ComplaintForm
-    list_filter = list_display = ['id', 'title', 'resident__name',]
-    search_fields = ['resident__name', 'title']
+    list_display = ['id', 'title', 'resident__name', 'status', 'response_count', 'create_time']
+    list_select_related = ['resident']
+    list_filter = ['status', 'is_resolved']
+    search_fields = ['=id']
+    search_help_text = 'Mã phản ánh, hoặc từ khoá trong tiêu đề / nội dung / phản hồi'
+    autocomplete_fields = ['resident']
+
+    def get_search_results(self, request, queryset, search_term):
+        # Dùng index full-text (chungcu/search.py) thay vì LIKE '%...%' trên tiêu đề
+        if not search_term.strip() or search_term.strip().isdigit():
+            return super().get_search_results(request, queryset, search_term)
+        ids = [complaint.id for complaint in search.RankedResults(search_term)[:200]]
+        return queryset.filter(id__in=ids), False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            response_count=count_subquery(ComplaintResponse.objects, 'complaint'))
+
+    @admin.display(description='Số phản hồi', ordering='response_count')
+    def response_count(self, obj):
+        return obj.response_count
 
 class ComplaintResponeForm(forms.ModelForm):
     content = forms.CharField(widget=CKEditorUploadingWidget)
@@ -86,10 +198,13 @@ class ComplaintResponeForm(forms.ModelForm):
         model = ComplaintResponse
         fields = '__all__'
 
-class ComplaintResponeAdmin(admin.ModelAdmin):
+class ComplaintResponeAdmin(LargeTableAdmin):
     form = ComplaintResponeForm
-    list_filter = list_display = ['id', 'complaint__title', 'complaint__resident__name',]
-    search_fields = ['complaint__resident__name', 'complaint__title']
+    list_display = ['id', 'complaint__title', 'complaint__resident__name', 'responder__username', 'create_time']
+    list_select_related = ['complaint__resident', 'responder']
+    search_fields = ['=complaint__id']
+    autocomplete_fields = ['complaint']
+    raw_id_fields = ['responder']
 
 class SurveyForm(forms.ModelForm):
     description = forms.CharField(widget=CKEditorUploadingWidget)
@@ -97,8 +212,16 @@ class SurveyForm(forms.ModelForm):
         model = Survey
         fields = '__all__'
 
+class ChoiceFormSet(nested_admin.formsets.NestedInlineFormSet):
+    # Dùng lựa chọn đã prefetch cùng câu hỏi (QuestionInlineAdmin.get_queryset), không query lại mỗi câu hỏi
+    def get_queryset(self):
+        if not self.data and 'choices' in getattr(self.instance, '_prefetched_objects_cache', {}):
+            return self.instance.choices.all()
+        return super().get_queryset()
+
 class ChoiceInlineAdmin(nested_admin.NestedTabularInline):
     model = Choice
+    formset = ChoiceFormSet
     extra = 2
 
 class QuestionInlineAdmin(nested_admin.NestedStackedInline):
@@ -106,19 +229,43 @@ class QuestionInlineAdmin(nested_admin.NestedStackedInline):
     inlines = [ChoiceInlineAdmin]
     extra = 2
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('survey').prefetch_related('choices')
+
 class SurveyAdmin(nested_admin.NestedModelAdmin):
     form = SurveyForm
-    list_filter = list_display = ['id', 'title', 'create_time', 'deadline']
+    list_display = ['id', 'title', 'create_time', 'deadline', 'response_count']
+    list_filter = ['deadline']
     search_fields = ['title','create_time']
     inlines = [QuestionInlineAdmin]
 
-class SurveyResponseAdmin(admin.ModelAdmin):
-    list_filter = list_display = ['id', 'survey__title', 'user__username']
-    search_fields = ['survey__title', 'user__username']
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(response_count=count_subquery(SurveyResponse.objects, 'survey'))
+
+    @admin.display(description='Số phiếu trả lời', ordering='response_count')
+    def response_count(self, obj):
+        return obj.response_count
+
+class SurveyResponseAdmin(LargeTableAdmin):
+    list_display = ['id', 'survey__title', 'user__username', 'create_time']
+    list_select_related = ['survey', 'user']
+    list_filter = ['survey']
+    search_fields = ['=user__username']
+    raw_id_fields = ['user']
+
+class AnswerAdmin(LargeTableAdmin):
+    list_display = ['id', 'response__user__username', 'response__survey__title', 'question', 'choice_list']
+    list_select_related = ['response__user', 'response__survey', 'question__survey']
+    list_filter = ['response__survey']
+    search_fields = ['=id', '=response__user__username']
+    raw_id_fields = ['response', 'question', 'choices']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('choices')
 
-class AnswerAdmin(admin.ModelAdmin):
-    list_filter = list_display = ['id','response__user__username','response__survey__title','choices__text']
-    search_fields = ['id','id','response__user__username','response__survey__title']
+    @admin.display(description='Lựa chọn')
+    def choice_list(self, obj):
+        return ', '.join(choice.text for choice in obj.choices.all())
 
 class ChungCuAppAdminSite(admin.AdminSite):
     site_header = 'Hệ thống quản lý chung cư'
@@ -133,6 +280,7 @@ admin_site.register(LockerItem, LockerItemAdmin)
 admin_site.register(Item, ItemAdmin)
 admin_site.register(Visitor, VisitorAdmin)
 admin_site.register(ParkingCard, ParkingCardAdmin)
+admin_site.register(CardNumber, CardNumberAdmin)
 admin_site.register(FeeType, FeeTypeAdmin)
 admin_site.register(Invoice, InvoiceAdmin)
 admin_site.register(Payment, PaymentAdmin)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ChungcuConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chungcu'
+
+    def ready(self):
+        from chungcu import signals  # noqa: F401
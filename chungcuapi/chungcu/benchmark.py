@@ -0,0 +1,266 @@
+import math
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from chungcu import gate
+from chungcu.models import *
+
+# Số câu SQL tối đa cho mỗi endpoint, vượt quá là coi như hồi quy (N+1...)
+BUDGETS = {
+    'building-detail': 1,
+    'building-apartments': 3,
+    'apartment-list': 2,
+    'apartment-detail': 2,
+    'apartment-residents': 3,
+    'apartment-balance': 2,
+    'resident-list': 2,
+    'resident-detail': 2,
+    'resident-invoices': 3,
+    'resident-invoice-detail': 5,
+    'resident-balance': 2,
+    'resident-parkingcard': 2,
+    'resident-lockeritem': 3,
+    'resident-item-detail': 3,
+    'resident-complaints': 3,
+    'resident-complaint-detail': 4,
+    'resident-visitors': 3,
+    'resident-visitor-detail': 4,
+    'resident-surveys': 2,
+    'resident-survey-response': 6,
+    'lockeritem-list': 3,
+    'lockeritem-detail': 3,
+    'lockeritem-pending': 1,
+    'parkingcard-list': 2,
+    'parkingcard-detail': 1,
+    'visitor-list': 2,
+    'visitor-detail': 2,
+    'visitor-parkingcard': 1,
+    'invoice-list': 2,
+    'invoice-detail': 4,
+    'payment-list': 2,
+    'payment-detail': 2,
+    'complaint-list': 2,
+    'complaint-detail': 3,
+    'complaintresponse-list': 2,
+    'complaintresponse-detail': 3,
+    'survey-list': 2,
+    'survey-detail': 4,
+    'survey-responses': 6,
+    'survey-results': 5,
+    'user-list': 1,
+    'user-detail': 1,
+    'user-current': 1,
+    'directory': 2,
+}
+
+
+def seed_probe():
+    """
+    Tạo 1 cư dân đầy đủ dữ liệu liên quan (tủ đồ, thẻ xe, người thân, phản ánh, khảo sát...)
+    để gọi được tất cả các endpoint lồng nhau.
+    """
+    admin = User.objects.create_user(username='bench_admin', password='123', is_staff=True)
+    user = User.objects.create_user(username='bench_resident', password='123')
+
+    building = Building.objects.create(name='Chung cư benchmark', address='1 Lê Lợi', area=1000, total_apartment=1)
+    apartment = Apartment.objects.create(number='B-01', floor=1, price=1, area=50, building=building)
+    resident = Resident.objects.create(name='Cư dân benchmark', identity_card='999999999999', gender='Male',
+                                       birthday=date(1990, 1, 1), phone='0999999999', relationship_to_head='owner',
+                                       apartment=apartment, user=user)
+
+    locker = LockerItem.objects.create(resident=resident, locker_number='L-01', description='Tủ benchmark')
+    for i in range(5):
+        Item.objects.create(locker_item=locker, name_item=f'Bưu phẩm {i}')
+    ParkingCard.objects.create(resident=resident, card_number='BENCH-R', license_plate='51F-999.99',
+                               vehicle_type='car')
+    visitor = Visitor.objects.create(resident=resident, full_name='Người thân', identity_card='888888888888',
+                                     phone='0888888888', relationship_to_resident='Con', is_approved=True)
+    ParkingCard.objects.create(visitor=visitor, card_number='BENCH-V', license_plate='51F-888.88',
+                               vehicle_type='motorbike')
+
+    fee_type = FeeType.objects.first() or FeeType.objects.create(name='Phí quản lý')
+    for i in range(30):
+        invoice = Invoice.objects.create(apartment=apartment, resident=resident, fee_type=fee_type, amount=100_000,
+                                         due_date=date(2025, 1, 1) + timedelta(days=30 * i))
+        Payment.objects.create(resident=resident, invoice=invoice, method='momo')
+
+    complaints = [Complaint.objects.create(resident=resident, title=f'Phản ánh {i}', content='<p>Nội dung</p>')
+                  for i in range(5)]
+    ComplaintResponse.objects.create(complaint=complaints[0], responder=admin, content='<p>Đã xử lý</p>')
+
+    survey = Survey.objects.create(title='Khảo sát benchmark')
+    questions = [Question.objects.create(survey=survey, text=f'Câu hỏi {i}') for i in range(5)]
+    choices = [[Choice.objects.create(question=q, text=f'Lựa chọn {j}') for j in range(4)] for q in questions]
+    survey_response = SurveyResponse.objects.create(survey=survey, user=user)
+    for question, question_choices in zip(questions, choices):
+        Answer.objects.create(response=survey_response, question=question).choices.set(question_choices[:1])
+
+    return load_probe()
+
+
+def load_probe():
+    resident = Resident.objects.select_related('apartment', 'user').get(identity_card='999999999999')
+    locker = resident.lockeritem
+    return {
+        'admin': User.objects.get(username='bench_admin'),
+        'user': resident.user,
+        'building': resident.apartment.building_id,
+        'apartment': resident.apartment_id,
+        'resident': resident.id,
+        'locker': locker.id,
+        'item': locker.items.order_by('id').values_list('id', flat=True).first(),
+        'card': resident.parkingcard.id,
+        'visitor': resident.visitor_set.order_by('id').values_list('id', flat=True).first(),
+        'invoice': resident.invoices.order_by('id').values_list('id', flat=True).first(),
+        'payment': Payment.objects.filter(resident=resident).order_by('id').values_list('id', flat=True).first(),
+        'complaint': resident.complaint_set.order_by('id').values_list('id', flat=True).first(),
+        'complaint_response': ComplaintResponse.objects.filter(complaint__resident=resident)
+        .values_list('id', flat=True).first(),
+        'survey': SurveyResponse.objects.filter(user=resident.user).values_list('survey_id', flat=True).first(),
+    }
+
+
+def endpoints(probe):
+    p = probe
+    r = f"/residents/{p['resident']}"
+    return [
+        ('building-detail', 'admin', f"/buildings/{p['building']}/"),
+        ('building-apartments', 'admin', f"/buildings/{p['building']}/apartments/"),
+        ('apartment-list', 'admin', '/apartments/'),
+        ('apartment-detail', 'resident', f"/apartments/{p['apartment']}/"),
+        ('apartment-residents', 'resident', f"/apartments/{p['apartment']}/residents/"),
+        ('apartment-balance', 'resident', f"/apartments/{p['apartment']}/balance/"),
+        ('resident-list', 'admin', '/residents/'),
+        ('resident-detail', 'resident', f'{r}/'),
+        ('resident-invoices', 'resident', f'{r}/invoices/'),
+        ('resident-invoice-detail', 'resident', f"{r}/invoices/{p['invoice']}/"),
+        ('resident-balance', 'resident', f'{r}/balance/'),
+        ('resident-parkingcard', 'resident', f'{r}/parkingcard/'),
+        ('resident-lockeritem', 'resident', f'{r}/lockeritem/'),
+        ('resident-item-detail', 'resident', f"{r}/lockeritem/item/{p['item']}/"),
+        ('resident-complaints', 'resident', f'{r}/complaints/'),
+        ('resident-complaint-detail', 'resident', f"{r}/complaints/{p['complaint']}/"),
+        ('resident-visitors', 'resident', f'{r}/visitors/'),
+        ('resident-visitor-detail', 'resident', f"{r}/visitors/{p['visitor']}/"),
+        ('resident-surveys', 'resident', f'{r}/surveys/'),
+        ('resident-survey-response', 'resident', f"{r}/surveys/{p['survey']}/"),
+        ('lockeritem-list', 'admin', '/lockeritems/'),
+        ('lockeritem-detail', 'admin', f"/lockeritems/{p['locker']}/"),
+        ('lockeritem-pending', 'admin', '/lockeritems/pending/'),
+        ('parkingcard-list', 'admin', '/parkingcards/'),
+        ('parkingcard-detail', 'admin', f"/parkingcards/{p['card']}/"),
+        ('visitor-list', 'admin', '/visitors/'),
+        ('visitor-detail', 'admin', f"/visitors/{p['visitor']}/"),
+        ('visitor-parkingcard', 'admin', f"/visitors/{p['visitor']}/parkingcard/"),
+        ('invoice-list', 'admin', '/invoices/'),
+        ('invoice-detail', 'resident', f"/invoices/{p['invoice']}/"),
+        ('payment-list', 'resident', '/payments/'),
+        ('payment-detail', 'resident', f"/payments/{p['payment']}/"),
+        ('complaint-list', 'resident', '/complaints/'),
+        ('complaint-detail', 'resident', f"/complaints/{p['complaint']}/"),
+        ('complaintresponse-list', 'admin', '/complaintresponses/'),
+        ('complaintresponse-detail', 'admin', f"/complaintresponses/{p['complaint_response']}/"),
+        ('survey-list', 'resident', '/surveys/'),
+        ('survey-detail', 'resident', f"/surveys/{p['survey']}/"),
+        ('survey-responses', 'admin', f"/surveys/{p['survey']}/responses/"),
+        ('survey-results', 'admin', f"/surveys/{p['survey']}/results/"),
+        ('user-list', 'admin', '/users/'),
+        ('user-detail', 'admin', f"/users/{p['user'].id}/"),
+        ('user-current', 'resident', '/users/current_user/'),
+        ('directory', 'admin', '/directory/?q=cu dan benchmark'),
+    ]
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def run(probe, repeat=20):
+    """Gọi lần lượt từng endpoint, đo độ trễ (ms) và số câu SQL."""
+    clients = {'admin': APIClient(), 'resident': APIClient()}
+    clients['admin'].force_authenticate(probe['admin'])
+    clients['resident'].force_authenticate(probe['user'])
+
+    results = {}
+    for name, role, url in endpoints(probe):
+        timings, queries, status_code = [], 0, None
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = clients[role].get(url)
+                timings.append((time.perf_counter() - started) * 1000)
+            status_code = response.status_code
+            queries = max(queries, len(captured.captured_queries))
+
+        results[name] = {
+            'url': url,
+            'status': status_code,
+            'queries': queries,
+            'budget': BUDGETS.get(name),
+            'p50_ms': round(percentile(timings, 50), 2),
+            'p95_ms': round(percentile(timings, 95), 2),
+            'p99_ms': round(percentile(timings, 99), 2),
+        }
+    return results
+
+
+def regressions(results):
+    return {name: r for name, r in results.items()
+            if r['status'] != 200 or r['budget'] is None or r['queries'] > r['budget']}
+
+
+def gate_plates(count=500, unknown=0.1, seed=0):
+    """Lấy mẫu biển số có thẻ (viết theo nhiều kiểu khác nhau như người gõ / camera đọc) và 1 phần biển lạ."""
+    rng = random.Random(seed)
+    known = list(ParkingCard.objects.order_by('?').values_list('license_plate', flat=True)[:count])
+    plates = [rng.choice([plate, plate.lower(), plate.replace('-', ' '), plate.replace('.', '')]) for plate in known]
+    plates += [f'99Z-{i:03d}.{rng.randrange(100):02d}' for i in range(int(len(plates) * unknown))]
+    rng.shuffle(plates)
+    return plates
+
+
+def run_gate(user, plates, threads=8, requests=5000):
+    """Gọi gate-check đồng thời từ nhiều luồng, đo phân vị độ trễ (ms), thông lượng và tỉ lệ trúng LRU."""
+    gate.invalidate()
+    gate.plates.hits = gate.plates.misses = 0
+    per_thread = math.ceil(requests / threads)
+
+    def worker(offset):
+        client = APIClient()
+        client.force_authenticate(user)
+        timings = []
+        try:
+            for i in range(per_thread):
+                plate = plates[(offset + i * threads) % len(plates)]
+                started = time.perf_counter()
+                response = client.get('/parkingcards/gate-check/', {'plate': plate})
+                timings.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    raise RuntimeError(f'gate-check {plate}: HTTP {response.status_code}')
+        finally:
+            connection.close()  # mỗi luồng có kết nối DB riêng
+        return timings
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        timings = [t for chunk in pool.map(worker, range(threads)) for t in chunk]
+    elapsed = time.perf_counter() - started
+
+    return {
+        'threads': threads,
+        'requests': len(timings),
+        'plates': len(plates),
+        'throughput_rps': round(len(timings) / elapsed, 1),
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'p99_ms': round(percentile(timings, 99), 2),
+        'max_ms': round(max(timings), 2),
+        'cache': gate.plates.stats(),
+    }
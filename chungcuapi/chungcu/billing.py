@@ -0,0 +1,136 @@
+import time
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from chungcu import ledger
+from chungcu.models import Apartment, Invoice, LedgerEntry, Payment
+
+
+def billing_period(value):
+    # Kỳ thu phí luôn được lưu là ngày đầu tháng
+    return value.replace(day=1)
+
+
+def generate_invoices(fee_type, period, amount, due_date, building_ids=None, batch_size=1000):
+    """
+    Tạo hoá đơn cho tất cả căn hộ (đang hoạt động, đã có chủ hộ) của các chung cư được chọn.
+    Chạy lại nhiều lần không bị trùng vì đã có hoá đơn (apartment, fee_type, period) thì bỏ qua.
+    """
+    period = billing_period(period)
+    started = time.monotonic()
+
+    apartments = Apartment.objects.filter(active=True)
+    if building_ids:
+        apartments = apartments.filter(building_id__in=building_ids)
+
+    billed = Invoice.objects.filter(apartment=OuterRef('pk'), fee_type=fee_type, period=period)
+    pending = apartments.filter(household_head__isnull=False).exclude(Exists(billed))
+
+    existing = Invoice.objects.filter(fee_type=fee_type, period=period, apartment__in=apartments)
+    before = existing.count()
+    without_head = apartments.filter(household_head__isnull=True).count()
+
+    batch, created = [], 0
+    for apartment_id, resident_id in pending.order_by('id').values_list('id', 'household_head_id') \
+            .iterator(chunk_size=batch_size):
+        batch.append(Invoice(apartment_id=apartment_id, resident_id=resident_id, fee_type=fee_type,
+                             amount=amount, due_date=due_date, period=period))
+        if len(batch) >= batch_size:
+            created += _insert_batch(batch, fee_type, period)
+            batch = []
+    if batch:
+        created += _insert_batch(batch, fee_type, period)
+
+    elapsed = time.monotonic() - started
+    return {
+        'created': created,
+        'skipped': before,
+        'without_head': without_head,
+        'elapsed': round(elapsed, 3),
+        'rows_per_second': round(created / elapsed, 1) if elapsed else created,
+    }
+
+
+def _insert_batch(invoices, fee_type, period):
+    """
+    Chèn 1 lô hoá đơn, trả về số hoá đơn lần chạy này thực sự tạo.
+    ignore_conflicts: nếu 1 lần chạy khác vừa tạo cùng hoá đơn thì constraint unique_invoice_period chặn lại,
+    khi đó bulk_create vẫn trả về đủ các object nên đếm theo các hoá đơn chưa có bút toán phát sinh bên dưới.
+    """
+    with transaction.atomic():
+        Invoice.objects.bulk_create(invoices, batch_size=len(invoices), ignore_conflicts=True)
+
+        # Đọc lại id các hoá đơn vừa tạo (MySQL không trả id khi bulk_create) để ghi công nợ
+        created = Invoice.objects.filter(fee_type=fee_type, period=period,
+                                         apartment_id__in=[invoice.apartment_id for invoice in invoices]) \
+            .exclude(Exists(LedgerEntry.objects.filter(invoice=OuterRef('pk'), kind='charge'))) \
+            .values('id', 'apartment_id', 'resident_id', 'amount', 'due_date')
+        created = list(created)
+        ledger.post_charges(created)
+    return len(created)
+
+
+def approve_payments(payment_ids):
+    """
+    Duyệt nhiều thanh toán trong 1 transaction, trả về kết quả theo từng id:
+    approved / already_approved / locked (đang được xử lý ở nơi khác) / not_found
+    """
+    with transaction.atomic():
+        payments, results = _lock_payments(payment_ids)
+        to_approve = [p for p in payments if p['status'] != 'approved']
+        for p in payments:
+            results[p['id']] = 'approved' if p['status'] != 'approved' else 'already_approved'
+
+        if to_approve:
+            now = timezone.now()
+            Payment.objects.filter(id__in=[p['id'] for p in to_approve]).update(status='approved', update_time=now)
+
+            invoices = list(Invoice.objects.select_for_update()
+                            .filter(id__in={p['invoice_id'] for p in to_approve}, paid=False)
+                            .values('id', 'apartment_id', 'resident_id', 'amount', 'due_date'))
+            Invoice.objects.filter(id__in=[i['id'] for i in invoices]).update(paid=True, update_time=now)
+            ledger.post_payments(invoices)
+
+    return results
+
+
+def reject_payments(payment_ids):
+    """
+    Từ chối nhiều thanh toán trong 1 transaction, trả về kết quả theo từng id:
+    rejected / already_rejected / locked / not_found.
+    Thanh toán đã duyệt bị từ chối thì hoá đơn quay lại chưa thanh toán (trừ khi còn thanh toán khác đã duyệt).
+    """
+    with transaction.atomic():
+        payments, results = _lock_payments(payment_ids)
+        to_reject = [p for p in payments if p['status'] != 'rejected']
+        for p in payments:
+            results[p['id']] = 'rejected' if p['status'] != 'rejected' else 'already_rejected'
+
+        if to_reject:
+            now = timezone.now()
+            Payment.objects.filter(id__in=[p['id'] for p in to_reject]).update(status='rejected', update_time=now)
+
+            reopened = {p['invoice_id'] for p in to_reject if p['status'] == 'approved'}
+            still_paid = Payment.objects.filter(invoice=OuterRef('pk'), status='approved')
+            invoices = list(Invoice.objects.select_for_update()
+                            .filter(id__in=reopened, paid=True).exclude(Exists(still_paid))
+                            .values('id', 'apartment_id', 'resident_id', 'amount', 'due_date'))
+            Invoice.objects.filter(id__in=[i['id'] for i in invoices]).update(paid=False, update_time=now)
+            ledger.post_reversals(invoices)
+
+    return results
+
+
+def _lock_payments(payment_ids):
+    # skip_locked: bỏ qua các thanh toán đang bị transaction khác giữ khoá thay vì chờ
+    payments = list(Payment.objects.select_for_update(skip_locked=True).filter(id__in=payment_ids)
+                    .values('id', 'status', 'invoice_id'))
+
+    results = {payment_id: 'not_found' for payment_id in payment_ids}
+    missing = set(payment_ids) - {p['id'] for p in payments}
+    if missing:
+        for payment_id in Payment.objects.filter(id__in=missing).values_list('id', flat=True):
+            results[payment_id] = 'locked'
+    return payments, results
@@ -0,0 +1,117 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.utils.http import parse_http_date_safe
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+
+from chungcu import conditional
+
+from chungcu.models import Apartment, Building, Choice, Question, Survey
+
+# Các model mà response cache phụ thuộc, signals.py tăng version khi có thay đổi
+WATCHED_MODELS = (Building, Apartment, Survey, Question, Choice)
+CACHE_TIMEOUT = 5 * 60
+
+# Tên các response được cache (View.action), để thống kê hit/miss
+registry = set()
+
+
+def version_key(model):
+    return f'chungcu:response:version:{model._meta.label_lower}'
+
+
+def versions(models):
+    keys = [version_key(model) for model in models]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # Lấy thời gian làm version đầu tiên để không trùng với version cũ nếu key bị xoá khỏi cache
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return '.'.join(str(found[key]) for key in keys)
+
+
+def bump(*models):
+    """Làm mất hiệu lực các response phụ thuộc các model này (gọi sau update()/bulk_create vì không có signal)."""
+    for model in models:
+        try:
+            cache.incr(version_key(model))
+        except ValueError:
+            cache.add(version_key(model), time.time_ns(), None)
+
+
+def stats_key(name, kind):
+    return f'chungcu:response:stats:{name}:{kind}'
+
+
+def count(name, kind):
+    try:
+        cache.incr(stats_key(name, kind))
+    except ValueError:
+        cache.add(stats_key(name, kind), 1, None)
+
+
+def stats():
+    result = {}
+    for name in sorted(registry):
+        hits = cache.get(stats_key(name, 'hits'), 0)
+        misses = cache.get(stats_key(name, 'misses'), 0)
+        result[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+        }
+    return result
+
+
+class ResponseCacheMixin:
+    """
+    Cache dữ liệu response của list / retrieve theo: view, action, phạm vi quyền, version của các model
+    liên quan và URL đầy đủ (gồm query params). Quyền truy cập vẫn được kiểm tra trước khi đọc cache:
+    has_permission trong initial, has_object_permission trên object (1 câu SQL) với các action chi tiết.
+    """
+    cache_actions = ('list', 'retrieve')
+    cache_models = ()
+    cache_timeout = CACHE_TIMEOUT
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        registry.update(f'{cls.__name__}.{action}' for action in cls.cache_actions)
+
+    def cache_scope(self, request):
+        # Các view trả dữ liệu khác nhau theo từng tài khoản thì override để thêm user id
+        return 'staff' if request.user.is_staff else 'resident'
+
+    def check_cached_object(self):
+        # Như get_object(): 404 nếu không thấy, has_object_permission; chỉ đọc chính object, bỏ prefetch
+        lookup = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        self.check_object_permissions(self.request,
+                                      get_object_or_404(queryset, **{self.lookup_field: self.kwargs[lookup]}))
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        # Gọi từ list / retrieve của view: return self.cached_response(super().list, request, ...)
+        if self.action not in self.cache_actions:
+            return handler(request, *args, **kwargs)
+
+        name = f'{type(self).__name__}.{self.action}'
+        url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+        key = f'chungcu:response:{name}:{self.cache_scope(request)}:{versions(self.cache_models)}:{url}'
+
+        cached = cache.get(key)
+        if cached is not None:
+            if (self.lookup_url_kwarg or self.lookup_field) in self.kwargs:
+                self.check_cached_object()
+            count(name, 'hits')
+            # Lưu kèm ETag / Last-Modified để vẫn trả 304 khi đọc từ cache
+            data, etag, last_modified = cached
+            return conditional.respond(request, etag, last_modified, lambda: Response(data))
+
+        count(name, 'misses')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, (response.data, response.get('ETag'), parse_http_date_safe(response.get('Last-Modified'))),
+                      self.cache_timeout)
+        return response
@@ -0,0 +1,89 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+def list_validators(queryset, related=()):
+    """
+    ETag / Last-Modified của 1 danh sách bằng 1 câu aggregate: max(update_time) và số bản ghi
+    (của danh sách và các quan hệ lồng trong serializer), không cần load hay serialize bản ghi nào.
+    """
+    aggregates = {'last': Max('update_time'), 'total': Count('pk', distinct=True)}
+    for i, name in enumerate(related):
+        aggregates[f'last_{i}'] = Max(f'{name}__update_time')
+        aggregates[f'total_{i}'] = Count(name, distinct=True)
+    return _validators(queryset.order_by().aggregate(**aggregates))
+
+
+def page_validators(page, related=()):
+    """
+    ETag / Last-Modified của 1 trang danh sách: id và update_time của các bản ghi trong trang (đã load sẵn),
+    các quan hệ lồng thì aggregate trên đúng các id đó. Không quét phần còn lại của bảng như list_validators.
+    """
+    values = {'pks': tuple(obj.pk for obj in page),
+              'last': max((obj.update_time for obj in page if getattr(obj, 'update_time', None)), default=None)}
+    if related and page:
+        model = type(page[0])
+        values.update(list_validators(model.objects.filter(pk__in=values['pks']), related)[2])
+        values.pop('total')
+    return _validators(values)
+
+
+def detail_validators(instance, related=()):
+    values = {'pk': instance.pk, 'last': instance.update_time}
+    if related:
+        values.update(list_validators(type(instance).objects.filter(pk=instance.pk), related)[2])
+    return _validators(values)
+
+
+def _validators(values):
+    timestamps = [value for name, value in values.items() if name.startswith('last') and value]
+    last_modified = int(max(timestamps).timestamp()) if timestamps else None
+    digest = hashlib.md5(repr(sorted(values.items())).encode()).hexdigest()
+    return f'W/"{digest}"', last_modified, values
+
+
+def respond(request, etag, last_modified, render):
+    """Trả về 304 nếu client đã có bản mới nhất (If-None-Match / If-Modified-Since), ngược lại gọi render()."""
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = render()
+    if response.status_code == 200:
+        if etag:
+            response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+class ConditionalListMixin:
+    # Các quan hệ lồng trong serializer, thay đổi của chúng cũng làm đổi ETag
+    conditional_related = ()
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            etag, last_modified, _ = list_validators(queryset, self.conditional_related)
+            render = super().list
+            return respond(request, etag, last_modified, lambda: render(request, *args, **kwargs))
+
+        # Trang đã được đọc để tính validator, 304 thì bỏ qua bước serialize
+        etag, last_modified, _ = page_validators(page, self.conditional_related)
+        return respond(request, etag, last_modified,
+                       lambda: self.get_paginated_response(self.get_serializer(page, many=True).data))
+
+
+class ConditionalRetrieveMixin:
+    conditional_related = ()
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.detail_response(self.get_object(), self.get_serializer_class(), self.conditional_related)
+
+    def detail_response(self, instance, serializer_class, related=()):
+        etag, last_modified, _ = detail_validators(instance, related)
+        return respond(self.request, etag, last_modified, lambda: Response(
+            serializer_class(instance, context=self.get_serializer_context()).data))
@@ -0,0 +1,22 @@
+from django.db.models import Q
+
+from chungcu.models import Resident, Visitor, fold
+
+
+def condition(query):
+    # Dãy số: tra theo đầu số điện thoại / CCCD, ngược lại theo đầu tên không dấu.
+    # istartswith (LIKE 'abc%') dùng được index; startswith trên MySQL là LIKE BINARY, không dùng được index
+    key = fold(query)
+    if key.isdigit():
+        return Q(phone__istartswith=key) | Q(identity_card__istartswith=key)
+    return Q(search_name__istartswith=key)
+
+
+def lookup(query, limit=10):
+    """Tra cứu nhanh cư dân và khách cho bảo vệ / lễ tân, mỗi loại 1 câu SQL chạy trên index."""
+    match = condition(query)
+    residents = Resident.objects.filter(match).select_related('apartment__building') \
+        .order_by('search_name', 'id')[:limit]
+    visitors = Visitor.objects.filter(match).select_related('resident__apartment') \
+        .order_by('search_name', 'id')[:limit]
+    return list(residents), list(visitors)
@@ -0,0 +1,79 @@
+import csv
+
+from django.http import StreamingHttpResponse
+
+# (tiêu đề cột, field dùng trong values_list)
+INVOICE_COLUMNS = [
+    ('id', 'id'),
+    ('building', 'apartment__building__name'),
+    ('apartment', 'apartment__number'),
+    ('resident', 'resident__name'),
+    ('fee_type', 'fee_type__name'),
+    ('period', 'period'),
+    ('amount', 'amount'),
+    ('due_date', 'due_date'),
+    ('paid', 'paid'),
+    ('create_time', 'create_time'),
+]
+
+PAYMENT_COLUMNS = [
+    ('id', 'id'),
+    ('invoice', 'invoice_id'),
+    ('building', 'invoice__apartment__building__name'),
+    ('apartment', 'invoice__apartment__number'),
+    ('resident', 'resident__name'),
+    ('fee_type', 'invoice__fee_type__name'),
+    ('amount', 'invoice__amount'),
+    ('method', 'method'),
+    ('status', 'status'),
+    ('create_time', 'create_time'),
+]
+
+RESIDENT_COLUMNS = [
+    ('id', 'id'),
+    ('name', 'name'),
+    ('identity_card', 'identity_card'),
+    ('gender', 'gender'),
+    ('birthday', 'birthday'),
+    ('phone', 'phone'),
+    ('relationship_to_head', 'relationship_to_head'),
+    ('building', 'apartment__building__name'),
+    ('apartment', 'apartment__number'),
+    ('active', 'active'),
+]
+
+
+class Echo:
+    # csv.writer ghi vào đây và nhận lại chuỗi vừa ghi, không giữ lại gì trong bộ nhớ
+    def write(self, value):
+        return value
+
+
+def iter_rows(queryset, fields, chunk_size=2000):
+    """
+    Đọc từng trang theo khoá chính (WHERE id > ... LIMIT chunk_size).
+    Không dùng .iterator() vì backend MySQL vẫn nạp toàn bộ kết quả vào bộ nhớ.
+    """
+    queryset = queryset.order_by('pk').values_list('pk', *fields)
+    last_pk = None
+    while True:
+        chunk = list((queryset.filter(pk__gt=last_pk) if last_pk is not None else queryset)[:chunk_size])
+        if not chunk:
+            return
+        for row in chunk:
+            yield row[1:]
+        last_pk = chunk[-1][0]
+
+
+def stream_csv(queryset, columns, chunk_size=2000):
+    writer = csv.writer(Echo())
+    yield '\ufeff'  # BOM để Excel đọc đúng tiếng Việt
+    yield writer.writerow([header for header, _ in columns])
+    for row in iter_rows(queryset, [field for _, field in columns], chunk_size):
+        yield writer.writerow(row)
+
+
+def csv_response(queryset, columns, filename, chunk_size=2000):
+    response = StreamingHttpResponse(stream_csv(queryset, columns, chunk_size), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.db import transaction
+from django.db.models import F
+
+from chungcu.models import Generation, ParkingCard, plate_key
+
+CACHE_SIZE = 10000
+# Các process khác (worker gunicorn) thấy thay đổi thẻ chậm nhất sau SYNC_INTERVAL giây
+SYNC_INTERVAL = 1.0
+# Chốt chặn cuối: kết quả cũ hơn ENTRY_TTL giây bị đọc lại từ DB kể cả khi không nhận được generation mới
+ENTRY_TTL = 30.0
+GENERATION = 'gate'
+
+
+def read_generation():
+    return Generation.objects.filter(name=GENERATION).values_list('value', flat=True).first()
+
+
+def bump_generation():
+    if not Generation.objects.filter(name=GENERATION).update(value=F('value') + 1):
+        Generation.objects.get_or_create(name=GENERATION)
+
+
+class PlateCache:
+    """
+    LRU trong bộ nhớ của process: biển số đã chuẩn hoá -> kết quả kiểm tra (kể cả biển số không có thẻ).
+    Mỗi lần thẻ / cư dân / khách thay đổi, signals.py tăng generation dùng chung lưu trong DB (bảng Generation),
+    các process đọc generation tối đa 1 lần mỗi SYNC_INTERVAL giây và xoá LRU nếu đã cũ.
+    """
+
+    def __init__(self, size=CACHE_SIZE, sync_interval=SYNC_INTERVAL, ttl=ENTRY_TTL):
+        self.size = size
+        self.sync_interval = sync_interval
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.generation = None
+        self.synced_at = None
+        self.epoch = 0  # tăng mỗi lần xoá, để không ghi lại kết quả đọc từ DB trước khi xoá
+        self.hits = self.misses = 0
+
+    def sync(self):
+        now = time.monotonic()
+        if self.synced_at is not None and now - self.synced_at < self.sync_interval:
+            return
+        generation = read_generation()
+        with self.lock:
+            if generation != self.generation:
+                self.entries.clear()
+                self.epoch += 1
+                self.generation = generation
+            self.synced_at = now
+
+    def get(self, key):
+        self.sync()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.entries.pop(key, None)
+            self.misses += 1
+            return None
+
+    def put(self, key, value, epoch):
+        with self.lock:
+            if epoch != self.epoch:
+                return
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.epoch += 1
+
+    def bump(self):
+        """
+        Xoá LRU của process này ngay, và tăng generation dùng chung sau khi transaction commit
+        (các process khác không đọc lại dữ liệu chưa commit; câu UPDATE không giữ khoá suốt transaction).
+        """
+        transaction.on_commit(bump_generation)
+        self.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else None}
+
+
+plates = PlateCache()
+
+
+def invalidate():
+    """Làm mất hiệu lực kết quả kiểm tra ở mọi process (gọi thêm sau update()/bulk_create vì không có signal)."""
+    plates.bump()
+
+
+def lookup(key):
+    """Kiểm tra trong DB theo cột plate_key có index, ưu tiên thẻ đang được phép vào."""
+    result = {'plate': key, 'allowed': False, 'holder': None, 'card_number': None, 'vehicle_type': None,
+              'resident': None, 'visitor': None, 'apartment': None}
+    cards = ParkingCard.objects.filter(plate_key=key).order_by('id').values(
+        'card_number', 'vehicle_type', 'resident_id', 'resident__active', 'resident__apartment_id',
+        'visitor_id', 'visitor__active', 'visitor__is_approved', 'visitor__resident__apartment_id')
+    for card in cards:
+        if card['resident_id']:
+            allowed = card['resident__active']
+            holder, apartment = 'resident', card['resident__apartment_id']
+        else:
+            allowed = card['visitor__active'] and card['visitor__is_approved']
+            holder, apartment = 'visitor', card['visitor__resident__apartment_id']
+
+        if result['holder'] is None or (allowed and not result['allowed']):
+            result.update(allowed=bool(allowed), holder=holder, card_number=card['card_number'],
+                          vehicle_type=card['vehicle_type'], resident=card['resident_id'],
+                          visitor=card['visitor_id'], apartment=apartment)
+    return result
+
+
+def check(license_plate):
+    key = plate_key(license_plate)
+    result = plates.get(key)
+    if result is None:
+        epoch = plates.epoch
+        result = lookup(key)
+        plates.put(key, result, epoch)
+    return result
@@ -0,0 +1,56 @@
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, OuterRef, Subquery, Value, When
+
+from chungcu import caching
+from chungcu.models import Apartment, Resident
+
+
+def sync_household_heads(apartment_ids=None):
+    """
+    Gán lại Apartment.household_head theo cư dân có quan hệ 'owner' bằng 1 câu UPDATE.
+    Dùng sau khi nạp cư dân bằng bulk_create (không chạy Resident.save).
+    """
+    owner = Resident.objects.filter(apartment=OuterRef('pk'), relationship_to_head='owner') \
+        .order_by('id').values('id')[:1]
+
+    apartments = Apartment.objects.all()
+    if apartment_ids is not None:
+        apartments = apartments.filter(id__in=apartment_ids)
+    updated = apartments.update(household_head=Subquery(owner))
+    caching.bump(Apartment)
+    return updated
+
+
+def reassign_household_heads(heads, previous_relationship='other'):
+    """
+    Đổi chủ hộ nhiều căn hộ trong 1 transaction: heads là dict apartment_id -> resident_id (cư dân của căn hộ đó).
+    Chủ hộ cũ chuyển thành previous_relationship. Số câu SQL cố định, không phụ thuộc số căn hộ.
+    """
+    if not heads:
+        return {'apartments': 0, 'demoted': 0, 'promoted': 0}
+
+    with transaction.atomic():
+        # Khoá các căn hộ theo thứ tự id (tránh deadlock), cùng khoá với Resident.save khi thêm chủ hộ
+        found = set(Apartment.objects.select_for_update().filter(id__in=heads).order_by('id')
+                    .values_list('id', flat=True))
+        members = dict(Resident.objects.filter(id__in=heads.values()).values_list('id', 'apartment_id'))
+        errors = {apartment_id: 'Căn hộ không tồn tại.' if apartment_id not in found else
+                  'Cư dân không thuộc căn hộ này.'
+                  for apartment_id, resident_id in heads.items()
+                  if apartment_id not in found or members.get(resident_id) != apartment_id}
+        if errors:
+            raise ValidationError(errors)
+
+        # Hạ chủ hộ cũ trước để ràng buộc resident_single_owner không bị vi phạm giữa chừng
+        demoted = Resident.objects.filter(apartment_id__in=heads, relationship_to_head='owner') \
+            .exclude(id__in=heads.values()).update(relationship_to_head=previous_relationship)
+        promoted = Resident.objects.filter(id__in=heads.values()).exclude(relationship_to_head='owner') \
+            .update(relationship_to_head='owner')
+        # household_head là OneToOne: bỏ trước rồi mới gán, kể cả liên kết cũ của người mới lên chủ hộ ở căn hộ khác
+        Apartment.objects.filter(household_head__in=heads.values()).update(household_head=None)
+        Apartment.objects.filter(id__in=heads).update(household_head=Case(
+            *[When(id=apartment_id, then=Value(resident_id)) for apartment_id, resident_id in heads.items()]))
+
+    caching.bump(Apartment)
+    return {'apartments': len(heads), 'demoted': demoted, 'promoted': promoted}
@@ -0,0 +1,37 @@
+from collections import namedtuple
+
+from django.core.cache import cache
+
+from chungcu.models import Resident
+
+# Thông tin cư dân của 1 tài khoản, dùng cho kiểm tra quyền mà không cần load các object liên quan
+Identity = namedtuple('Identity', ['resident_id', 'apartment_id', 'building_id'])
+
+EMPTY = Identity(None, None, None)
+# Cache mặc định nằm trong bộ nhớ từng process: signals.py chỉ xoá được ở process xử lý thay đổi,
+# các process khác thấy cư dân đổi căn hộ / bỏ liên kết tài khoản chậm nhất sau CACHE_TIMEOUT giây
+CACHE_TIMEOUT = 10
+
+
+def cache_key(user_id):
+    return f'chungcu:identity:{user_id}'
+
+
+def resolve(user):
+    if not user or not user.is_authenticated:
+        return EMPTY
+
+    key = cache_key(user.pk)
+    value = cache.get(key)
+    if value is None:
+        value = Resident.objects.filter(user_id=user.pk) \
+            .values_list('id', 'apartment_id', 'apartment__building_id').first() or tuple(EMPTY)
+        cache.set(key, value, CACHE_TIMEOUT)
+
+    return Identity(*value)
+
+
+def invalidate(*user_ids):
+    keys = [cache_key(user_id) for user_id in user_ids if user_id]
+    if keys:
+        cache.delete_many(keys)
@@ -0,0 +1,145 @@
+import csv
+import time
+
+from django.db import transaction
+
+from chungcu import caching, households
+from chungcu.models import Apartment, Building, Resident
+from chungcu.serializers import ApartmentImportRowSerializer, ResidentImportRowSerializer
+
+LOOKUP_CHUNK = 1000  # số giá trị tối đa trong 1 câu IN (...)
+
+
+def import_apartments(lines, batch_size=1000, dry_run=False):
+    """
+    Nhập căn hộ từ CSV (building_id, number, floor, price, area).
+    Kiểm tra toàn bộ file trước, có lỗi thì không ghi dòng nào.
+    """
+    started = time.monotonic()
+    rows, errors = _parse(lines, ApartmentImportRowSerializer)
+    total = len(rows) + len(errors)
+
+    building_ids = {data['building_id'] for _, data in rows}
+    existing_buildings = set(Building.objects.filter(id__in=building_ids).values_list('id', flat=True))
+    existing = _existing_apartments({(data['building_id'], data['number']) for _, data in rows})
+
+    seen = {}
+    for line, data in rows:
+        key = (data['building_id'], data['number'])
+        if data['building_id'] not in existing_buildings:
+            errors.append(_error(line, 'building_id', 'Chung cư không tồn tại.'))
+        elif key in existing:
+            errors.append(_error(line, 'number', 'Căn hộ đã tồn tại trong chung cư này.'))
+        elif key in seen:
+            errors.append(_error(line, 'number', f'Trùng với dòng {seen[key]}.'))
+        seen.setdefault(key, line)
+
+    apartments = [Apartment(**data) for _, data in rows]
+    return _finish(Apartment, apartments, total, errors, batch_size, dry_run, started,
+                   lambda: caching.bump(Apartment))
+
+
+def import_residents(lines, batch_size=1000, dry_run=False):
+    """
+    Nhập cư dân từ CSV (building_id, apartment_number, name, identity_card, gender, birthday, phone,
+    relationship_to_head). Căn hộ phải có sẵn; chủ hộ được gán cho căn hộ bằng 1 câu UPDATE sau khi ghi.
+    """
+    started = time.monotonic()
+    rows, errors = _parse(lines, ResidentImportRowSerializer)
+    total = len(rows) + len(errors)
+
+    apartments = _existing_apartments({(data['building_id'], data['apartment_number']) for _, data in rows})
+    cards = {data['identity_card'] for _, data in rows}
+    existing_cards = set()
+    for chunk in _chunks(list(cards)):
+        existing_cards.update(Resident.objects.filter(identity_card__in=chunk).values_list('identity_card', flat=True))
+    owned = set()
+    for chunk in _chunks(list(apartments.values())):
+        owned.update(Resident.objects.filter(apartment_id__in=chunk, relationship_to_head='owner')
+                     .values_list('apartment_id', flat=True))
+
+    residents, owner_apartments, seen_cards, seen_owners = [], set(), {}, {}
+    for line, data in rows:
+        apartment_id = apartments.get((data['building_id'], data['apartment_number']))
+        card = data['identity_card']
+        if apartment_id is None:
+            errors.append(_error(line, 'apartment_number', 'Căn hộ không tồn tại.'))
+        elif card in existing_cards:
+            errors.append(_error(line, 'identity_card', 'CCCD đã tồn tại.'))
+        elif card in seen_cards:
+            errors.append(_error(line, 'identity_card', f'Trùng với dòng {seen_cards[card]}.'))
+        elif data['relationship_to_head'] == 'owner' and apartment_id in owned:
+            errors.append(_error(line, 'relationship_to_head', 'Căn hộ này đã có chủ hộ.'))
+        elif data['relationship_to_head'] == 'owner' and apartment_id in seen_owners:
+            errors.append(_error(line, 'relationship_to_head', f'Chủ hộ đã khai ở dòng {seen_owners[apartment_id]}.'))
+        else:
+            if data['relationship_to_head'] == 'owner':
+                owner_apartments.add(apartment_id)
+                seen_owners[apartment_id] = line
+            data.pop('building_id')
+            data.pop('apartment_number')
+            residents.append(Resident(apartment_id=apartment_id, **data))
+        seen_cards.setdefault(card, line)
+
+    def after_insert():
+        households.sync_household_heads(owner_apartments)
+
+    return _finish(Resident, residents, total, errors, batch_size, dry_run, started, after_insert)
+
+
+def _parse(lines, row_serializer):
+    """Đọc từng dòng CSV (không nạp cả file), trả về các dòng hợp lệ (số dòng, dữ liệu) và lỗi định dạng."""
+    reader = csv.DictReader(lines)
+    expected = list(row_serializer().fields)
+    missing = [name for name in expected if name not in (reader.fieldnames or [])]
+    if missing:
+        return [], [{'line': 1, 'errors': {'header': [f"Thiếu cột: {', '.join(missing)}"]}}]
+
+    rows, errors = [], []
+    for line, raw in enumerate(reader, start=2):
+        serializer = row_serializer(data={name: (raw.get(name) or '').strip() for name in expected})
+        if serializer.is_valid():
+            rows.append((line, dict(serializer.validated_data)))
+        else:
+            errors.append({'line': line, 'errors': serializer.errors})
+    return rows, errors
+
+
+def _existing_apartments(keys):
+    """(building_id, number) -> apartment_id của các căn hộ đã có trong DB."""
+    found = {}
+    for building_id in {building_id for building_id, _ in keys}:
+        numbers = [number for b, number in keys if b == building_id]
+        for chunk in _chunks(numbers):
+            found.update({(building_id, number): apartment_id for apartment_id, number in
+                          Apartment.objects.filter(building_id=building_id, number__in=chunk)
+                          .values_list('id', 'number')})
+    return found
+
+
+def _chunks(values, size=LOOKUP_CHUNK):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _error(line, field, message):
+    return {'line': line, 'errors': {field: [message]}}
+
+
+def _finish(model, objects, total, errors, batch_size, dry_run, started, after_insert=None):
+    errors.sort(key=lambda error: error['line'])
+    created = 0
+    if not errors and not dry_run:
+        with transaction.atomic():
+            for i in range(0, len(objects), batch_size):
+                model.objects.bulk_create(objects[i:i + batch_size])
+            if after_insert:
+                after_insert()
+        created = len(objects)
+
+    return {
+        'rows': total,
+        'created': created,
+        'errors': errors,
+        'elapsed': round(time.monotonic() - started, 3),
+    }
@@ -0,0 +1,202 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, Min, OuterRef, Q, Subquery, Sum, Value, When
+from django.utils import timezone
+
+from chungcu.models import Balance, Invoice, LedgerEntry
+
+OWNER_FIELDS = ('apartment_id', 'resident_id')
+# Các cột của hoá đơn ảnh hưởng tới công nợ
+INVOICE_FIELDS = ('id', 'apartment_id', 'resident_id', 'amount', 'due_date', 'paid')
+
+
+def post_charges(invoices):
+    """Ghi nợ cho các hoá đơn mới tạo (Invoice hoặc dict có id, apartment_id, resident_id, amount, due_date)."""
+    _post(invoices, 'charge', 1)
+
+
+def post_payments(invoices):
+    """Ghi có cho các hoá đơn vừa được đánh dấu đã thanh toán."""
+    _post(invoices, 'payment', -1)
+
+
+def post_reversals(invoices):
+    """Ghi nợ lại cho các hoá đơn bị huỷ thanh toán."""
+    _post(invoices, 'reversal', 1)
+
+
+def save_invoice(invoice):
+    """
+    Lưu 1 hoá đơn (thêm mới hoặc sửa qua API / admin) và ghi công nợ tương ứng trong cùng transaction.
+    Chỉ đổi paid: ghi thanh toán / huỷ thanh toán; đổi số tiền, hạn hoặc người nợ: huỷ bút toán cũ, ghi lại mới.
+    """
+    with transaction.atomic():
+        old = None
+        if invoice.pk:
+            old = Invoice.objects.select_for_update().filter(pk=invoice.pk).values(*INVOICE_FIELDS).first()
+        invoice.save()
+        new = {field: _get(invoice, field) for field in INVOICE_FIELDS}
+
+        if old is None:
+            post_charges([new])
+            if new['paid']:
+                post_payments([new])
+        elif any(old[field] != new[field] for field in INVOICE_FIELDS if field != 'paid'):
+            _void([old])
+            post_charges([new])
+            if new['paid']:
+                post_payments([new])
+        elif old['paid'] != new['paid']:
+            (post_payments if new['paid'] else post_reversals)([new])
+    return invoice
+
+
+def delete_invoices(invoices):
+    """Xoá các hoá đơn (queryset) và trừ phần còn nợ của chúng khỏi Balance. Bút toán bị xoá theo hoá đơn."""
+    with transaction.atomic():
+        rows = list(invoices.select_for_update().values(*INVOICE_FIELDS))
+        Invoice.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        _void(rows, record=False)
+    return len(rows)
+
+
+def _void(invoices, record=True):
+    # Hoá đơn đã trả thì bút toán phát sinh và thanh toán đã triệt tiêu nhau, chỉ huỷ phần còn nợ
+    _post([invoice for invoice in invoices if not _get(invoice, 'paid')], 'adjustment', -1, record)
+
+
+def _post(invoices, kind, sign, record=True):
+    entries = [LedgerEntry(invoice_id=_get(inv, 'id'), apartment_id=_get(inv, 'apartment_id'),
+                           resident_id=_get(inv, 'resident_id'), kind=kind,
+                           amount=sign * Decimal(_get(inv, 'amount')), due_date=_get(inv, 'due_date'))
+               for inv in invoices]
+    if not entries:
+        return
+
+    with transaction.atomic():
+        # record=False: hoá đơn đã bị xoá nên không ghi bút toán được, chỉ cập nhật Balance
+        if record:
+            LedgerEntry.objects.bulk_create(entries, batch_size=1000)
+        for field in OWNER_FIELDS:
+            _apply(entries, field, refresh_oldest=sign < 0 or kind == 'reversal')
+
+
+def _get(invoice, name):
+    return invoice[name] if isinstance(invoice, dict) else getattr(invoice, name)
+
+
+def _apply(entries, field, refresh_oldest):
+    totals = defaultdict(Decimal)
+    oldest = {}
+    for entry in entries:
+        owner_id = getattr(entry, field)
+        totals[owner_id] += entry.amount
+        oldest[owner_id] = min(oldest.get(owner_id, entry.due_date), entry.due_date)
+
+    Balance.objects.bulk_create([Balance(**{field: owner_id}) for owner_id in totals], ignore_conflicts=True)
+
+    # Gom các chủ nợ có cùng số tiền thay đổi để cập nhật bằng ít câu UPDATE nhất
+    groups = defaultdict(list)
+    for owner_id, total in totals.items():
+        groups[(total, None if refresh_oldest else oldest[owner_id])].append(owner_id)
+
+    for (total, due_date), owner_ids in groups.items():
+        changes = {'outstanding': F('outstanding') + total}
+        if due_date is not None:
+            changes['oldest_due_date'] = Case(
+                When(Q(oldest_due_date__isnull=True) | Q(oldest_due_date__gt=due_date), then=Value(due_date)),
+                default=F('oldest_due_date'))
+        Balance.objects.filter(**{f'{field}__in': owner_ids}).update(**changes)
+
+    if refresh_oldest:
+        unpaid = Invoice.objects.filter(**{field: OuterRef(field), 'paid': False}).order_by('due_date')
+        Balance.objects.filter(**{f'{field}__in': list(totals)}) \
+            .update(oldest_due_date=Subquery(unpaid.values('due_date')[:1]))
+
+
+def summary(**owner):
+    """Công nợ của 1 căn hộ (apartment_id=...) hoặc 1 cư dân (resident_id=...) đọc từ Balance, không cộng lại lịch sử."""
+    balance = Balance.objects.filter(**owner).values('outstanding', 'oldest_due_date').first() \
+        or {'outstanding': Decimal(0), 'oldest_due_date': None}
+
+    # Quá hạn chỉ tính trên các hoá đơn còn nợ (index (apartment|resident, paid)), không phụ thuộc lịch sử đã trả
+    overdue = Decimal(0)
+    today = timezone.localdate()
+    if balance['oldest_due_date'] and balance['oldest_due_date'] < today:
+        overdue = Invoice.objects.filter(**owner, paid=False, due_date__lt=today) \
+            .aggregate(total=Sum('amount'))['total'] or Decimal(0)
+
+    return {
+        'outstanding': balance['outstanding'],
+        'overdue': overdue,
+        'oldest_due_date': balance['oldest_due_date'],
+    }
+
+
+def reconcile(fix=True, chunk_size=2000):
+    """
+    Tính lại công nợ từ bảng Invoice, trả về danh sách chênh lệch so với bảng Balance.
+    fix=True: ghi lại Balance và dựng lại toàn bộ LedgerEntry.
+    """
+    drift = []
+    for field in OWNER_FIELDS:
+        expected = {row[field]: (row['total'], row['oldest']) for row in _unpaid_totals(field)}
+        actual = {row[0]: (row[1], row[2])
+                  for row in Balance.objects.filter(**{f'{field}__isnull': False})
+                  .values_list(field, 'outstanding', 'oldest_due_date')}
+
+        for owner_id in expected.keys() | actual.keys():
+            want = expected.get(owner_id, (Decimal(0), None))
+            have = actual.get(owner_id, (Decimal(0), None))
+            if want != have:
+                drift.append({'owner': field[:-3], 'id': owner_id,
+                              'expected': want[0], 'actual': have[0],
+                              'expected_oldest_due_date': want[1], 'actual_oldest_due_date': have[1]})
+
+    if fix:
+        with transaction.atomic():
+            _rebuild(drift, chunk_size)
+
+    return drift
+
+
+def rebuild(chunk_size=2000):
+    """Xoá và dựng lại toàn bộ Balance, LedgerEntry từ bảng Invoice (dùng sau khi nạp dữ liệu hàng loạt)."""
+    with transaction.atomic():
+        Balance.objects.all().delete()
+        for field in OWNER_FIELDS:
+            Balance.objects.bulk_create([Balance(**{field: row[field]}, outstanding=row['total'],
+                                                 oldest_due_date=row['oldest'])
+                                         for row in _unpaid_totals(field)], batch_size=chunk_size)
+        _rebuild_entries(chunk_size)
+
+
+def _unpaid_totals(field):
+    return Invoice.objects.filter(paid=False).values(field) \
+        .annotate(total=Sum('amount'), oldest=Min('due_date')).order_by()
+
+
+def _rebuild(drift, chunk_size):
+    for row in drift:
+        field = row['owner'] + '_id'
+        Balance.objects.update_or_create(**{field: row['id']}, defaults={
+            'outstanding': row['expected'], 'oldest_due_date': row['expected_oldest_due_date']})
+    _rebuild_entries(chunk_size)
+
+
+def _rebuild_entries(chunk_size):
+    LedgerEntry.objects.all().delete()
+    batch = []
+    for invoice in Invoice.objects.values('id', 'apartment_id', 'resident_id', 'amount', 'due_date', 'paid') \
+            .order_by('id').iterator(chunk_size=chunk_size):
+        common = {'invoice_id': invoice['id'], 'apartment_id': invoice['apartment_id'],
+                  'resident_id': invoice['resident_id'], 'due_date': invoice['due_date']}
+        batch.append(LedgerEntry(kind='charge', amount=invoice['amount'], **common))
+        if invoice['paid']:
+            batch.append(LedgerEntry(kind='payment', amount=-invoice['amount'], **common))
+        if len(batch) >= chunk_size:
+            LedgerEntry.objects.bulk_create(batch)
+            batch = []
+    LedgerEntry.objects.bulk_create(batch)
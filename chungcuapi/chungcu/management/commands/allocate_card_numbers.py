@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chungcu import visitors
+from chungcu.models import CardNumber
+
+
+class Command(BaseCommand):
+    help = 'Thêm số thẻ xe in sẵn vào kho để cấp khi duyệt người thân hàng loạt'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='K', help='Tiền tố số thẻ, ví dụ K -> K000001')
+        parser.add_argument('--count', type=int, required=True)
+        parser.add_argument('--width', type=int, default=6, help='Số chữ số sau tiền tố')
+
+    def handle(self, *args, **options):
+        if options['count'] <= 0:
+            raise CommandError('--count phải lớn hơn 0')
+        try:
+            created = visitors.allocate_card_numbers(options['prefix'], options['count'], options['width'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        available = CardNumber.objects.filter(issued=False).count()
+        self.stdout.write(self.style.SUCCESS(f'Đã thêm {created} số thẻ, kho còn {available} số chưa cấp'))
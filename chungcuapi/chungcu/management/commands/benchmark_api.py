@@ -0,0 +1,48 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from chungcu import benchmark, seeding
+from chungcu.models import User
+
+
+class Command(BaseCommand):
+    help = 'Đo độ trễ và số câu SQL của các endpoint trên 1 database test sinh dữ liệu lớn'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=10, help='Hệ số dữ liệu sinh ra, xem seed_chungcu')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--keepdb', action='store_true', help='Giữ lại database test để chạy lần sau')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        # Luôn chạy trên database test, không đụng tới dữ liệu thật
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            if User.objects.filter(username='bench_admin').exists():
+                probe = benchmark.load_probe()
+            else:
+                self.stdout.write('Đang sinh dữ liệu...')
+                seeding.seed(scale=options['scale'], seed=options['seed'])
+                probe = benchmark.seed_probe()
+
+            results = benchmark.run(probe, repeat=options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+        for name, r in results.items():
+            self.stdout.write(f"{name:28} {r['status']} {r['queries']:>3}/{r['budget']} queries  "
+                              f"p50 {r['p50_ms']:>8}ms  p95 {r['p95_ms']:>8}ms  p99 {r['p99_ms']:>8}ms")
+
+        failed = benchmark.regressions(results)
+        if failed:
+            raise CommandError(f"Vượt ngân sách truy vấn hoặc lỗi: {', '.join(failed)}")
+        self.stdout.write(self.style.SUCCESS(f"Đã ghi kết quả vào {options['output']}"))
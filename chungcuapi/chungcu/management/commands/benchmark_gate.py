@@ -0,0 +1,48 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from chungcu import benchmark, seeding
+from chungcu.models import ParkingCard, User
+
+
+class Command(BaseCommand):
+    help = 'Đo độ trễ p50/p95/p99 của gate-check khi nhiều cổng gọi đồng thời, trên 1 database test'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=10, help='Hệ số dữ liệu sinh ra, xem seed_chungcu')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--plates', type=int, default=500, help='Số biển số khác nhau được hỏi')
+        parser.add_argument('--max-p99', type=float, help='Báo lỗi nếu p99 (ms) vượt ngưỡng này')
+        parser.add_argument('--output', default='benchmark_gate.json')
+        parser.add_argument('--keepdb', action='store_true', help='Giữ lại database test để chạy lần sau')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            if not ParkingCard.objects.exists():
+                self.stdout.write('Đang sinh dữ liệu...')
+                seeding.seed(scale=options['scale'], seed=options['seed'])
+            admin, _ = User.objects.get_or_create(username='bench_gate', defaults={'is_staff': True})
+
+            plates = benchmark.gate_plates(options['plates'], seed=options['seed'])
+            result = benchmark.run_gate(admin, plates, threads=options['threads'], requests=options['requests'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+        self.stdout.write(f"{result['requests']} lượt / {result['threads']} luồng, {result['throughput_rps']} req/s  "
+                          f"p50 {result['p50_ms']}ms  p95 {result['p95_ms']}ms  p99 {result['p99_ms']}ms  "
+                          f"trúng LRU {result['cache']['hit_rate']}")
+
+        if options['max_p99'] is not None and result['p99_ms'] > options['max_p99']:
+            raise CommandError(f"p99 {result['p99_ms']}ms vượt ngưỡng {options['max_p99']}ms")
+        self.stdout.write(self.style.SUCCESS(f"Đã ghi kết quả vào {options['output']}"))
@@ -0,0 +1,52 @@
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chungcu import billing
+from chungcu.models import FeeType
+
+
+def parse_date(value, formats):
+    for fmt in formats:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise CommandError(f"Ngày không hợp lệ: {value}")
+
+
+class Command(BaseCommand):
+    help = 'Tạo hoá đơn hàng loạt cho 1 loại phí trong 1 kỳ thu phí'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fee-type', type=int, required=True)
+        parser.add_argument('--period', required=True, help='YYYY-MM')
+        parser.add_argument('--amount', required=True)
+        parser.add_argument('--due-date', required=True, help='YYYY-MM-DD')
+        parser.add_argument('--building', type=int, action='append', dest='buildings',
+                            help='Có thể truyền nhiều lần; bỏ trống = tất cả chung cư')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            fee_type = FeeType.objects.get(pk=options['fee_type'])
+        except FeeType.DoesNotExist:
+            raise CommandError(f"Không tìm thấy loại phí {options['fee_type']}")
+
+        try:
+            amount = Decimal(options['amount'])
+        except InvalidOperation:
+            raise CommandError(f"Số tiền không hợp lệ: {options['amount']}")
+
+        result = billing.generate_invoices(fee_type=fee_type,
+                                           period=parse_date(options['period'], ['%Y-%m', '%Y-%m-%d']),
+                                           amount=amount,
+                                           due_date=parse_date(options['due_date'], ['%Y-%m-%d']),
+                                           building_ids=options['buildings'],
+                                           batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã tạo {result['created']} hoá đơn trong {result['elapsed']}s "
+            f"({result['rows_per_second']} rows/s), bỏ qua {result['skipped']} đã có, "
+            f"{result['without_head']} căn hộ chưa có chủ hộ"))
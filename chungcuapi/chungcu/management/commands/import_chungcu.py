@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chungcu import imports
+
+IMPORTERS = {
+    'apartments': imports.import_apartments,
+    'residents': imports.import_residents,
+}
+
+
+class Command(BaseCommand):
+    help = 'Nhập căn hộ hoặc cư dân hàng loạt từ file CSV (UTF-8, dòng đầu là tên cột)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(IMPORTERS))
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Chỉ kiểm tra file, không ghi')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as f:
+                result = IMPORTERS[options['kind']](f, batch_size=options['batch_size'], dry_run=options['dry_run'])
+        except (OSError, UnicodeDecodeError) as e:
+            raise CommandError(f"Không đọc được file {options['path']}: {e}")
+
+        for error in result['errors']:
+            for field, messages in error['errors'].items():
+                self.stderr.write(f"Dòng {error['line']} - {field}: {' '.join(str(m) for m in messages)}")
+
+        if result['errors']:
+            raise CommandError(f"{len(result['errors'])}/{result['rows']} dòng lỗi, chưa ghi dòng nào")
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"File hợp lệ ({result['rows']} dòng)"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Đã nhập {result['created']} {options['kind']} "
+                                                 f"trong {result['elapsed']}s"))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chungcu import media
+
+
+class Command(BaseCommand):
+    help = 'Worker đẩy các ảnh đang chờ (ảnh đại diện, ảnh chứng từ thanh toán) lên storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20)
+        parser.add_argument('--sleep', type=float, default=2, help='Số giây chờ khi hàng đợi trống')
+        parser.add_argument('--once', action='store_true', help='Chỉ xử lý 1 lượt rồi thoát')
+
+    def handle(self, *args, **options):
+        while True:
+            result = media.process_pending(batch_size=options['batch_size'])
+            if any(result.values()):
+                self.stdout.write(f"Đã tải lên {result['ready']}, thử lại {result['retry']}, lỗi {result['failed']}")
+
+            if options['once']:
+                break
+            if not any(result.values()):
+                time.sleep(options['sleep'])
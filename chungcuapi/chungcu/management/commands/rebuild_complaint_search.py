@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from chungcu import search
+
+
+class Command(BaseCommand):
+    help = 'Dựng lại index tìm kiếm toàn văn của phản ánh (sau khi nhập dữ liệu bằng SQL / bulk_create)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        total = search.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Đã đánh index {total} phản ánh'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from chungcu import surveys
+from chungcu.models import Survey
+
+
+class Command(BaseCommand):
+    help = 'Đếm lại bảng kết quả khảo sát từ các phiếu trả lời'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--survey', type=int, action='append', dest='surveys',
+                            help='Có thể truyền nhiều lần; bỏ trống = tất cả khảo sát')
+
+    def handle(self, *args, **options):
+        queryset = Survey.objects.all()
+        if options['surveys']:
+            queryset = queryset.filter(pk__in=options['surveys'])
+
+        for survey in queryset:
+            surveys.rebuild_tallies(survey)
+            self.stdout.write(f"Đã đếm lại khảo sát {survey.id} - {survey.title}")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from chungcu import ledger
+
+
+class Command(BaseCommand):
+    help = 'Đối soát công nợ căn hộ / cư dân với bảng hoá đơn và dựng lại sổ công nợ'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Chỉ báo cáo chênh lệch, không ghi lại')
+
+    def handle(self, *args, **options):
+        drift = ledger.reconcile(fix=not options['dry_run'])
+
+        for row in drift:
+            self.stdout.write(f"{row['owner']} {row['id']}: sổ ghi {row['actual']} "
+                              f"(hạn cũ nhất {row['actual_oldest_due_date']}), "
+                              f"thực tế {row['expected']} (hạn cũ nhất {row['expected_oldest_due_date']})")
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Không có chênh lệch'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{len(drift)} chênh lệch'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Đã sửa {len(drift)} chênh lệch và dựng lại sổ công nợ'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chungcu import seeding
+
+
+class Command(BaseCommand):
+    help = 'Sinh dữ liệu giả (chung cư, căn hộ, cư dân, hoá đơn, khảo sát...) bằng bulk_create để kiểm thử tải'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1,
+                            help=f"Hệ số nhân số bản ghi, scale=1: {seeding.BASE['apartments']} căn hộ, "
+                                 f"{seeding.BASE['residents']} cư dân; scale=1 khoảng 120 nghìn dòng, scale=8 khoảng 1 triệu dòng")
+        parser.add_argument('--seed', type=int, default=0, help='Seed ngẫu nhiên, cùng seed sinh cùng dữ liệu')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options['scale'] <= 0:
+            raise CommandError('--scale phải lớn hơn 0')
+
+        result = seeding.seed(scale=options['scale'], seed=options['seed'], batch_size=options['batch_size'],
+                              log=self.stdout.write)
+
+        total = sum(rows for name, rows in result.items() if name not in ('elapsed', 'household_heads'))
+        self.stdout.write(self.style.SUCCESS(f"Đã sinh {total} dòng trong {result['elapsed']}s"))
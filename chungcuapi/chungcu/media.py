@@ -0,0 +1,138 @@
+import os
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from chungcu.models import MediaUpload
+
+MAX_ATTEMPTS = 3
+STALE_AFTER = timedelta(minutes=10)  # bản ghi 'uploading' quá lâu (worker chết giữa chừng) được đưa lại hàng đợi
+
+
+class LocalBackend:
+    """Lưu file vào MEDIA_ROOT/uploads, dùng khi test hoặc chạy không có mạng."""
+
+    def __init__(self):
+        self.storage = FileSystemStorage()
+
+    def upload(self, path, upload):
+        """Trả về (url, giá trị ghi vào trường ảnh của model hoặc None nếu không ghi)."""
+        with open(path, 'rb') as f:
+            name = self.storage.save(f'uploads/{upload.field}/{os.path.basename(path)}', File(f))
+        return self.storage.url(name), None
+
+
+class CloudinaryBackend:
+    def upload(self, path, upload):
+        from cloudinary import uploader
+
+        resource = uploader.upload_resource(path, type='upload', resource_type='image')
+        return resource.url, resource.get_prep_value()
+
+
+def get_backend():
+    return import_string(settings.MEDIA_UPLOAD_BACKEND)()
+
+
+def spool(instance, field, uploaded_file):
+    """Ghi file tải lên ra đĩa và xếp hàng chờ worker, không gọi storage trong request."""
+    os.makedirs(settings.MEDIA_SPOOL_ROOT, exist_ok=True)
+    path = os.path.join(settings.MEDIA_SPOOL_ROOT,
+                        uuid.uuid4().hex + os.path.splitext(uploaded_file.name)[1].lower())
+    with open(path, 'wb') as f:
+        for chunk in uploaded_file.chunks():
+            f.write(chunk)
+
+    return MediaUpload.objects.create(target=instance, field=field, name=uploaded_file.name, spool_path=path)
+
+
+def _uploads(model, field):
+    return MediaUpload.objects.filter(content_type__app_label=model._meta.app_label,
+                                      content_type__model=model._meta.model_name, field=field)
+
+
+def annotate(queryset, *fields):
+    """Thêm {field}_upload_status và {field}_upload_url (lần tải lên gần nhất) bằng subquery, tránh N+1."""
+    annotations = {}
+    for field in fields:
+        uploads = _uploads(queryset.model, field).filter(object_id=OuterRef('pk')).order_by('-id')
+        annotations[f'{field}_upload_status'] = Subquery(uploads.values('status')[:1])
+        annotations[f'{field}_upload_url'] = Subquery(uploads.filter(status='ready').values('url')[:1])
+    return queryset.annotate(**annotations)
+
+
+def describe(instance, field):
+    """
+    (url, status) của 1 trường ảnh: status là pending / ready / failed, None nếu chưa có ảnh.
+    Trong lúc chờ tải lên, url vẫn là ảnh cũ (nếu có).
+    """
+    if hasattr(instance, f'{field}_upload_status'):
+        status = getattr(instance, f'{field}_upload_status')
+        url = getattr(instance, f'{field}_upload_url')
+    else:
+        uploads = _uploads(type(instance), field).filter(object_id=instance.pk).order_by('-id')
+        status = uploads.values_list('status', flat=True).first()
+        url = uploads.filter(status='ready').values_list('url', flat=True).first()
+
+    if not url:
+        value = getattr(instance, field)
+        url = value.url if value else ''
+    if status == 'uploading':
+        status = 'pending'
+    if status is None and url:
+        status = 'ready'
+    return url, status
+
+
+def process_pending(batch_size=20):
+    """Đẩy 1 lượt các file đang chờ lên storage, trả về số file đã xong / lỗi."""
+    MediaUpload.objects.filter(status='uploading', update_time__lt=timezone.now() - STALE_AFTER) \
+        .update(status='pending', update_time=timezone.now())
+
+    # skip_locked: nhiều worker chạy song song không lấy trùng file
+    with transaction.atomic():
+        ids = list(MediaUpload.objects.select_for_update(skip_locked=True).filter(status='pending')
+                   .order_by('id').values_list('id', flat=True)[:batch_size])
+        MediaUpload.objects.filter(id__in=ids).update(status='uploading', attempts=F('attempts') + 1,
+                                                      update_time=timezone.now())
+
+    backend = get_backend()
+    result = {'ready': 0, 'failed': 0, 'retry': 0}
+    for upload in MediaUpload.objects.filter(id__in=ids).select_related('content_type').order_by('id'):
+        try:
+            url, value = backend.upload(upload.spool_path, upload)
+        except Exception as e:
+            upload.status = 'failed' if upload.attempts >= MAX_ATTEMPTS else 'pending'
+            upload.error = str(e)
+            with transaction.atomic():
+                upload.save(update_fields=['status', 'error', 'update_time'])
+                if upload.status == 'failed':
+                    _update_owner(upload)
+            result['retry' if upload.status == 'pending' else 'failed'] += 1
+            continue
+
+        with transaction.atomic():
+            _update_owner(upload, **({upload.field: value} if value else {}))
+            upload.status, upload.url, upload.error = 'ready', url, None
+            upload.save(update_fields=['status', 'url', 'error', 'update_time'])
+
+        if os.path.exists(upload.spool_path):
+            os.remove(upload.spool_path)
+        result['ready'] += 1
+    return result
+
+
+def _update_owner(upload, **changes):
+    # Đổi update_time của bản ghi chủ khi ảnh xong / lỗi hẳn để ETag thay đổi theo {field}_status
+    model = upload.content_type.model_class()
+    if any(f.name == 'update_time' for f in model._meta.fields):
+        changes['update_time'] = timezone.now()
+    if changes:
+        model.objects.filter(pk=upload.object_id).update(**changes)
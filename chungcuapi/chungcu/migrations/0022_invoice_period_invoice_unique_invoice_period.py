@@ -0,0 +1,22 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chungcu', '0021_invoice_apartment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='period',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='invoice',
+            constraint=models.UniqueConstraint(fields=('apartment', 'fee_type', 'period'), name='unique_invoice_period'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_tallies(apps, schema_editor):
+    # Đếm các phiếu đã có bằng cùng GROUP BY như surveys.rebuild_tallies, gộp cho mọi khảo sát
+    Answer = apps.get_model('chungcu', 'Answer')
+    QuestionTally = apps.get_model('chungcu', 'QuestionTally')
+    ChoiceTally = apps.get_model('chungcu', 'ChoiceTally')
+
+    question_counts = Answer.objects.values('response__survey_id', 'question_id') \
+        .annotate(n=Count('response_id', distinct=True)).order_by()
+    choice_counts = Answer.choices.through.objects.values('answer__response__survey_id', 'choice_id') \
+        .annotate(n=Count('answer__response_id', distinct=True)).order_by()
+
+    QuestionTally.objects.bulk_create([QuestionTally(survey_id=row['response__survey_id'],
+                                                     question_id=row['question_id'], count=row['n'])
+                                       for row in question_counts], batch_size=2000)
+    ChoiceTally.objects.bulk_create([ChoiceTally(survey_id=row['answer__response__survey_id'],
+                                                 choice_id=row['choice_id'], count=row['n'])
+                                     for row in choice_counts], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chungcu', '0022_invoice_period_invoice_unique_invoice_period'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChoiceTally',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('choice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='tally', to='chungcu.choice')),
+                ('survey', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='choice_tallies', to='chungcu.survey')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuestionTally',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='tally', to='chungcu.question')),
+                ('survey', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='question_tallies', to='chungcu.survey')),
+            ],
+        ),
+        migrations.RunPython(backfill_tallies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Min, Sum
+
+
+def backfill_ledger(apps, schema_editor):
+    # Dựng Balance và LedgerEntry từ các hoá đơn đã có, giống ledger.rebuild nhưng dùng model lịch sử
+    Invoice = apps.get_model('chungcu', 'Invoice')
+    Balance = apps.get_model('chungcu', 'Balance')
+    LedgerEntry = apps.get_model('chungcu', 'LedgerEntry')
+
+    for field in ('apartment_id', 'resident_id'):
+        unpaid = Invoice.objects.filter(paid=False).values(field) \
+            .annotate(total=Sum('amount'), oldest=Min('due_date')).order_by()
+        Balance.objects.bulk_create([Balance(**{field: row[field]}, outstanding=row['total'],
+                                             oldest_due_date=row['oldest']) for row in unpaid], batch_size=2000)
+
+    batch = []
+    for invoice in Invoice.objects.values('id', 'apartment_id', 'resident_id', 'amount', 'due_date', 'paid') \
+            .order_by('id').iterator(chunk_size=2000):
+        common = {'invoice_id': invoice['id'], 'apartment_id': invoice['apartment_id'],
+                  'resident_id': invoice['resident_id'], 'due_date': invoice['due_date']}
+        batch.append(LedgerEntry(kind='charge', amount=invoice['amount'], **common))
+        if invoice['paid']:
+            batch.append(LedgerEntry(kind='payment', amount=-invoice['amount'], **common))
+        if len(batch) >= 2000:
+            LedgerEntry.objects.bulk_create(batch)
+            batch = []
+    LedgerEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chungcu', '0023_choicetally_questiontally'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Balance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('create_time', models.DateTimeField(auto_now_add=True)),
+                ('update_time', models.DateTimeField(auto_now=True)),
+                ('outstanding', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('oldest_due_date', models.DateField(blank=True, null=True)),
+                ('apartment', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='balance', to='chungcu.apartment')),
+                ('resident', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='balance', to='chungcu.resident')),
+            ],
+            options={
+                'ordering': ['-id'],
+                'abstract': False,
+                'constraints': [models.CheckConstraint(condition=models.Q(models.Q(('apartment__isnull', False), ('resident__isnull', True)), models.Q(('apartment__isnull', True), ('resident__isnull', False)), _connector='OR'), name='balance_single_owner')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('create_time', models.DateTimeField(auto_now_add=True)),
+                ('update_time', models.DateTimeField(auto_now=True)),
+                ('kind', models.CharField(choices=[('charge', 'Phát sinh'), ('payment', 'Thanh toán'), ('reversal', 'Huỷ thanh toán')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('due_date', models.DateField()),
+                ('apartment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='chungcu.apartment')),
+                ('invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='chungcu.invoice')),
+                ('resident', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='chungcu.resident')),
+            ],
+            options={
+                'ordering': ['-id'],
+                'abstract': False,
+                'indexes': [models.Index(fields=['apartment', 'due_date'], name='ledger_apartment_due_idx'), models.Index(fields=['resident', 'due_date'], name='ledger_resident_due_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_ledger, migrations.RunPython.noop),
+    ]
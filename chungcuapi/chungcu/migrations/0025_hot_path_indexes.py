@@ -0,0 +1,83 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_survey_responses(apps, schema_editor):
+    # Giữ lại phiếu trả lời đầu tiên của mỗi (user, survey) trước khi thêm ràng buộc unique
+    SurveyResponse = apps.get_model('chungcu', 'SurveyResponse')
+    keep = SurveyResponse.objects.values('user', 'survey').annotate(first=Min('id')).values_list('first', flat=True)
+    SurveyResponse.objects.exclude(id__in=list(keep)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chungcu', '0024_balance_ledgerentry'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['resident', 'status'], name='complaint_resident_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['resident', 'paid'], name='invoice_resident_paid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['apartment', 'paid'], name='invoice_apartment_paid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['due_date'], name='invoice_due_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['resident', 'status'], name='payment_resident_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visitor',
+            index=models.Index(fields=['resident', 'is_approved'], name='visitor_resident_approved_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_survey_responses, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='surveyresponse',
+            constraint=models.UniqueConstraint(fields=('user', 'survey'), name='unique_survey_response'),
+        ),
+        # index riêng của các khoá ngoại thừa vì đã nằm đầu các index ghép ở trên
+        migrations.AlterField(
+            model_name='complaint',
+            name='resident',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='chungcu.resident'),
+        ),
+        migrations.AlterField(
+            model_name='invoice',
+            name='apartment',
+            field=models.ForeignKey(db_index=False, default=1, on_delete=django.db.models.deletion.CASCADE, related_name='invoices', to='chungcu.apartment'),
+        ),
+        migrations.AlterField(
+            model_name='invoice',
+            name='resident',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='invoices', to='chungcu.resident'),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='resident',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='chungcu.resident'),
+        ),
+        migrations.AlterField(
+            model_name='surveyresponse',
+            name='user',
+            field=models.ForeignKey(db_index=False, default=1, on_delete=django.db.models.deletion.CASCADE, related_name='survey_responses', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='visitor',
+            name='resident',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='chungcu.resident'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chungcu', '0025_hot_path_indexes'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('create_time', models.DateTimeField(auto_now_add=True)),
+                ('update_time', models.DateTimeField(auto_now=True)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('field', models.CharField(max_length=50)),
+                ('name', models.CharField(max_length=255)),
+                ('spool_path', models.CharField(max_length=500)),
+                ('status', models.CharField(choices=[('pending', 'Chờ tải lên'), ('uploading', 'Đang tải lên'), ('ready', 'Đã tải lên'), ('failed', 'Lỗi')], default='pending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('url', models.CharField(blank=True, max_length=500, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'ordering': ['-id'],
+                'abstract': False,
+                'indexes': [models.Index(fields=['status', 'id'], name='media_upload_status_idx'), models.Index(fields=['content_type', 'object_id', 'field'], name='media_upload_target_idx')],
+            },
+        ),
+    ]
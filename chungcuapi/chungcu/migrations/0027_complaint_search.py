@@ -0,0 +1,88 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:20
+
+import html
+import re
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.html import strip_tags
+
+TABLE = 'chungcu_complaintsearchdocument'
+FTS_TABLE = 'chungcu_complaintsearch_fts'
+
+
+def plain_text(value):
+    return re.sub(r'\s+', ' ', html.unescape(strip_tags(value or ''))).strip()
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        # parser ngram để tìm được cả từ tiếng Việt ngắn (mặc định MySQL bỏ từ < 3 ký tự)
+        schema_editor.execute(f'ALTER TABLE {TABLE} ADD FULLTEXT INDEX complaint_search_text_ft (text) WITH PARSER ngram')
+    elif vendor == 'sqlite':
+        # bảng FTS5 kiểu external content: không lưu lại văn bản, trigger giữ đồng bộ với bảng gốc
+        schema_editor.execute(f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(text, content='{TABLE}', "
+                              f"content_rowid='complaint_id', tokenize='unicode61 remove_diacritics 2')")
+        schema_editor.execute(f'CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {TABLE} BEGIN '
+                              f'INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.complaint_id, new.text); END')
+        schema_editor.execute(f'CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {TABLE} BEGIN '
+                              f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) "
+                              f"VALUES ('delete', old.complaint_id, old.text); END")
+        schema_editor.execute(f'CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON {TABLE} BEGIN '
+                              f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) "
+                              f"VALUES ('delete', old.complaint_id, old.text); "
+                              f'INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.complaint_id, new.text); END')
+
+
+def drop_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        schema_editor.execute(f'ALTER TABLE {TABLE} DROP INDEX complaint_search_text_ft')
+    elif vendor == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def populate(apps, schema_editor):
+    Complaint = apps.get_model('chungcu', 'Complaint')
+    ComplaintResponse = apps.get_model('chungcu', 'ComplaintResponse')
+    ComplaintSearchDocument = apps.get_model('chungcu', 'ComplaintSearchDocument')
+
+    responses = defaultdict(list)
+    for complaint_id, content in ComplaintResponse.objects.order_by('id').values_list('complaint_id', 'content'):
+        responses[complaint_id].append(plain_text(content))
+
+    ComplaintSearchDocument.objects.bulk_create(
+        [ComplaintSearchDocument(complaint_id=c['id'], building_id=c['resident__apartment__building_id'],
+                                 status=c['status'],
+                                 text=' '.join([c['title'], plain_text(c['content'])] + responses[c['id']]))
+         for c in Complaint.objects.values('id', 'title', 'content', 'status', 'resident__apartment__building_id')],
+        batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chungcu', '0026_media_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComplaintSearchDocument',
+            fields=[
+                ('complaint', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='chungcu.complaint')),
+                ('status', models.CharField(max_length=20)),
+                ('text', models.TextField()),
+                ('update_time', models.DateTimeField(auto_now=True)),
+                ('building', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chungcu.building')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'building'], name='complaint_search_filter_idx')],
+            },
+        ),
+        migrations.RunPython(create_index, drop_index),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:24
+
+import chungcu.models
+from django.db import migrations, models
+
+
+def backfill_search_names(apps, schema_editor):
+    # Điền tên không dấu cho dữ liệu cũ theo từng lô, trước khi tạo index
+    for model_name, source in (('Resident', 'name'), ('Visitor', 'full_name')):
+        model = apps.get_model('chungcu', model_name)
+        last_id = 0
+        while True:
+            rows = list(model.objects.filter(id__gt=last_id).order_by('id').only('id', source)[:2000])
+            if not rows:
+                break
+            for row in rows:
+                row.search_name = chungcu.models.fold(getattr(row, source))
+            model.objects.bulk_update(rows, ['search_name'])
+            last_id = rows[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chungcu', '0027_complaint_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resident',
+            name='search_name',
+            field=chungcu.models.SearchKeyField(default='', editable=False, max_length=100, source='name'),
+        ),
+        migrations.AddField(
+            model_name='visitor',
+            name='search_name',
+            field=chungcu.models.SearchKeyField(default='', editable=False, max_length=100, source='full_name'),
+        ),
+        migrations.RunPython(backfill_search_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='resident',
+            index=models.Index(fields=['search_name'], name='resident_search_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resident',
+            index=models.Index(fields=['phone'], name='resident_phone_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visitor',
+            index=models.Index(fields=['search_name'], name='visitor_search_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visitor',
+            index=models.Index(fields=['phone'], name='visitor_phone_idx'),
+        ),
+    ]
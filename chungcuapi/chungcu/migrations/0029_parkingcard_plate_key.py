@@ -0,0 +1,37 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:26
+
+import chungcu.models
+from django.db import migrations, models
+
+
+def backfill_plate_keys(apps, schema_editor):
+    ParkingCard = apps.get_model('chungcu', 'ParkingCard')
+    last_id = 0
+    while True:
+        cards = list(ParkingCard.objects.filter(id__gt=last_id).order_by('id').only('id', 'license_plate')[:2000])
+        if not cards:
+            break
+        for card in cards:
+            card.plate_key = chungcu.models.plate_key(card.license_plate)
+        ParkingCard.objects.bulk_update(cards, ['plate_key'])
+        last_id = cards[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chungcu', '0028_directory_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parkingcard',
+            name='plate_key',
+            field=chungcu.models.PlateKeyField(default='', editable=False, max_length=20, source='license_plate'),
+        ),
+        migrations.RunPython(backfill_plate_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='parkingcard',
+            index=models.Index(fields=['plate_key'], name='parkingcard_plate_key_idx'),
+        ),
+    ]
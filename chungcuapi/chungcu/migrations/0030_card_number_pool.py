@@ -0,0 +1,48 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:28
+
+from django.db import migrations, models
+
+
+def check_card_owners(apps, schema_editor):
+    # Không tự sửa / xoá dữ liệu: báo các thẻ vi phạm ràng buộc để xử lý tay rồi chạy lại migrate
+    ParkingCard = apps.get_model('chungcu', 'ParkingCard')
+    both = list(ParkingCard.objects.filter(resident__isnull=False, visitor__isnull=False)
+                .values_list('card_number', flat=True))
+    neither = list(ParkingCard.objects.filter(resident__isnull=True, visitor__isnull=True)
+                   .values_list('card_number', flat=True))
+    if both or neither:
+        raise RuntimeError(f'Thẻ xe vi phạm parkingcard_single_owner - gán cả cư dân và người thân ({len(both)}): '
+                           f'{", ".join(both[:50])}; không thuộc ai ({len(neither)}): {", ".join(neither[:50])}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chungcu', '0029_parkingcard_plate_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CardNumber',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('create_time', models.DateTimeField(auto_now_add=True)),
+                ('update_time', models.DateTimeField(auto_now=True)),
+                ('number', models.CharField(max_length=10, unique=True)),
+                ('issued', models.BooleanField(default=False)),
+            ],
+            options={
+                'ordering': ['-id'],
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(check_card_owners, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='parkingcard',
+            constraint=models.CheckConstraint(condition=models.Q(models.Q(('resident__isnull', False), ('visitor__isnull', True)), models.Q(('resident__isnull', True), ('visitor__isnull', False)), _connector='OR'), name='parkingcard_single_owner', violation_error_message='Thẻ phải thuộc về đúng 1 trong 2: cư dân hoặc người thân.'),
+        ),
+        migrations.AddIndex(
+            model_name='cardnumber',
+            index=models.Index(fields=['issued', 'id'], name='card_number_pool_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chungcu', '0030_card_number_pool'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['status', 'create_time', 'locker_item'], name='item_status_created_idx'),
+        ),
+    ]
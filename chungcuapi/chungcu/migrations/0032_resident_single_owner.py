@@ -0,0 +1,39 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:39
+
+from django.db import migrations, models
+
+
+def fix_duplicate_owners(apps, schema_editor):
+    # Dữ liệu cũ có căn hộ nhiều chủ hộ: giữ household_head (hoặc người thêm trước), những người khác thành 'other'
+    Apartment = apps.get_model('chungcu', 'Apartment')
+    Resident = apps.get_model('chungcu', 'Resident')
+    heads = dict(Apartment.objects.filter(household_head__isnull=False).values_list('id', 'household_head_id'))
+    keep, demote = {}, []
+    for resident_id, apartment_id in Resident.objects.filter(relationship_to_head='owner') \
+            .order_by('id').values_list('id', 'apartment_id'):
+        if heads.get(apartment_id) == resident_id or apartment_id not in keep:
+            if apartment_id in keep:
+                demote.append(keep[apartment_id])
+            keep[apartment_id] = resident_id
+        else:
+            demote.append(resident_id)
+    Resident.objects.filter(id__in=demote).update(relationship_to_head='other')
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chungcu', '0031_item_status_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(fix_duplicate_owners, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='resident',
+            name='owner_apartment',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(relationship_to_head='owner', then=models.F('apartment')), default=None), output_field=models.BigIntegerField(null=True)),
+        ),
+        migrations.AddConstraint(
+            model_name='resident',
+            constraint=models.UniqueConstraint(fields=('owner_apartment',), name='resident_single_owner'),
+        ),
+    ]
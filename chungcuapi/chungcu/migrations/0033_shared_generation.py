@@ -0,0 +1,25 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:46
+
+from django.db import migrations, models
+
+
+def create_gate_generation(apps, schema_editor):
+    apps.get_model('chungcu', 'Generation').objects.get_or_create(name='gate')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chungcu', '0032_resident_single_owner'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Generation',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_gate_generation, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 20:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chungcu', '0033_shared_generation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ledgerentry',
+            name='kind',
+            field=models.CharField(choices=[('charge', 'Phát sinh'), ('payment', 'Thanh toán'), ('reversal', 'Huỷ thanh toán'), ('adjustment', 'Điều chỉnh')], max_length=20),
+        ),
+    ]
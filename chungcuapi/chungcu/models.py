@@ -1,8 +1,13 @@
 
+import re
+import unicodedata
+
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
 from cloudinary.models import CloudinaryField
 from ckeditor.fields import RichTextField
 
@@ -10,6 +15,52 @@ AbstractUser.username.field.error_messages['unique'] = 'Tên đăng nhập đã
 class User(AbstractUser):
     avatar = CloudinaryField('avatar',null = True, )
 
+def fold(value):
+    """Bỏ dấu, chữ thường, gộp khoảng trắng: 'Nguyễn  Văn Đức' -> 'nguyen van duc'."""
+    value = unicodedata.normalize('NFD', (value or '').replace('đ', 'd').replace('Đ', 'D'))
+    return ' '.join(''.join(c for c in value if not unicodedata.combining(c)).lower().split())
+
+
+def plate_key(value):
+    """Chuẩn hoá biển số để so khớp: '51f-123.45' / '51F 12345' -> '51F12345'."""
+    return re.sub(r'[^0-9A-Z]', '', fold(value).upper())
+
+
+class SearchKeyField(models.CharField):
+    """
+    Cột phụ lưu fold() của 1 cột khác, tính lại mỗi lần save() và cả bulk_create().
+    save(update_fields=[cột nguồn]) cũng ghi cột phụ (SearchKeyMixin). QuerySet.update() không đi qua field
+    nên phải tự ghi cả 2 cột: update(name=name, search_name=fold(name)).
+    """
+    normalize = staticmethod(fold)
+
+    def __init__(self, source, *args, **kwargs):
+        self.source = source
+        kwargs.setdefault('editable', False)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['source'] = self.source
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        value = self.normalize(getattr(model_instance, self.source))
+        setattr(model_instance, self.attname, value)
+        return value
+
+class PlateKeyField(SearchKeyField):
+    normalize = staticmethod(plate_key)
+
+class SearchKeyMixin:
+    def save(self, *args, update_fields=None, **kwargs):
+        # save(update_fields=['name']) thì ghi luôn search_name, nếu không cột phụ giữ giá trị cũ
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            update_fields.update(field.name for field in self._meta.concrete_fields
+                                 if isinstance(field, SearchKeyField) and field.source in update_fields)
+        return super().save(*args, update_fields=update_fields, **kwargs)
+
 class BaseModel(models.Model):
     create_time = models.DateTimeField(auto_now_add=True)
     update_time = models.DateTimeField(auto_now=True)
@@ -50,7 +101,7 @@ class Apartment(BaseModel):
 
 
 
-class Resident(BaseModel):
+class Resident(SearchKeyMixin, BaseModel):
     relationship_to_head = [
         ('owner', 'Chủ hộ'),
         ('wife/husband', 'Vợ/Chồng'),
@@ -70,22 +121,58 @@ class Resident(BaseModel):
     phone = models.CharField(max_length=10)
     relationship_to_head = models.CharField(max_length=12,default=1, choices=relationship_to_head)
     active = models.BooleanField(default=True)
+    search_name = SearchKeyField('name', max_length=100, default='')  # tên không dấu cho tra cứu
 
     user = models.OneToOneField('User', on_delete=models.CASCADE, null=True, blank=True)
     apartment = models.ForeignKey(Apartment,default=1, related_name='residents', on_delete=models.CASCADE)
+    # = apartment_id nếu là chủ hộ, NULL nếu không: unique trên cột này để DB đảm bảo mỗi căn hộ 1 chủ hộ
+    owner_apartment = models.GeneratedField(
+        expression=models.Case(models.When(relationship_to_head='owner', then=models.F('apartment')), default=None),
+        output_field=models.BigIntegerField(null=True), db_persist=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_loaded()
+        return instance
+
+    def remember_loaded(self):
+        # tài khoản / căn hộ đang lưu trong DB, để signals.py biết cư dân đổi gì mà không phải SELECT lại
+        if 'user_id' in self.__dict__ and 'apartment_id' in self.__dict__:
+            self._loaded = (self.user_id, self.apartment_id)
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        # Nếu người này là chủ hộ
-        if self.relationship_to_head == 'owner':
-
-            # Kiểm tra nếu căn hộ đã có chủ
-            if self.apartment.household_head and self.apartment.household_head != self:
+        if self.relationship_to_head != 'owner':
+            return super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            # Khoá dòng căn hộ: 2 lần thêm chủ hộ cùng lúc phải chờ nhau thay vì cùng qua được bước kiểm tra
+            head_id = Apartment.objects.select_for_update().filter(pk=self.apartment_id) \
+                .values_list('household_head_id', flat=True).first()
+            if head_id and head_id != self.pk:
                 raise ValidationError("Căn hộ này đã có chủ hộ.")
-            else:
-                self.apartment.household_head = self
-                self.apartment.save()
 
+            adding = self._state.adding
+            super().save(*args, **kwargs)
+            if head_id != self.pk:
+                if not adding:
+                    # chủ hộ chuyển sang căn hộ khác: bỏ liên kết ở căn hộ cũ (household_head là OneToOne)
+                    Apartment.objects.filter(household_head=self).update(household_head=None)
+                # Chỉ ghi cột household_head, không lưu lại cả căn hộ
+                Apartment.objects.filter(pk=self.apartment_id).update(household_head=self)
+
+        if head_id != self.pk:
+            from chungcu import caching  # caching import models
+            caching.bump(Apartment)
+
+    class Meta(BaseModel.Meta):
+        indexes = [
+            models.Index(fields=['search_name'], name='resident_search_name_idx'),
+            models.Index(fields=['phone'], name='resident_phone_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['owner_apartment'], name='resident_single_owner'),
+        ]
 
     def __str__(self):
         return self.name
@@ -108,20 +195,35 @@ class Item(BaseModel):
     ], default='waiting')
     received_at = models.DateTimeField(null=True, blank=True)
 
-class Visitor(BaseModel):
-    resident = models.ForeignKey(Resident, on_delete=models.CASCADE)
+    class Meta(BaseModel.Meta):
+        # Bảng tổng hợp bưu phẩm chờ nhận chỉ quét phần 'waiting' của index, không đụng các bưu phẩm
+        # đã nhận tích luỹ nhiều năm; locker_item ở cuối để câu GROUP BY đọc được ngay trên index
+        indexes = [
+            models.Index(fields=['status', 'create_time', 'locker_item'], name='item_status_created_idx'),
+        ]
+
+class Visitor(SearchKeyMixin, BaseModel):
+    resident = models.ForeignKey(Resident, on_delete=models.CASCADE, db_index=False)
     full_name = models.CharField(max_length=100)
     identity_card = models.CharField(max_length=12, unique=True)
     phone = models.CharField(max_length=10, default=0)
     relationship_to_resident = models.CharField(max_length=50)
     active = models.BooleanField(default=True)
+    search_name = SearchKeyField('full_name', max_length=100, default='')
 
     def __str__(self):
         return self.full_name
 
     is_approved = models.BooleanField(default=False)
 
-class ParkingCard(BaseModel):
+    class Meta(BaseModel.Meta):
+        indexes = [
+            models.Index(fields=['resident', 'is_approved'], name='visitor_resident_approved_idx'),
+            models.Index(fields=['search_name'], name='visitor_search_name_idx'),
+            models.Index(fields=['phone'], name='visitor_phone_idx'),
+        ]
+
+class ParkingCard(SearchKeyMixin, BaseModel):
     resident = models.OneToOneField(Resident, on_delete=models.CASCADE, null=True, blank=True)
     visitor = models.OneToOneField(Visitor, on_delete=models.CASCADE, null=True, blank=True, related_name='parking_card')
     card_number = models.CharField(max_length=10, unique=True)
@@ -133,17 +235,46 @@ class ParkingCard(BaseModel):
         ('Other', 'Khác'),
     ])
     color = models.CharField(max_length=20,default='Trắng')
-
-    def clean(self):
-        from django.core.exceptions import ValidationError
-        if not self.resident and not self.visitor:
-            raise ValidationError('Thẻ phải thuộc về cư dân hoặc người thân.')
-        if self.resident and self.visitor:
-            raise ValidationError('Chỉ được gán thẻ cho 1 trong 2: cư dân hoặc người thân.')
+    plate_key = PlateKeyField('license_plate', max_length=20, default='')  # biển số đã chuẩn hoá, tra ở cổng
+
+    class Meta(BaseModel.Meta):
+        indexes = [
+            models.Index(fields=['plate_key'], name='parkingcard_plate_key_idx'),
+        ]
+        # Thẻ thuộc đúng 1 trong 2: cư dân hoặc người thân (DB kiểm tra, kể cả khi bulk_create / update)
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(resident__isnull=False, visitor__isnull=True) |
+                          models.Q(resident__isnull=True, visitor__isnull=False),
+                name='parkingcard_single_owner',
+                violation_error_message='Thẻ phải thuộc về đúng 1 trong 2: cư dân hoặc người thân.'),
+        ]
 
     def __str__(self):
         return f"{self.card_number} - {self.license_plate}"
 
+# Kho số thẻ xe in sẵn, phát dần khi duyệt khách hàng loạt (xem chungcu/visitors.py)
+class CardNumber(BaseModel):
+    number = models.CharField(max_length=10, unique=True)
+    issued = models.BooleanField(default=False)
+
+    class Meta(BaseModel.Meta):
+        indexes = [
+            models.Index(fields=['issued', 'id'], name='card_number_pool_idx'),
+        ]
+
+    def __str__(self):
+        return self.number
+
+# Bộ đếm dùng chung giữa các process (worker gunicorn): cache trong bộ nhớ của từng process so với giá trị này
+# để biết dữ liệu đã đổi ở process khác (xem chungcu/gate.py)
+class Generation(models.Model):
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
+
 class FeeType(BaseModel):
     name = models.CharField(max_length=100)
     description = RichTextField(null=True, blank=True)
@@ -152,19 +283,67 @@ class FeeType(BaseModel):
         return self.name
 
 class Invoice(BaseModel):
-    apartment = models.ForeignKey(Apartment, on_delete=models.CASCADE, related_name='invoices', default=1)
-    resident = models.ForeignKey(Resident, on_delete=models.CASCADE, related_name='invoices')
+    # index của apartment, resident nằm trong các index ghép bên dưới
+    apartment = models.ForeignKey(Apartment, on_delete=models.CASCADE, related_name='invoices', default=1,
+                                  db_index=False)
+    resident = models.ForeignKey(Resident, on_delete=models.CASCADE, related_name='invoices', db_index=False)
     fee_type = models.ForeignKey(FeeType, on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     due_date = models.DateField()
     paid = models.BooleanField(default=False)
+    period = models.DateField(null=True, blank=True)  # ngày đầu tháng của kỳ thu phí
+
+    class Meta(BaseModel.Meta):
+        constraints = [
+            # mỗi căn hộ chỉ có 1 hoá đơn cho mỗi loại phí trong 1 kỳ
+            models.UniqueConstraint(fields=['apartment', 'fee_type', 'period'], name='unique_invoice_period'),
+        ]
+        indexes = [
+            models.Index(fields=['resident', 'paid'], name='invoice_resident_paid_idx'),
+            models.Index(fields=['apartment', 'paid'], name='invoice_apartment_paid_idx'),
+            models.Index(fields=['due_date'], name='invoice_due_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.resident.name} - {self.fee_type.name}"
 
 
+# Công nợ của căn hộ hoặc cư dân, cập nhật cùng transaction với hoá đơn và thanh toán
+class Balance(BaseModel):
+    apartment = models.OneToOneField(Apartment, on_delete=models.CASCADE, null=True, blank=True, related_name='balance')
+    resident = models.OneToOneField(Resident, on_delete=models.CASCADE, null=True, blank=True, related_name='balance')
+    outstanding = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    oldest_due_date = models.DateField(null=True, blank=True)  # hạn của hoá đơn chưa trả lâu nhất
+
+    class Meta(BaseModel.Meta):
+        constraints = [
+            # chỉ thuộc về 1 trong 2: căn hộ hoặc cư dân
+            models.CheckConstraint(condition=models.Q(apartment__isnull=False, resident__isnull=True) |
+                                             models.Q(apartment__isnull=True, resident__isnull=False),
+                                   name='balance_single_owner'),
+        ]
+
+class LedgerEntry(BaseModel):
+    apartment = models.ForeignKey(Apartment, on_delete=models.CASCADE, related_name='ledger_entries')
+    resident = models.ForeignKey(Resident, on_delete=models.CASCADE, related_name='ledger_entries')
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='ledger_entries')
+    kind = models.CharField(max_length=20, choices=[
+        ('charge', 'Phát sinh'),
+        ('payment', 'Thanh toán'),
+        ('reversal', 'Huỷ thanh toán'),
+        ('adjustment', 'Điều chỉnh'),  # huỷ phần nợ cũ khi hoá đơn bị sửa / xoá
+    ])
+    amount = models.DecimalField(max_digits=10, decimal_places=2)  # dương: phát sinh nợ, âm: đã trả
+    due_date = models.DateField()
+
+    class Meta(BaseModel.Meta):
+        indexes = [
+            models.Index(fields=['apartment', 'due_date'], name='ledger_apartment_due_idx'),
+            models.Index(fields=['resident', 'due_date'], name='ledger_resident_due_idx'),
+        ]
+
 class Payment(BaseModel):
-    resident = models.ForeignKey(Resident, on_delete=models.CASCADE)
+    resident = models.ForeignKey(Resident, on_delete=models.CASCADE, db_index=False)
     invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE)
     method = models.CharField(max_length=20, choices=[
         ('momo', 'Momo'),
@@ -177,12 +356,17 @@ class Payment(BaseModel):
         ('rejected', 'Từ chối')
     ], default='pending')
 
+    class Meta(BaseModel.Meta):
+        indexes = [
+            models.Index(fields=['resident', 'status'], name='payment_resident_status_idx'),
+        ]
+
 def __str__(self):
         return f"{self.resident.name} - {self.invoice.id}"
 
 
 class Complaint(BaseModel):
-    resident = models.ForeignKey(Resident, on_delete=models.CASCADE)
+    resident = models.ForeignKey(Resident, on_delete=models.CASCADE, db_index=False)
     title = models.CharField(max_length=255)
     content = RichTextField()
     status = models.CharField(max_length=20, choices=[
@@ -191,9 +375,28 @@ class Complaint(BaseModel):
     ], default='pending', )
     is_resolved = models.BooleanField(default=False,)
 
+    class Meta(BaseModel.Meta):
+        indexes = [
+            models.Index(fields=['resident', 'status'], name='complaint_resident_status_idx'),
+        ]
+
     def __str__(self):
         return f"{self.resident.name} - {self.title}"
 
+# Nội dung đã bỏ thẻ HTML của phản ánh và các phản hồi, có index full-text (xem chungcu/search.py)
+class ComplaintSearchDocument(models.Model):
+    complaint = models.OneToOneField(Complaint, on_delete=models.CASCADE, primary_key=True,
+                                     related_name='search_document')
+    building = models.ForeignKey(Building, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    status = models.CharField(max_length=20)
+    text = models.TextField()
+    update_time = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'building'], name='complaint_search_filter_idx'),
+        ]
+
 class ComplaintResponse(BaseModel):
     complaint = models.ForeignKey(Complaint, on_delete=models.CASCADE, related_name="responses")
     responder = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'is_staff': True})
@@ -231,7 +434,15 @@ class Choice(BaseModel):
 
 class SurveyResponse(BaseModel):
     survey = models.ForeignKey(Survey, on_delete=models.CASCADE, related_name='responses')
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='survey_responses', default=1)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='survey_responses', default=1,
+                             db_index=False)
+
+    class Meta(BaseModel.Meta):
+        constraints = [
+            # mỗi tài khoản chỉ trả lời 1 khảo sát 1 lần
+            models.UniqueConstraint(fields=['user', 'survey'], name='unique_survey_response'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.survey.title}"
 
@@ -243,5 +454,41 @@ class Answer(models.Model):
     def __str__(self):
         return f"{self.response.survey.title} - {self.question} - {self.choices}"
 
+# Bảng đếm kết quả khảo sát, cập nhật mỗi lần cư dân nộp phiếu
+class QuestionTally(models.Model):
+    survey = models.ForeignKey(Survey, on_delete=models.CASCADE, related_name='question_tallies')
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, related_name='tally')
+    count = models.PositiveIntegerField(default=0)
+
+class ChoiceTally(models.Model):
+    survey = models.ForeignKey(Survey, on_delete=models.CASCADE, related_name='choice_tallies')
+    choice = models.OneToOneField(Choice, on_delete=models.CASCADE, related_name='tally')
+    count = models.PositiveIntegerField(default=0)
+
+
+# File tải lên được lưu tạm ở đĩa, worker process_media_uploads đẩy lên storage rồi cập nhật trường ảnh
+class MediaUpload(BaseModel):
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveBigIntegerField()
+    target = GenericForeignKey('content_type', 'object_id')
+    field = models.CharField(max_length=50)  # tên trường ảnh: avatar, proof_image...
+    name = models.CharField(max_length=255)  # tên file gốc
+    spool_path = models.CharField(max_length=500)
+    status = models.CharField(max_length=20, choices=[
+        ('pending', 'Chờ tải lên'),
+        ('uploading', 'Đang tải lên'),
+        ('ready', 'Đã tải lên'),
+        ('failed', 'Lỗi'),
+    ], default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    url = models.CharField(max_length=500, null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
 
+    class Meta(BaseModel.Meta):
+        indexes = [
+            models.Index(fields=['status', 'id'], name='media_upload_status_idx'),
+            models.Index(fields=['content_type', 'object_id', 'field'], name='media_upload_target_idx'),
+        ]
 
+    def __str__(self):
+        return f"{self.content_type.model} {self.object_id} - {self.field} ({self.status})"
@@ -0,0 +1,45 @@
+from django.db.models import Count, F, Min
+
+from chungcu.models import Item
+
+
+def pending_summary(building_id=None):
+    """
+    Số bưu phẩm chờ nhận và bưu phẩm chờ lâu nhất theo chung cư → tầng → tủ đồ,
+    tính bằng 1 câu GROUP BY trên Item → LockerItem → Resident → Apartment → Building.
+    """
+    items = Item.objects.filter(status='waiting')
+    if building_id is not None:
+        items = items.filter(locker_item__resident__apartment__building_id=building_id)
+
+    rows = items.values(
+        building=F('locker_item__resident__apartment__building_id'),
+        building_name=F('locker_item__resident__apartment__building__name'),
+        floor=F('locker_item__resident__apartment__floor'),
+        apartment=F('locker_item__resident__apartment__number'),
+        locker=F('locker_item_id'),
+        locker_number=F('locker_item__locker_number'),
+    ).annotate(waiting=Count('id'), oldest=Min('create_time')).order_by('building', 'floor', 'locker_number')
+
+    # Cộng dồn lên tầng / chung cư từ kết quả đã nhóm, không cần thêm câu SQL
+    summary = {'waiting': 0, 'oldest': None, 'buildings': []}
+    buildings, floors = {}, {}
+    for row in rows:
+        building = buildings.get(row['building'])
+        if building is None:
+            building = buildings[row['building']] = {'building': row['building'], 'name': row['building_name'],
+                                                     'waiting': 0, 'oldest': None, 'floors': []}
+            summary['buildings'].append(building)
+        floor = floors.get((row['building'], row['floor']))
+        if floor is None:
+            floor = floors[(row['building'], row['floor'])] = {'floor': row['floor'], 'waiting': 0,
+                                                               'oldest': None, 'lockers': []}
+            building['floors'].append(floor)
+
+        floor['lockers'].append({key: row[key] for key in ('locker', 'locker_number', 'apartment',
+                                                           'waiting', 'oldest')})
+        for group in (summary, building, floor):
+            group['waiting'] += row['waiting']
+            if group['oldest'] is None or row['oldest'] < group['oldest']:
+                group['oldest'] = row['oldest']
+    return summary
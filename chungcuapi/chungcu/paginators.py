@@ -1,4 +1,43 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 
-class ItemPaginator(PageNumberPagination):
-    page_size = 5
\ No newline at end of file
+# Phân trang theo con trỏ (keyset) trên id, trang sâu cũng nhanh như trang đầu
+class CursorPaginator(CursorPagination):
+    ordering = '-id'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+# Kết quả tìm kiếm xếp theo độ liên quan nên không dùng con trỏ theo id được
+class SearchPaginator(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+# Trang danh sách của admin: bảng lớn không lọc thì lấy số dòng ước lượng từ thống kê của MySQL
+# thay vì COUNT(*) quét cả bảng; có bộ lọc / tìm kiếm hoặc bảng nhỏ thì vẫn đếm chính xác
+class EstimatedCountPaginator(Paginator):
+    threshold = 100_000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = estimated_rows(self.object_list.model, self.object_list.db)
+            if estimate is not None and estimate > self.threshold:
+                return estimate
+        return super().count
+
+
+def estimated_rows(model, using='default'):
+    connection = connections[using]
+    if connection.vendor != 'mysql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT TABLE_ROWS FROM information_schema.TABLES '
+                       'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s', [model._meta.db_table])
+        row = cursor.fetchone()
+    return row[0] if row else None
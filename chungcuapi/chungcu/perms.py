@@ -1,5 +1,7 @@
 from rest_framework.permissions import BasePermission
 
+from chungcu import identity
+
 class IsAdminUser(BasePermission):
     def has_permission(self, request, view):
         return request.user and request.user.is_staff
@@ -16,12 +18,13 @@ class IsOwner(BasePermission):
             return True
 
         # Nếu obj có trường user → so sánh trực tiếp
-        if hasattr(obj, 'user'):
-            return obj.user == request.user
+        if hasattr(obj, 'user_id'):
+            return obj.user_id == request.user.id
 
-        # Nếu obj có resident → so sánh resident.user
-        if hasattr(obj, 'resident') and hasattr(obj.resident, 'user'):
-            return obj.resident.user == request.user
+        # Nếu obj có resident → so sánh với resident của user (đã cache)
+        if hasattr(obj, 'resident_id'):
+            resident_id = identity.resolve(request.user).resident_id
+            return resident_id is not None and obj.resident_id == resident_id
 
         return False
 
@@ -31,12 +34,16 @@ class IsResidentOfApartment(BasePermission):
         if user.is_staff:
             return True
 
-        # Trường hợp đối tượng là Apartment → kiểm tra resident của căn hộ
+        apartment_id = identity.resolve(user).apartment_id
+        if apartment_id is None:
+            return False
+
+        # Trường hợp đối tượng là Apartment → so sánh với căn hộ của user
         if hasattr(obj, 'residents'):
-            return obj.residents.filter(user=user).exists()
+            return obj.pk == apartment_id
 
-        # Trường hợp đối tượng có thuộc tính apartment → đi qua resident của apartment
-        if hasattr(obj, 'apartment') and hasattr(obj.apartment, 'residents'):
-            return obj.apartment.residents.filter(user=user).exists()
+        # Trường hợp đối tượng có thuộc tính apartment → so sánh apartment_id
+        if hasattr(obj, 'apartment_id'):
+            return obj.apartment_id == apartment_id
 
-        return False
\ No newline at end of file
+        return False
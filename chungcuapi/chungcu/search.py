@@ -0,0 +1,132 @@
+import html
+import re
+from collections import defaultdict
+
+from django.db import connection
+from django.utils.html import strip_tags
+
+from chungcu.models import Complaint, ComplaintResponse, ComplaintSearchDocument
+
+# Bảng FTS5 (SQLite) trỏ tới ComplaintSearchDocument, tạo trong migration 0027
+FTS_TABLE = 'chungcu_complaintsearch_fts'
+MAX_TERMS = 10
+
+
+def plain_text(value):
+    return re.sub(r'\s+', ' ', html.unescape(strip_tags(value or ''))).strip()
+
+
+def index_complaints(complaint_ids, chunk_size=500):
+    """Dựng lại văn bản tìm kiếm (tiêu đề, nội dung, các phản hồi) của các phản ánh."""
+    complaint_ids = list(complaint_ids)
+    for i in range(0, len(complaint_ids), chunk_size):
+        chunk = complaint_ids[i:i + chunk_size]
+
+        responses = defaultdict(list)
+        for complaint_id, content in ComplaintResponse.objects.filter(complaint_id__in=chunk) \
+                .order_by('id').values_list('complaint_id', 'content'):
+            responses[complaint_id].append(plain_text(content))
+
+        documents = [ComplaintSearchDocument(complaint_id=c['id'], building_id=c['resident__apartment__building_id'],
+                                             status=c['status'],
+                                             text=' '.join([c['title'], plain_text(c['content'])] +
+                                                           responses[c['id']]))
+                     for c in Complaint.objects.filter(id__in=chunk)
+                     .values('id', 'title', 'content', 'status', 'resident__apartment__building_id')]
+        ComplaintSearchDocument.objects.bulk_create(documents, update_conflicts=True, unique_fields=['complaint'],
+                                                    update_fields=['building', 'status', 'text', 'update_time'])
+
+
+def rebuild(chunk_size=500):
+    ComplaintSearchDocument.objects.all().delete()
+    complaint_ids = list(Complaint.objects.order_by('id').values_list('id', flat=True))
+    index_complaints(complaint_ids, chunk_size)
+    return len(complaint_ids)
+
+
+def terms(query):
+    return re.findall(r'\w+', query or '')[:MAX_TERMS]
+
+
+class RankedResults:
+    """
+    Kết quả tìm kiếm xếp theo độ liên quan, có count() và cắt trang [a:b] như QuerySet
+    để dùng trực tiếp với paginator. Mỗi Complaint trả về có thêm thuộc tính score.
+    MySQL: index FULLTEXT (MATCH ... AGAINST), SQLite: bảng FTS5 (bm25); DB khác: icontains, không xếp hạng.
+    """
+
+    def __init__(self, query, status=None, building_id=None):
+        self.terms = terms(query)
+        self.filters = {key: value for key, value in (('status', status), ('building_id', building_id))
+                        if value is not None}
+        self._count = None
+
+    def _where(self):
+        table = ComplaintSearchDocument._meta.db_table
+        if connection.vendor == 'mysql':
+            match = ' '.join(f'+"{term}"' for term in self.terms)
+            source = table
+            score = 'MATCH(text) AGAINST (%s IN BOOLEAN MODE)'
+            where, params = [score], [match]
+        else:
+            match = ' '.join(f'"{term}"' for term in self.terms)
+            source = f'{FTS_TABLE} JOIN {table} ON {table}.complaint_id = {FTS_TABLE}.rowid'
+            score = f'-bm25({FTS_TABLE})'
+            where, params = [f'{FTS_TABLE} MATCH %s'], [match]
+
+        for column, value in self.filters.items():
+            where.append(f'{table}.{column} = %s')
+            params.append(value)
+        return source, score, match, ' AND '.join(where), params
+
+    def _fallback(self):
+        documents = ComplaintSearchDocument.objects.filter(**self.filters)
+        for term in self.terms:
+            documents = documents.filter(text__icontains=term)
+        return documents.order_by('-complaint_id')
+
+    def count(self):
+        if self._count is None:
+            if not self.terms:
+                self._count = 0
+            elif connection.vendor not in ('mysql', 'sqlite'):
+                self._count = self._fallback().count()
+            else:
+                source, _, _, where, params = self._where()
+                with connection.cursor() as cursor:
+                    cursor.execute(f'SELECT COUNT(*) FROM {source} WHERE {where}', params)
+                    self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        offset = item.start or 0
+        limit = (item.stop if item.stop is not None else self.count()) - offset
+        if not self.terms or limit <= 0:
+            return []
+
+        if connection.vendor not in ('mysql', 'sqlite'):
+            rows = [(complaint_id, None) for complaint_id in
+                    self._fallback().values_list('complaint_id', flat=True)[offset:offset + limit]]
+        else:
+            table = ComplaintSearchDocument._meta.db_table
+            source, score, match, where, params = self._where()
+            score_params = [match] if connection.vendor == 'mysql' else []
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT {table}.complaint_id, {score} AS score FROM {source} WHERE {where} '
+                               f'ORDER BY score DESC, {table}.complaint_id DESC LIMIT %s OFFSET %s',
+                               score_params + params + [limit, offset])
+                rows = cursor.fetchall()
+
+        complaints = Complaint.objects.in_bulk([complaint_id for complaint_id, _ in rows])
+        results = []
+        for complaint_id, score in rows:
+            complaint = complaints.get(complaint_id)
+            if complaint is not None:
+                complaint.score = score
+                results.append(complaint)
+        return results
@@ -0,0 +1,282 @@
+import math
+import random
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db.models import Max
+from django.utils import timezone
+
+from chungcu import caching, households, ledger, search, surveys
+from chungcu.models import *
+
+# Số bản ghi gốc ở scale=1 (~120 nghìn dòng tính cả hoá đơn, sổ công nợ, phiếu khảo sát),
+# scale=8 cho khoảng 1 triệu dòng
+BASE = {
+    'buildings': 4,
+    'apartments': 1000,
+    'residents': 3000,
+    'visitors': 600,
+    'complaints': 500,
+    'surveys': 4,
+}
+MONTHS = 12  # số kỳ thu phí sinh cho mỗi căn hộ
+FEES = {'Phí quản lý': 500_000, 'Phí gửi xe': 150_000}
+RELATIONSHIPS = ['wife/husband', 'child', 'parent', 'other']
+PASSWORD = '123'
+
+
+def scaled(scale):
+    return {name: max(1, round(count * scale)) for name, count in BASE.items()}
+
+
+def seed(scale=1, seed=0, batch_size=5000, log=None):
+    """
+    Sinh dữ liệu giả cho toàn bộ các bảng bằng bulk_create (không qua Resident.save, không gửi signal),
+    sau đó gán chủ hộ, dựng sổ công nợ và bảng đếm khảo sát mỗi thứ bằng 1 lượt.
+    Trả về số dòng đã tạo theo từng bảng.
+    """
+    rng = random.Random(seed)
+    counts = scaled(scale)
+    log = log or (lambda message: None)
+    started = time.monotonic()
+    created = {}
+
+    def step(name, rows):
+        created[name] = rows
+        log(f'{name}: {rows} ({time.monotonic() - started:.1f}s)')
+
+    building_ids = _seed_buildings(counts, batch_size)
+    step('buildings', len(building_ids))
+
+    apartment_ids = _seed_apartments(counts, building_ids, batch_size)
+    step('apartments', len(apartment_ids))
+
+    user_ids, admin_id = _seed_users(counts, batch_size)
+    step('users', len(user_ids) + 1)
+
+    residents = _seed_residents(counts, apartment_ids, user_ids, rng, batch_size)
+    step('residents', len(residents))
+
+    step('household_heads', households.sync_household_heads(apartment_ids))
+
+    lockers, items = _seed_lockers(residents, rng, batch_size)
+    step('lockers', lockers)
+    step('items', items)
+
+    visitor_ids = _seed_visitors(counts, residents, rng, batch_size)
+    step('visitors', len(visitor_ids))
+
+    step('parking_cards', _seed_parking_cards(residents, visitor_ids, rng, batch_size))
+
+    invoices, payments = _seed_invoices(apartment_ids, rng, batch_size)
+    step('invoices', invoices)
+    step('payments', payments)
+
+    ledger.rebuild(chunk_size=batch_size)
+    step('ledger_entries', LedgerEntry.objects.count())
+
+    complaints, responses = _seed_complaints(counts, residents, admin_id, rng, batch_size)
+    step('complaints', complaints)
+    step('complaint_responses', responses)
+
+    survey_responses, answers = _seed_surveys(counts, user_ids, rng, batch_size)
+    step('survey_responses', survey_responses)
+    step('answers', answers)
+
+    # bulk_create không gửi signal nên tự làm mất hiệu lực response cache
+    caching.bump(*caching.WATCHED_MODELS)
+
+    created['elapsed'] = round(time.monotonic() - started, 3)
+    return created
+
+
+def _insert(model, rows, batch_size):
+    """bulk_create rồi đọc lại id theo thứ tự chèn (MySQL không trả id khi bulk_create)."""
+    last_id = model.objects.aggregate(last=Max('id'))['last'] or 0
+    model.objects.bulk_create(rows, batch_size=batch_size)
+    return list(model.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True))
+
+
+def _next_number(model):
+    # Dùng làm tiền tố cho các cột unique để chạy seed nhiều lần không bị trùng
+    return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+
+def _seed_buildings(counts, batch_size):
+    start = _next_number(Building)
+    per_building = math.ceil(counts['apartments'] / counts['buildings'])
+    return _insert(Building, [Building(name=f'Chung cư {start + i}', address=f'{start + i} Nguyễn Huệ',
+                                       area=5000, total_apartment=per_building)
+                              for i in range(counts['buildings'])], batch_size)
+
+
+def _seed_apartments(counts, building_ids, batch_size):
+    per_building = math.ceil(counts['apartments'] / counts['buildings'])
+    return _insert(Apartment, [Apartment(number=f'{i % per_building + 1:04d}', floor=i % per_building // 20 + 1,
+                                         price=2_000_000_000, area=70, building_id=building_ids[i // per_building])
+                               for i in range(counts['apartments'])], batch_size)
+
+
+def _seed_users(counts, batch_size):
+    # Băm mật khẩu 1 lần rồi dùng lại, băm từng tài khoản sẽ chiếm gần hết thời gian chạy
+    password = make_password(PASSWORD)
+    start = _next_number(User)
+    admin_id = _insert(User, [User(username=f'seed_admin_{start}', password=password, is_staff=True)],
+                       batch_size)[0]
+    # Khoảng 1/2 cư dân có tài khoản
+    user_ids = _insert(User, [User(username=f'seed_{start + i}', password=password)
+                              for i in range(counts['residents'] // 2)], batch_size)
+    return user_ids, admin_id
+
+
+def _seed_residents(counts, apartment_ids, user_ids, rng, batch_size):
+    """Mỗi căn hộ có đúng 1 chủ hộ, các cư dân còn lại chia ngẫu nhiên vào các căn hộ."""
+    start = _next_number(Resident)
+    total = max(counts['residents'], len(apartment_ids))
+    rows = []
+    for i in range(total):
+        owner = i < len(apartment_ids)
+        rows.append(Resident(name=f'Cư dân {start + i}', identity_card=f'S{start + i:011d}',
+                             gender=rng.choice(['Male', 'Female']),
+                             birthday=date(1950, 1, 1) + timedelta(days=rng.randrange(365 * 55)),
+                             phone=f'09{(start + i) % 10 ** 8:08d}',
+                             relationship_to_head='owner' if owner else rng.choice(RELATIONSHIPS),
+                             apartment_id=apartment_ids[i] if owner else rng.choice(apartment_ids),
+                             user_id=user_ids[i] if i < len(user_ids) else None))
+    ids = _insert(Resident, rows, batch_size)
+    return [(resident_id, row.apartment_id, row.user_id) for resident_id, row in zip(ids, rows)]
+
+
+def _seed_lockers(residents, rng, batch_size):
+    owners = [r for r in residents if rng.random() < 0.3]
+    locker_ids = _insert(LockerItem, [LockerItem(resident_id=resident_id, locker_number=f'L{i % 10 ** 9}',
+                                                 description='Tủ đồ')
+                                      for i, (resident_id, _, _) in enumerate(owners)], batch_size)
+    now = timezone.now()
+    items = []
+    for locker_id in locker_ids:
+        for j in range(rng.randrange(4)):
+            received = rng.random() < 0.7
+            items.append(Item(locker_item_id=locker_id, name_item=f'Bưu phẩm {j + 1}',
+                              status='received' if received else 'waiting',
+                              received_at=now - timedelta(days=rng.randrange(60)) if received else None))
+    Item.objects.bulk_create(items, batch_size=batch_size)
+    return len(locker_ids), len(items)
+
+
+def _seed_visitors(counts, residents, rng, batch_size):
+    start = _next_number(Visitor)
+    return _insert(Visitor, [Visitor(resident_id=rng.choice(residents)[0], full_name=f'Người thân {start + i}',
+                                     identity_card=f'V{start + i:011d}', phone=f'08{(start + i) % 10 ** 8:08d}',
+                                     relationship_to_resident=rng.choice(['Con', 'Cha/Mẹ', 'Anh/Chị', 'Bạn']),
+                                     is_approved=rng.random() < 0.8)
+                             for i in range(counts['visitors'])], batch_size)
+
+
+def _seed_parking_cards(residents, visitor_ids, rng, batch_size):
+    start = _next_number(ParkingCard)
+    owners = [{'resident_id': r[0]} for r in residents if rng.random() < 0.4] + \
+             [{'visitor_id': v} for v in visitor_ids if rng.random() < 0.2]
+    cards = [ParkingCard(**owner, card_number=f'P{start + i:09d}',
+                         license_plate=f'{rng.randrange(10, 100)}{rng.choice("ABCDEFGH")}-'
+                                       f'{rng.randrange(100, 1000)}.{rng.randrange(10, 100)}',
+                         vehicle_type=rng.choice(['car', 'motorbike', 'motorbike', 'bike']))
+             for i, owner in enumerate(owners)]
+    ParkingCard.objects.bulk_create(cards, batch_size=batch_size)
+    return len(cards)
+
+
+def _seed_invoices(apartment_ids, rng, batch_size):
+    """Mỗi căn hộ 1 hoá đơn cho mỗi loại phí trong MONTHS kỳ gần nhất, kỳ càng cũ càng nhiều khả năng đã trả."""
+    fee_types = [(FeeType.objects.get_or_create(name=name)[0].id, amount) for name, amount in FEES.items()]
+    today = timezone.localdate().replace(day=1)
+    periods = []
+    for months_ago in range(MONTHS, 0, -1):
+        year, month = divmod(today.year * 12 + today.month - 1 - months_ago, 12)
+        periods.append((date(year, month + 1, 1), months_ago))
+
+    heads = dict(Apartment.objects.filter(id__in=apartment_ids).values_list('id', 'household_head_id'))
+
+    invoices = payments = 0
+    batch = []
+    for apartment_id in apartment_ids:
+        for period, months_ago in periods:
+            for fee_type_id, amount in fee_types:
+                batch.append(Invoice(apartment_id=apartment_id, resident_id=heads[apartment_id],
+                                     fee_type_id=fee_type_id, amount=amount, period=period,
+                                     due_date=period + timedelta(days=14),
+                                     paid=rng.random() < 1 - 0.5 / months_ago))
+        if len(batch) >= batch_size:
+            invoices, payments = invoices + len(batch), payments + _insert_invoices(batch, rng, batch_size)
+            batch = []
+    if batch:
+        invoices, payments = invoices + len(batch), payments + _insert_invoices(batch, rng, batch_size)
+    return invoices, payments
+
+
+def _insert_invoices(invoices, rng, batch_size):
+    ids = _insert(Invoice, invoices, batch_size)
+    payments = []
+    for invoice_id, invoice in zip(ids, invoices):
+        if invoice.paid:
+            status = 'approved'
+        elif rng.random() < 0.1:
+            status = 'pending'
+        else:
+            continue
+        payments.append(Payment(resident_id=invoice.resident_id, invoice_id=invoice_id,
+                                method=rng.choice(['momo', 'vnpay']), status=status))
+    Payment.objects.bulk_create(payments, batch_size=batch_size)
+    return len(payments)
+
+
+def _seed_complaints(counts, residents, admin_id, rng, batch_size):
+    rows = [Complaint(resident_id=rng.choice(residents)[0], title=f'Phản ánh {i + 1}',
+                      content=f'<p>Nội dung phản ánh số {i + 1}</p>',
+                      **({'status': 'resolved', 'is_resolved': True} if rng.random() < 0.6 else {}))
+            for i in range(counts['complaints'])]
+    ids = _insert(Complaint, rows, batch_size)
+    responses = [ComplaintResponse(complaint_id=complaint_id, responder_id=admin_id, content='<p>Đã xử lý</p>')
+                 for complaint_id, row in zip(ids, rows) if row.is_resolved]
+    ComplaintResponse.objects.bulk_create(responses, batch_size=batch_size)
+    search.index_complaints(ids)
+    return len(ids), len(responses)
+
+
+def _seed_surveys(counts, user_ids, rng, batch_size):
+    """Mỗi khảo sát 5 câu hỏi x 4 lựa chọn, khoảng 1/2 tài khoản đã trả lời."""
+    now = timezone.now()
+    survey_ids = _insert(Survey, [Survey(title=f'Khảo sát {i + 1}', deadline=now + timedelta(days=30 - 20 * i))
+                                  for i in range(counts['surveys'])], batch_size)
+    question_rows = [Question(survey_id=survey_id, text=f'Câu hỏi {j + 1}', type=rng.choice(['single', 'multiple']))
+                     for survey_id in survey_ids for j in range(5)]
+    question_ids = _insert(Question, question_rows, batch_size)
+    choice_rows = [Choice(question_id=question_id, text=f'Lựa chọn {k + 1}') for question_id in question_ids
+                   for k in range(4)]
+    choice_ids = _insert(Choice, choice_rows, batch_size)
+
+    questions = {}  # survey_id -> [(question_id, type, [choice_id, ...])]
+    for n, (question_id, question) in enumerate(zip(question_ids, question_rows)):
+        questions.setdefault(question.survey_id, []).append((question_id, question.type,
+                                                             choice_ids[n * 4:n * 4 + 4]))
+
+    response_rows = [SurveyResponse(survey_id=survey_id, user_id=user_id)
+                     for survey_id in survey_ids for user_id in user_ids if rng.random() < 0.5]
+    response_ids = _insert(SurveyResponse, response_rows, batch_size)
+
+    answer_rows, picked = [], []
+    for response_id, response in zip(response_ids, response_rows):
+        for question_id, question_type, question_choices in questions[response.survey_id]:
+            answer_rows.append(Answer(response_id=response_id, question_id=question_id))
+            picked.append(rng.sample(question_choices, rng.randint(1, 2) if question_type == 'multiple' else 1))
+    answer_ids = _insert(Answer, answer_rows, batch_size)
+
+    Through = Answer.choices.through
+    Through.objects.bulk_create([Through(answer_id=answer_id, choice_id=choice_id)
+                                 for answer_id, choices in zip(answer_ids, picked) for choice_id in choices],
+                                batch_size=batch_size)
+
+    for survey in Survey.objects.filter(id__in=survey_ids):
+        surveys.rebuild_tallies(survey)
+    return len(response_ids), len(answer_ids)
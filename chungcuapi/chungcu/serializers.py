@@ -1,5 +1,29 @@
-from rest_framework.serializers import CharField, ModelSerializer, PrimaryKeyRelatedField, StringRelatedField
+from rest_framework.serializers import BooleanField, CharField, ChoiceField, DateField, DateTimeField, \
+    DecimalField, FileField, FloatField, IntegerField, ListField, ModelSerializer, PrimaryKeyRelatedField, Serializer, \
+    StringRelatedField
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+
 from chungcu.models import *
+from chungcu import surveys, identity, ledger, media
+from rest_framework.exceptions import ValidationError
+
+class MediaSerializerMixin:
+    # Các trường ảnh tải lên nền qua chungcu.media: ghi nhận file ngay, response trả về url và trạng thái
+    media_fields = ()
+
+    def pop_media(self, validated_data):
+        return {field: validated_data.pop(field) for field in self.media_fields if validated_data.get(field)}
+
+    def spool_media(self, instance, files):
+        for field, uploaded_file in files.items():
+            media.spool(instance, field, uploaded_file)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        for field in self.media_fields:
+            data[field], data[f'{field}_status'] = media.describe(instance, field)
+        return data
 
 class IamgeSerializer(ModelSerializer):
     def to_representation(self, instance):
@@ -37,6 +61,31 @@ class ResidentDetailSerializer(ResidentSerializer):
         model = ResidentSerializer.Meta.model
         fields = ResidentSerializer.Meta.fields + ['birthday', 'identity_card', 'gender', 'phone']
 
+# Các dòng trong file CSV nhập hàng loạt, chỉ kiểm tra định dạng (không truy vấn DB)
+class ApartmentImportRowSerializer(Serializer):
+    building_id = IntegerField()
+    number = CharField(max_length=10)
+    floor = IntegerField(min_value=1)
+    price = FloatField(min_value=0)
+    area = DecimalField(max_digits=6, decimal_places=2)
+
+
+class ResidentImportRowSerializer(Serializer):
+    building_id = IntegerField()
+    apartment_number = CharField(max_length=10)
+    name = CharField(max_length=100)
+    identity_card = CharField(max_length=12)
+    gender = ChoiceField(choices=Resident._meta.get_field('gender').choices)
+    birthday = DateField()
+    phone = CharField(max_length=10)
+    relationship_to_head = ChoiceField(choices=Resident._meta.get_field('relationship_to_head').choices)
+
+
+class ImportSerializer(Serializer):
+    file = FileField()
+    dry_run = BooleanField(default=False)
+
+
 class ItemSerializer(ModelSerializer):
     class Meta:
         model = Item
@@ -58,11 +107,22 @@ class ParkingCardSerializer(ModelSerializer):
         model = ParkingCard
         fields = ['id', 'card_number','resident','visitor']
 
+    def validate(self, attrs):
+        # Giống ràng buộc parkingcard_single_owner trong DB (DRF không kiểm tra CheckConstraint)
+        resident = attrs['resident'] if 'resident' in attrs else getattr(self.instance, 'resident_id', None)
+        visitor = attrs['visitor'] if 'visitor' in attrs else getattr(self.instance, 'visitor_id', None)
+        if (resident is None) == (visitor is None):
+            raise ValidationError('Thẻ phải thuộc về đúng 1 trong 2: cư dân hoặc người thân.')
+        return attrs
+
 class ParkingCardDetailSerializer(ParkingCardSerializer):
     class Meta:
         model = ParkingCardSerializer.Meta.model
         fields = ParkingCardSerializer.Meta.fields + ['vehicle_type','license_plate', 'color']
 
+class GateCheckSerializer(Serializer):
+    plate = CharField(max_length=20)
+
 class VisitorSerializer(ModelSerializer):
     class Meta:
         model = Visitor
@@ -80,6 +140,25 @@ class VisitorDetailSerializer(VisitorSerializer):
         fields = VisitorSerializer.Meta.fields + ['resident','is_approved','parking_card']
 
 
+class VisitorCardSerializer(Serializer):
+    visitor = IntegerField()
+    license_plate = CharField(max_length=20)
+    vehicle_type = ChoiceField(choices=ParkingCard._meta.get_field('vehicle_type').choices)
+    color = CharField(max_length=20, required=False)
+
+class VisitorApprovalSerializer(Serializer):
+    visitor_ids = ListField(child=IntegerField(), allow_empty=False, max_length=1000)
+    cards = VisitorCardSerializer(many=True, required=False)
+
+    def validate(self, attrs):
+        visitors = [card['visitor'] for card in attrs.get('cards', [])]
+        if len(visitors) != len(set(visitors)):
+            raise ValidationError({'cards': 'Mỗi người thân chỉ được cấp 1 thẻ.'})
+        if not set(visitors) <= set(attrs['visitor_ids']):
+            raise ValidationError({'cards': 'Chỉ cấp thẻ cho người thân có trong visitor_ids.'})
+        return attrs
+
+
 class FeeTypeSerializer(ModelSerializer):
     class Meta:
         model = FeeType
@@ -94,6 +173,14 @@ class InvoiceSerializer(ModelSerializer):
         model = Invoice
         fields = ['id','resident','fee_type','fee_type_id','amount', 'paid']
 
+    def update(self, instance, validated_data):
+        # Sửa hoá đơn đi qua ledger để Balance không lệch
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        if 'resident' in validated_data:
+            instance.apartment_id = instance.resident.apartment_id
+        return ledger.save_invoice(instance)
+
 class InvoiceCreateSerializer(InvoiceSerializer):
     class Meta:
         model = InvoiceSerializer.Meta.model
@@ -104,9 +191,65 @@ class InvoiceCreateSerializer(InvoiceSerializer):
         resident = validated_data.get('resident')
 
         # Gán apartment từ resident
-        validated_data['apartment'] = resident.apartment
+        validated_data['apartment_id'] = resident.apartment_id
 
-        return super().create(validated_data)
+        return ledger.save_invoice(Invoice(**validated_data))
+
+
+class InvoiceGenerateSerializer(Serializer):
+    fee_type = PrimaryKeyRelatedField(queryset=FeeType.objects.all())
+    period = DateField(input_formats=['%Y-%m', '%Y-%m-%d'])
+    amount = DecimalField(max_digits=10, decimal_places=2)
+    due_date = DateField()
+    buildings = ListField(child=IntegerField(), required=False)
+    batch_size = IntegerField(min_value=1, max_value=10000, default=1000)
+
+
+# Bộ lọc (query params) dùng chung cho danh sách và file xuất
+class DirectoryQuerySerializer(Serializer):
+    q = CharField(min_length=2, max_length=100)
+    limit = IntegerField(required=False, default=10, min_value=1, max_value=50)
+
+
+class DirectoryResidentSerializer(ModelSerializer):
+    apartment_number = CharField(source='apartment.number', read_only=True)
+    building_name = CharField(source='apartment.building.name', read_only=True)
+
+    class Meta:
+        model = Resident
+        fields = ['id', 'name', 'phone', 'identity_card', 'relationship_to_head', 'active',
+                  'apartment', 'apartment_number', 'building_name']
+
+
+class DirectoryVisitorSerializer(ModelSerializer):
+    resident_name = CharField(source='resident.name', read_only=True)
+    apartment_number = CharField(source='resident.apartment.number', read_only=True)
+
+    class Meta:
+        model = Visitor
+        fields = ['id', 'full_name', 'phone', 'identity_card', 'is_approved', 'active',
+                  'resident', 'resident_name', 'apartment_number']
+
+
+class ListFilterSerializer(Serializer):
+    building_id = IntegerField(required=False)
+    apartment_id = IntegerField(required=False)
+    fee_type_id = IntegerField(required=False)
+    paid = BooleanField(required=False)
+    status = CharField(required=False)
+    from_date = DateField(required=False)
+    to_date = DateField(required=False)
+
+    def validate(self, attrs):
+        if attrs.get('from_date') and attrs.get('to_date') and attrs['from_date'] > attrs['to_date']:
+            raise ValidationError({'to_date': 'Ngày kết thúc phải sau ngày bắt đầu.'})
+        return attrs
+
+
+class BalanceSummarySerializer(Serializer):
+    outstanding = DecimalField(max_digits=14, decimal_places=2)
+    overdue = DecimalField(max_digits=14, decimal_places=2)
+    oldest_due_date = DateField(allow_null=True)
 
 
 class InvoiceDetailSerializer(InvoiceSerializer):
@@ -119,7 +262,9 @@ class InvoiceDetailSerializer(InvoiceSerializer):
             'apartment_number', 'resident', 'resident_name', 'due_date'
         ]
 
-class PaymentSerializer(ModelSerializer):
+class PaymentSerializer(MediaSerializerMixin, ModelSerializer):
+    media_fields = ('proof_image',)
+    proof_image = FileField(write_only=True, required=False)
     resident = PrimaryKeyRelatedField(read_only=True)
     resident_name = CharField(source='resident.name', read_only=True)
     invoice = InvoiceSerializer(read_only=True)
@@ -141,11 +286,44 @@ class PaymentSerializer(ModelSerializer):
 
     def create(self, validated_data):
         user = self.context['request'].user
-        resident = getattr(user, 'resident', None)
-        if not resident:
+        resident_id = identity.resolve(user).resident_id
+        if not resident_id:
             raise ValidationError({'resident': 'User is not linked to any resident.'})
-        validated_data['resident'] = resident
-        return super().create(validated_data)
+        validated_data['resident_id'] = resident_id
+
+        files = self.pop_media(validated_data)
+        with transaction.atomic():
+            payment = super().create(validated_data)
+            self.spool_media(payment, files)
+        return payment
+
+    def update(self, instance, validated_data):
+        files = self.pop_media(validated_data)
+        with transaction.atomic():
+            payment = super().update(instance, validated_data)
+            self.spool_media(payment, files)
+        return payment
+
+class PaymentBulkSerializer(Serializer):
+    ids = ListField(child=IntegerField(), allow_empty=False, max_length=5000)
+
+
+class HouseholdHeadSerializer(Serializer):
+    apartment = IntegerField()
+    resident = IntegerField()
+
+class HouseholdReassignSerializer(Serializer):
+    heads = HouseholdHeadSerializer(many=True, allow_empty=False, max_length=1000)
+    previous_relationship = ChoiceField(choices=[choice for choice in Resident.relationship_to_head.field.choices
+                                                 if choice[0] != 'owner'], default='other')
+
+    def validate_heads(self, value):
+        apartments = [head['apartment'] for head in value]
+        residents = [head['resident'] for head in value]
+        if len(apartments) != len(set(apartments)) or len(residents) != len(set(residents)):
+            raise ValidationError('Mỗi căn hộ chỉ có 1 chủ hộ và mỗi cư dân chỉ làm chủ hộ 1 căn hộ.')
+        return {head['apartment']: head['resident'] for head in value}
+
 
 class ComplaintResponseSerializer(ModelSerializer):
     class Meta:
@@ -180,6 +358,18 @@ class ComplaintDetailSerializer(ComplaintSerializer):
         model = ComplaintSerializer.Meta.model
         fields = ComplaintSerializer.Meta.fields + ['content','responses']
 
+class ComplaintSearchQuerySerializer(Serializer):
+    q = CharField(source='query', max_length=200)
+    status = CharField(required=False)
+    building_id = IntegerField(required=False)
+
+class ComplaintSearchSerializer(ComplaintSerializer):
+    # Độ liên quan (MySQL: MATCH ... AGAINST, SQLite: bm25), càng lớn càng khớp
+    score = FloatField(read_only=True, allow_null=True)
+    class Meta:
+        model = ComplaintSerializer.Meta.model
+        fields = ComplaintSerializer.Meta.fields + ['score']
+
 class ComplaintResponseDetailSerializer(ComplaintResponseSerializer):
     complaint = ComplaintSerializer(many=False)
     class Meta:
@@ -210,6 +400,14 @@ class SurveyDetailSerializer(SurveySerializer):
         fields = SurveySerializer.Meta.fields + ['description', 'deadline', 'questions']
 
 
+class SurveyStatusSerializer(SurveySerializer):
+    has_responded = BooleanField(read_only=True)
+
+    class Meta:
+        model = SurveySerializer.Meta.model
+        fields = SurveySerializer.Meta.fields + ['description', 'deadline', 'has_responded']
+
+
 class SurveyCreateSerializer(ModelSerializer):
     questions = QuestionSerializer(many=True)
 
@@ -218,21 +416,21 @@ class SurveyCreateSerializer(ModelSerializer):
         fields = ['title', 'description', 'deadline', 'questions']
 
     def create(self, validated_data):
-        questions_data = validated_data.pop('questions')
-        survey = Survey.objects.create(**validated_data)
-        for question_data in questions_data:
-            choices_data = question_data.pop('choices')
-            question = Question.objects.create(survey=survey, **question_data)
-            for choice_data in choices_data:
-                Choice.objects.create(question=question, **choice_data)
-        return survey
+        return surveys.create_survey(validated_data.pop('questions'), **validated_data)
 
 
-class AnswerSerializer(ModelSerializer):
-    choices = PrimaryKeyRelatedField(many=True, queryset=Choice.objects.all())
-    class Meta:
-        model = Answer
-        fields = ['question','choices']
+class SurveyCloneSerializer(Serializer):
+    title = CharField(max_length=255, required=False)
+    deadline = DateTimeField(required=False, allow_null=True)
+
+
+class AnswerSerializer(Serializer):
+    # id thuần, kiểm tra 1 lần với bản đồ câu hỏi / lựa chọn của khảo sát thay vì 1 câu SQL cho mỗi id
+    question = IntegerField()
+    choices = ListField(child=IntegerField(), allow_empty=False, max_length=100)
+
+    def to_representation(self, instance):
+        return {'question': instance.question_id, 'choices': [choice.id for choice in instance.choices.all()]}
 
 class SurveyResponseSerializer(ModelSerializer):
     answers = AnswerSerializer(many=True)
@@ -241,18 +439,33 @@ class SurveyResponseSerializer(ModelSerializer):
         fields = ['id','survey','answers']
         read_only_fields = ['survey']
 
-    def create(self, validated_data):
-        user = self.context['request'].user
-        answers_data = validated_data.pop('answers')
-        response = SurveyResponse.objects.create(user=user, **validated_data)
-
-        for answer_data in answers_data:
-            choices = answer_data.pop('choices')
-            answer = Answer.objects.create(response=response, **answer_data)
-            answer.choices.set(choices)
+    def validate_answers(self, answers):
+        questions = surveys.choice_map(self.context['survey'].id)
+        errors, seen = {}, set()
+        for answer in answers:
+            question_id, choices = answer['question'], answer['choices']
+            if question_id not in questions:
+                errors[question_id] = 'Câu hỏi không thuộc khảo sát này.'
+            elif question_id in seen:
+                errors[question_id] = 'Mỗi câu hỏi chỉ trả lời 1 lần.'
+            elif not set(choices) <= questions[question_id][1]:
+                errors[question_id] = 'Lựa chọn không thuộc câu hỏi này.'
+            elif len(set(choices)) != len(choices):
+                errors[question_id] = 'Lựa chọn bị trùng.'
+            elif questions[question_id][0] == 'single' and len(choices) != 1:
+                errors[question_id] = 'Câu hỏi này chỉ được chọn 1 lựa chọn.'
+            seen.add(question_id)
+        if errors:
+            raise ValidationError(errors)
+        return answers
 
+    def create(self, validated_data):
+        response = surveys.submit_response(validated_data['survey'].id, self.context['request'].user,
+                                           [(a['question'], a['choices']) for a in validated_data['answers']])
+        prefetch_related_objects([response], 'answers__choices')
         return response
 
+
 class AnswerDisplaySerializer(ModelSerializer):
     question = CharField(source='question.text')
     choices = ChoiceSerializer(many=True)
@@ -271,7 +484,9 @@ class SurveyResponseDisplaySerializer(ModelSerializer):
         fields = ['id', 'user', 'answers']
 
 
-class UserSerializer(ModelSerializer):
+class UserSerializer(MediaSerializerMixin, ModelSerializer):
+    media_fields = ('avatar',)
+    avatar = FileField(write_only=True, required=False)
     resident = PrimaryKeyRelatedField(queryset=Resident.objects.all(),
                                                   write_only=True)  # Chỉ chọn resident có sẵn
 
@@ -282,7 +497,6 @@ class UserSerializer(ModelSerializer):
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
-        data['avatar'] = instance.avatar.url if instance.avatar else ''
 
         # Kiểm tra nếu instance có thuộc tính resident
         if hasattr(instance, 'resident'):
@@ -299,14 +513,13 @@ class UserSerializer(ModelSerializer):
     def create(self, validated_data):
         resident = validated_data.pop('resident', None)  # Lấy resident từ validated_data
         password = validated_data.pop('password', None)
-        avatar = validated_data.pop('avatar', None)
+        files = self.pop_media(validated_data)
 
         user = User(**validated_data)
         if password:
             user.set_password(password)
-        if avatar:
-            user.avatar = avatar
         user.save()
+        self.spool_media(user, files)
 
         # Gán resident đã có sẵn cho user
         if resident:
@@ -319,3 +532,9 @@ class UserSerializer(ModelSerializer):
 
         return user
 
+    def update(self, instance, validated_data):
+        files = self.pop_media(validated_data)
+        user = super().update(instance, validated_data)
+        self.spool_media(user, files)
+        return user
+
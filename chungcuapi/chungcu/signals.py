@@ -0,0 +1,93 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from chungcu import caching, gate, identity, search
+from chungcu.models import Apartment, Complaint, ComplaintResponse, ComplaintSearchDocument, ParkingCard, Resident, \
+    Visitor
+
+
+# Xoá cache identity khi cư dân đổi tài khoản hoặc đổi căn hộ
+@receiver(pre_save, sender=Resident)
+def remember_resident_user(sender, instance, **kwargs):
+    # Cư dân đọc từ DB đã có sẵn giá trị cũ (Resident.from_db), chỉ SELECT lại với object tự dựng có pk
+    loaded = getattr(instance, '_loaded', None)
+    if loaded is None and instance.pk and not instance._state.adding:
+        loaded = Resident.objects.filter(pk=instance.pk).values_list('user_id', 'apartment_id').first()
+    instance._previous_user_id, instance._previous_apartment_id = loaded or (None, None)
+
+
+@receiver(post_save, sender=Resident)
+def invalidate_resident_identity(sender, instance, **kwargs):
+    identity.invalidate(instance.user_id, getattr(instance, '_previous_user_id', None))
+
+
+@receiver(post_save, sender=Resident)
+def remember_saved_resident(sender, instance, **kwargs):
+    # lần save tiếp theo của cùng object so với giá trị vừa lưu
+    instance.remember_loaded()
+
+
+@receiver(post_delete, sender=Resident)
+def invalidate_deleted_resident_identity(sender, instance, **kwargs):
+    identity.invalidate(instance.user_id)
+
+
+# Căn hộ đổi chung cư → building_id của các cư dân trong căn hộ thay đổi
+@receiver(post_save, sender=Apartment)
+def invalidate_apartment_identity(sender, instance, created, **kwargs):
+    if not created:
+        identity.invalidate(*instance.residents.exclude(user__isnull=True).values_list('user_id', flat=True))
+
+
+# Index tìm kiếm phản ánh: dựng lại văn bản khi phản ánh hoặc phản hồi thay đổi
+@receiver(post_save, sender=Complaint)
+def index_saved_complaint(sender, instance, **kwargs):
+    search.index_complaints([instance.id])
+
+
+@receiver(post_save, sender=ComplaintResponse)
+def index_saved_response(sender, instance, **kwargs):
+    search.index_complaints([instance.complaint_id])
+
+
+@receiver(post_delete, sender=ComplaintResponse)
+def index_deleted_response(sender, instance, origin=None, **kwargs):
+    # Bỏ qua khi phản hồi bị xoá dây chuyền theo phản ánh (phản ánh cũng sắp bị xoá)
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if model is ComplaintResponse:
+        search.index_complaints([instance.complaint_id])
+
+
+@receiver(post_save, sender=Resident)
+def move_resident_search_documents(sender, instance, created, **kwargs):
+    if not created and instance.apartment_id != getattr(instance, '_previous_apartment_id', None):
+        ComplaintSearchDocument.objects.filter(complaint__resident=instance) \
+            .update(building_id=Apartment.objects.filter(pk=instance.apartment_id).values('building_id'))
+
+
+@receiver(post_save, sender=Apartment)
+def move_apartment_search_documents(sender, instance, created, **kwargs):
+    if not created:
+        ComplaintSearchDocument.objects.filter(complaint__resident__apartment=instance) \
+            .exclude(building_id=instance.building_id).update(building_id=instance.building_id)
+
+
+# Kết quả kiểm tra biển số ở cổng phụ thuộc thẻ xe, trạng thái cư dân và duyệt khách
+def invalidate_gate(sender, **kwargs):
+    gate.invalidate()
+
+
+for model in (ParkingCard, Resident, Visitor):
+    post_save.connect(invalidate_gate, sender=model, dispatch_uid=f'gate_save_{model.__name__}')
+    post_delete.connect(invalidate_gate, sender=model, dispatch_uid=f'gate_delete_{model.__name__}')
+
+
+# Response cache: tăng version của model mỗi khi có bản ghi được lưu / xoá
+def bump_response_cache(sender, **kwargs):
+    caching.bump(sender)
+
+
+for model in caching.WATCHED_MODELS:
+    post_save.connect(bump_response_cache, sender=model, dispatch_uid=f'response_cache_save_{model.__name__}')
+    post_delete.connect(bump_response_cache, sender=model, dispatch_uid=f'response_cache_delete_{model.__name__}')
@@ -0,0 +1,134 @@
+from django.db import transaction
+from django.db.models import Count, F, Prefetch
+
+from chungcu import caching
+from chungcu.models import Answer, Choice, ChoiceTally, Question, QuestionTally, Survey, SurveyResponse
+
+
+@transaction.atomic
+def create_survey(questions, **fields):
+    """
+    Tạo khảo sát kèm câu hỏi và lựa chọn bằng số câu SQL cố định (bulk_create), không phụ thuộc số câu hỏi.
+    questions: danh sách dict của Question, mỗi dict có thêm 'choices' là danh sách dict của Choice.
+    """
+    survey = Survey.objects.create(**fields)
+
+    created = [Question(survey=survey, **{k: v for k, v in q.items() if k != 'choices'}) for q in questions]
+    Question.objects.bulk_create(created)
+    if created and created[0].pk is None:
+        # MySQL không trả id khi bulk_create: đọc lại theo thứ tự chèn, khảo sát mới nên chỉ có các câu hỏi này
+        for question, pk in zip(created, Question.objects.filter(survey=survey).order_by('id')
+                                .values_list('id', flat=True)):
+            question.pk = pk
+
+    Choice.objects.bulk_create([Choice(question=question, **choice)
+                                for question, q in zip(created, questions) for choice in q.get('choices', [])])
+    # bulk_create không gửi signal nên tự làm mất hiệu lực response cache
+    caching.bump(Question, Choice)
+    return survey
+
+
+def clone_survey(survey, **fields):
+    """Sao chép khảo sát (làm mẫu) cùng câu hỏi và lựa chọn theo đúng thứ tự, không sao chép phiếu trả lời."""
+    questions = [{'text': q.text, 'type': q.type, 'choices': [{'text': c.text} for c in q.choices.all()]}
+                 for q in survey.questions.order_by('id')
+                 .prefetch_related(Prefetch('choices', queryset=Choice.objects.order_by('id')))]
+    fields = {'title': f'{survey.title} (bản sao)', 'description': survey.description,
+              'deadline': survey.deadline, **fields}
+    return create_survey(questions, **fields)
+
+
+def choice_map(survey_id):
+    """{question_id: (type, {choice_id, ...})} của 1 khảo sát, 1 câu SQL (LEFT JOIN lựa chọn)."""
+    questions = {}
+    for question_id, question_type, choice_id in Question.objects.filter(survey_id=survey_id) \
+            .order_by().values_list('id', 'type', 'choices__id'):
+        choices = questions.setdefault(question_id, (question_type, set()))[1]
+        if choice_id is not None:
+            choices.add(choice_id)
+    return questions
+
+
+@transaction.atomic
+def submit_response(survey_id, user, answers):
+    """
+    Ghi 1 phiếu trả lời đã kiểm tra bằng số câu SQL cố định: Answer và bảng trung gian Answer.choices
+    đều dùng bulk_create. answers: danh sách (question_id, [choice_id, ...])
+    """
+    response = SurveyResponse.objects.create(survey_id=survey_id, user=user)
+
+    rows = [Answer(response=response, question_id=question_id) for question_id, _ in answers]
+    Answer.objects.bulk_create(rows)
+    if rows and rows[0].pk is None:
+        # MySQL không trả id khi bulk_create, phiếu mới nên chỉ có các câu trả lời này
+        for answer, pk in zip(rows, Answer.objects.filter(response=response).order_by('id')
+                              .values_list('id', flat=True)):
+            answer.pk = pk
+
+    Through = Answer.choices.through
+    Through.objects.bulk_create([Through(answer_id=answer.pk, choice_id=choice_id)
+                                 for answer, (_, choices) in zip(rows, answers) for choice_id in choices])
+
+    record_response(survey_id, answers)
+    return response
+
+
+def record_response(survey_id, answers):
+    """
+    Cộng dồn 1 phiếu trả lời vào bảng đếm.
+    answers: danh sách (question_id, [choice_id, ...])
+    """
+    question_ids = {question_id for question_id, _ in answers}
+    choice_ids = {choice_id for _, choices in answers for choice_id in choices}
+
+    # Tạo sẵn dòng đếm nếu câu hỏi / lựa chọn chưa có ai trả lời
+    QuestionTally.objects.bulk_create([QuestionTally(survey_id=survey_id, question_id=q) for q in question_ids],
+                                      ignore_conflicts=True)
+    ChoiceTally.objects.bulk_create([ChoiceTally(survey_id=survey_id, choice_id=c) for c in choice_ids],
+                                    ignore_conflicts=True)
+
+    QuestionTally.objects.filter(question_id__in=question_ids).update(count=F('count') + 1)
+    ChoiceTally.objects.filter(choice_id__in=choice_ids).update(count=F('count') + 1)
+
+
+@transaction.atomic
+def rebuild_tallies(survey):
+    # Đếm lại từ đầu bằng GROUP BY trên bảng Answer và bảng trung gian Answer.choices
+    question_counts = Answer.objects.filter(response__survey=survey) \
+        .values('question_id').annotate(n=Count('response_id', distinct=True))
+    choice_counts = Answer.choices.through.objects.filter(answer__response__survey=survey) \
+        .values('choice_id').annotate(n=Count('answer__response_id', distinct=True))
+
+    QuestionTally.objects.filter(survey=survey).delete()
+    ChoiceTally.objects.filter(survey=survey).delete()
+    QuestionTally.objects.bulk_create([QuestionTally(survey=survey, question_id=row['question_id'], count=row['n'])
+                                       for row in question_counts])
+    ChoiceTally.objects.bulk_create([ChoiceTally(survey=survey, choice_id=row['choice_id'], count=row['n'])
+                                     for row in choice_counts])
+
+
+def get_results(survey):
+    question_counts = dict(QuestionTally.objects.filter(survey=survey).values_list('question_id', 'count'))
+    choice_counts = dict(ChoiceTally.objects.filter(survey=survey).values_list('choice_id', 'count'))
+
+    questions = []
+    for question in survey.questions.prefetch_related('choices'):
+        total = question_counts.get(question.id, 0)
+        choices = []
+        for choice in question.choices.all():
+            count = choice_counts.get(choice.id, 0)
+            choices.append({
+                'id': choice.id,
+                'text': choice.text,
+                'count': count,
+                'percent': round(count * 100 / total, 2) if total else 0,
+            })
+        questions.append({
+            'id': question.id,
+            'text': question.text,
+            'type': question.type,
+            'total': total,
+            'choices': choices,
+        })
+
+    return {'id': survey.id, 'title': survey.title, 'questions': questions}
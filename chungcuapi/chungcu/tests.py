@@ -1,3 +1,1244 @@
+import os
+import shutil
+import tempfile
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from chungcu import benchmark, billing, exports, gate, identity, imports, ledger, media, perms, search, seeding, \
+    surveys, visitors
+from chungcu.admin import admin_site
+from chungcu.models import *
+
+
+def create_building(name='A'):
+    return Building.objects.create(name=name, address='Q1', area=1000, total_apartment=10)
+
+
+def create_apartment(building, number='101', floor=1):
+    return Apartment.objects.create(number=number, floor=floor, price=1, area=50, building=building)
+
+
+def create_resident(apartment, name='Cư dân', identity_card='001', **fields):
+    # Mặc định là chủ hộ, các test chỉ truyền những trường cần khác đi
+    fields = {'gender': 'Male', 'birthday': date(1990, 1, 1), 'phone': '0900000000',
+              'relationship_to_head': 'owner', **fields}
+    return Resident.objects.create(name=name, identity_card=identity_card, apartment=apartment, **fields)
+
+
+class ResidentSurveysTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='cudan', password='123')
+        building = create_building()
+        apartment = create_apartment(building)
+        self.resident = create_resident(apartment, user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/residents/{self.resident.id}/surveys/'
+
+    def create_surveys(self, n, deadline=None):
+        return Survey.objects.bulk_create([Survey(title=f'Khảo sát {i}', deadline=deadline) for i in range(n)])
+
+    def count_queries(self, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_surveys(self):
+        self.create_surveys(3)
+        few = self.count_queries()
+
+        self.create_surveys(30)
+        many = self.count_queries()
+
+        self.assertEqual(few, many)
+
+    def test_has_responded(self):
+        answered, other = Survey.objects.create(title='Đã trả lời'), Survey.objects.create(title='Chưa trả lời')
+        SurveyResponse.objects.create(survey=answered, user=self.user)
+
+        results = {s['id']: s['has_responded'] for s in self.client.get(self.url).data['results']}
+
+        self.assertEqual(results, {answered.id: True, other.id: False})
+
+    def test_filter_by_deadline(self):
+        now = timezone.now()
+        opened = Survey.objects.create(title='Còn hạn', deadline=now + timedelta(days=1))
+        no_deadline = Survey.objects.create(title='Không hạn')
+        closed = Survey.objects.create(title='Hết hạn', deadline=now - timedelta(days=1))
+
+        open_ids = {s['id'] for s in self.client.get(self.url, {'status': 'open'}).data['results']}
+        closed_ids = {s['id'] for s in self.client.get(self.url, {'status': 'closed'}).data['results']}
+
+        self.assertEqual(open_ids, {opened.id, no_deadline.id})
+        self.assertEqual(closed_ids, {closed.id})
+
+
+class HotPathIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cudan', password='123')
+        building = create_building()
+        apartment = create_apartment(building)
+        cls.resident = create_resident(apartment, user=cls.user)
+        fee_type = FeeType.objects.create(name='Phí quản lý')
+        cls.invoice = Invoice.objects.create(apartment=apartment, resident=cls.resident, fee_type=fee_type,
+                                             amount=100, due_date=date(2025, 1, 1))
+        cls.survey = Survey.objects.create(title='Khảo sát')
+
+    def assertUsesIndex(self, queryset, *index_names):
+        plan = queryset.explain()
+        self.assertTrue(any(name in plan for name in index_names), plan)
+
+    def test_invoice_indexes(self):
+        self.assertUsesIndex(Invoice.objects.filter(resident=self.resident, paid=False), 'invoice_resident_paid_idx')
+        self.assertUsesIndex(Invoice.objects.filter(apartment_id=self.invoice.apartment_id, paid=False),
+                             'invoice_apartment_paid_idx')
+        self.assertUsesIndex(Invoice.objects.filter(due_date__lt=date(2025, 6, 1)).order_by('due_date'),
+                             'invoice_due_date_idx')
+
+    def test_payment_index(self):
+        self.assertUsesIndex(Payment.objects.filter(resident=self.resident, status='pending'),
+                             'payment_resident_status_idx')
+
+    def test_complaint_index(self):
+        self.assertUsesIndex(Complaint.objects.filter(resident=self.resident, status='pending'),
+                             'complaint_resident_status_idx')
+
+    def test_visitor_index(self):
+        self.assertUsesIndex(Visitor.objects.filter(resident=self.resident, is_approved=False),
+                             'visitor_resident_approved_idx')
+
+    def test_survey_response_unique(self):
+        # SQLite tạo ràng buộc unique thành sqlite_autoindex_* khi dựng lại bảng
+        self.assertUsesIndex(SurveyResponse.objects.filter(user=self.user, survey=self.survey),
+                             'unique_survey_response', 'sqlite_autoindex_chungcu_surveyresponse')
+
+        SurveyResponse.objects.create(user=self.user, survey=self.survey)
+        with self.assertRaises(IntegrityError):
+            SurveyResponse.objects.create(user=self.user, survey=self.survey)
+
+    def test_submit_survey_twice(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = f'/residents/{self.resident.id}/surveys/{self.survey.id}/responses/'
+
+        self.assertEqual(client.post(url, {'answers': []}, format='json').status_code, 201)
+        self.assertEqual(client.post(url, {'answers': []}, format='json').status_code, 400)
+
+    def test_other_integrity_errors_surface(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = f'/residents/{self.resident.id}/surveys/{self.survey.id}/responses/'
+
+        with mock.patch.object(surveys, 'submit_response', side_effect=IntegrityError('FOREIGN KEY')), \
+                self.assertRaises(IntegrityError):
+            client.post(url, {'answers': []}, format='json')
+
+
+class EndpointBudgetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_query_budgets(self):
+        seeding.seed(scale=0.04)
+        probe = benchmark.seed_probe()
+
+        results = benchmark.run(probe, repeat=1)
+
+        self.assertEqual(set(results), set(benchmark.BUDGETS))
+        self.assertEqual(benchmark.regressions(results), {})
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='123', is_staff=True)
+        fee_type = FeeType.objects.create(name='Phí quản lý')
+        for name in ['A', 'B']:
+            building = create_building(name)
+            apartment = create_apartment(building)
+            resident = create_resident(apartment, f'Cư dân {name}', f'00{name}')
+            for month in range(1, 4):
+                Invoice.objects.create(apartment=apartment, resident=resident, fee_type=fee_type, amount=100,
+                                       due_date=date(2025, month, 1), paid=month == 1)
+        cls.building = Building.objects.get(name='A')
+
+    def export(self, url, user=None, **params):
+        client = APIClient()
+        client.force_authenticate(user or self.admin)
+        return client.get(url, params)
+
+    def read_csv(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        return lines[0].split(','), [line.split(',') for line in lines[1:]]
+
+    def test_invoice_export_uses_list_filters(self):
+        header, rows = self.read_csv(self.export('/invoices/export/', building_id=self.building.id, paid='false',
+                                                 from_date='2025-03-01'))
+
+        self.assertEqual(header, [name for name, _ in exports.INVOICE_COLUMNS])
+        self.assertEqual([(row[1], row[7]) for row in rows], [('A', '2025-03-01')])
+
+    def test_residents_export(self):
+        header, rows = self.read_csv(self.export('/residents/export/'))
+
+        self.assertEqual(sorted(row[1] for row in rows), ['Cư dân A', 'Cư dân B'])
+
+    def test_export_requires_admin(self):
+        user = User.objects.create_user(username='cudan', password='123')
+
+        self.assertEqual(self.export('/invoices/export/', user).status_code, 403)
+        self.assertEqual(self.export('/payments/export/', user).status_code, 403)
+
+    def test_invalid_filter(self):
+        self.assertEqual(self.export('/invoices/', from_date='2025-13-01').status_code, 400)
+
+
+class ImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='123', is_staff=True)
+        cls.building = create_building()
+
+    def upload(self, url, content):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        return client.post(url, {'file': SimpleUploadedFile('data.csv', content.encode('utf-8'))},
+                           format='multipart')
+
+    def test_import_apartments_then_residents(self):
+        b = self.building.id
+        response = self.upload('/apartments/import/', 'building_id,number,floor,price,area\n'
+                                                      f'{b},101,1,1000,50\n{b},102,1,1000,60.5\n')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['created'], 2)
+
+        response = self.upload('/residents/import/',
+                               'building_id,apartment_number,name,identity_card,gender,birthday,phone,'
+                               'relationship_to_head\n'
+                               f'{b},101,Chủ hộ 101,001,Male,1980-01-01,0900000001,owner\n'
+                               f'{b},101,Con,002,Female,2010-01-01,0900000002,child\n'
+                               f'{b},102,Chủ hộ 102,003,Female,1985-01-01,0900000003,owner\n')
+        self.assertEqual(response.status_code, 201, response.data)
+
+        heads = dict(Apartment.objects.values_list('number', 'household_head__identity_card'))
+        self.assertEqual(heads, {'101': '001', '102': '003'})
+
+    def test_errors_are_reported_per_line_and_nothing_is_written(self):
+        b = self.building.id
+        apartment = create_apartment(self.building)
+        create_resident(apartment, 'Chủ hộ', '001', birthday=date(1980, 1, 1))
+
+        response = self.upload('/residents/import/',
+                               'building_id,apartment_number,name,identity_card,gender,birthday,phone,'
+                               'relationship_to_head\n'
+                               f'{b},101,Trùng CCCD,001,Male,1980-01-01,0900000001,child\n'
+                               f'{b},999,Không có căn hộ,002,Male,1980-01-01,0900000002,child\n'
+                               f'{b},101,Chủ hộ thứ 2,003,Male,1980-01-01,0900000003,owner\n'
+                               f'{b},101,Sai ngày sinh,004,Male,01/01/1980,0900000004,child\n'
+                               f'{b},101,Hợp lệ,005,Male,1980-01-01,0900000005,child\n'
+                               f'{b},101,Trùng dòng trên,005,Male,1980-01-01,0900000006,child\n')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([(e['line'], list(e['errors'])) for e in response.data['errors']],
+                         [(2, ['identity_card']), (3, ['apartment_number']), (4, ['relationship_to_head']),
+                          (5, ['birthday']), (7, ['identity_card'])])
+        self.assertEqual(Resident.objects.count(), 1)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username='admin', password='123', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.survey = Survey.objects.create(title='Khảo sát')
+        self.url = f'/surveys/{self.survey.id}/'
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data, len(ctx.captured_queries)
+
+    def test_cache_hit_still_checks_object(self):
+        building = create_building()
+        self.get(f'/buildings/{building.id}/')
+        Building.objects.filter(pk=building.pk).update(active=False)  # update() không làm mất hiệu lực cache
+
+        self.assertEqual(self.client.get(f'/buildings/{building.id}/').status_code, 404)
+
+    def test_survey_detail_is_cached_until_questions_change(self):
+        first, _ = self.get(self.url)
+        cached, queries = self.get(self.url)
+        self.assertEqual(cached, first)
+        self.assertEqual(queries, 1)  # chỉ đọc khảo sát để kiểm tra quyền, không serialize lại
+
+        Question.objects.create(survey=self.survey, text='Câu hỏi mới')
+        updated, queries = self.get(self.url)
+        self.assertEqual(len(updated['questions']), 1)
+        self.assertGreater(queries, 0)
+
+        stats = self.client.get('/cache-stats/').data['SurveyViewSet.retrieve']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_apartment_list_invalidated_by_bulk_import(self):
+        building = create_building()
+        self.assertEqual(self.get('/apartments/')[0]['results'], [])
+
+        imports.import_apartments(['building_id,number,floor,price,area', f'{building.id},101,1,1,50'])
+
+        self.assertEqual([a['number'] for a in self.get('/apartments/')[0]['results']], ['101'])
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='cudan', password='123')
+        self.admin = User.objects.create_user(username='admin', password='123', is_staff=True)
+        building = create_building()
+        apartment = create_apartment(building)
+        self.resident = create_resident(apartment, user=self.user)
+        self.complaint = Complaint.objects.create(resident=self.resident, title='Thang máy hỏng', content='<p>.</p>')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, **headers):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, headers=headers)
+        return response, len(ctx.captured_queries)
+
+    def test_detail_not_modified_until_related_rows_change(self):
+        url = f'/complaints/{self.complaint.id}/'
+        response, _ = self.get(url)
+        etag = response['ETag']
+
+        response, queries = self.get(url, if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(queries, 2)  # lấy phản ánh + aggregate các phản hồi
+
+        ComplaintResponse.objects.create(complaint=self.complaint, responder=self.admin, content='<p>Đã sửa</p>')
+        response, _ = self.get(url, if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['responses']), 1)
+
+    def test_list_etag_changes_with_count(self):
+        url = f'/residents/{self.resident.id}/complaints/'
+        etag = self.get(url)[0]['ETag']
+        self.assertEqual(self.get(url, if_none_match=etag)[0].status_code, 304)
+
+        Complaint.objects.create(resident=self.resident, title='Mất nước', content='<p>.</p>')
+        self.assertEqual(self.get(url, if_none_match=etag)[0].status_code, 200)
+
+    def test_list_validators_cover_only_the_page(self):
+        self.client.force_authenticate(self.admin)
+        for i in range(25):
+            Complaint.objects.create(resident=self.resident, title=f'Phản ánh {i}', content='<p>.</p>')
+        etag = self.get('/complaints/')[0]['ETag']
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/complaints/', headers={'if_none_match': etag})
+        self.assertEqual(response.status_code, 304)
+        aggregates = [q['sql'] for q in ctx.captured_queries if 'COUNT(' in q['sql'] or 'MAX(' in q['sql']]
+        self.assertEqual(len(aggregates), 1)
+        self.assertIn(' IN (', aggregates[0])  # chỉ trên các id của trang
+
+        # phản ánh cũ nằm ngoài trang đầu thay đổi thì trang đầu vẫn 304
+        Complaint.objects.filter(pk=self.complaint.pk).update(title='Đã sửa')
+        self.assertEqual(self.get('/complaints/', if_none_match=etag)[0].status_code, 304)
+        Complaint.objects.create(resident=self.resident, title='Mới', content='<p>.</p>')
+        self.assertEqual(self.get('/complaints/', if_none_match=etag)[0].status_code, 200)
+
+    def test_invoice_and_payment_validators_cover_nested_rows(self):
+        invoice = Invoice.objects.create(apartment=self.resident.apartment, resident=self.resident, amount=100,
+                                         fee_type=FeeType.objects.create(name='Phí quản lý'), due_date=date(2025, 1, 1))
+        Payment.objects.create(resident=self.resident, invoice=invoice, method='momo')
+        payments = self.get('/payments/')[0]['ETag']
+        detail = self.get(f'/invoices/{invoice.id}/')[0]['ETag']
+
+        # payment hiển thị số tiền của hoá đơn, hoá đơn hiển thị tên cư dân
+        invoice.amount = 200
+        invoice.save()
+        self.assertEqual(self.get('/payments/', if_none_match=payments)[0].status_code, 200)
+        self.resident.name = 'Cư dân mới'
+        self.resident.save()
+        self.assertEqual(self.get(f'/invoices/{invoice.id}/', if_none_match=detail)[0].status_code, 200)
+
+    def test_if_modified_since(self):
+        last_modified = self.get('/complaints/')[0]['Last-Modified']
+
+        self.assertEqual(self.get('/complaints/', if_modified_since=last_modified)[0].status_code, 304)
+
+    def test_cached_response_keeps_validators(self):
+        self.client.force_authenticate(self.admin)
+        survey = Survey.objects.create(title='Khảo sát')
+        url = f'/surveys/{survey.id}/'
+        etag = self.get(url)[0]['ETag']
+
+        response, queries = self.get(url, if_none_match=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(queries, 1)  # kiểm tra quyền theo object
+
+
+class FailingBackend:
+    def upload(self, path, upload):
+        raise ConnectionError('storage không phản hồi')
+
+
+class MediaUploadTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.spool_root = os.path.join(tmp, 'spool')
+        override = self.settings(MEDIA_ROOT=os.path.join(tmp, 'media'), MEDIA_URL='/media/',
+                                 MEDIA_SPOOL_ROOT=self.spool_root, MEDIA_UPLOAD_BACKEND='chungcu.media.LocalBackend')
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = User.objects.create_user(username='cudan', password='123')
+        building = create_building()
+        apartment = create_apartment(building)
+        resident = create_resident(apartment, user=self.user)
+        fee_type = FeeType.objects.create(name='Phí quản lý')
+        self.invoice = Invoice.objects.create(apartment=apartment, resident=resident, fee_type=fee_type, amount=100,
+                                              due_date=date(2025, 1, 1))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_payment(self):
+        response = self.client.post('/payments/', {
+            'invoice_id': self.invoice.id, 'method': 'momo',
+            'proof_image': SimpleUploadedFile('bien-lai.jpg', b'fake-image', content_type='image/jpeg'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data
+
+    def test_upload_is_acknowledged_then_processed(self):
+        payment = self.create_payment()
+        self.assertEqual((payment['proof_image'], payment['proof_image_status']), ('', 'pending'))
+
+        self.assertEqual(media.process_pending(), {'ready': 1, 'failed': 0, 'retry': 0})
+
+        data = self.client.get(f"/payments/{payment['id']}/").data
+        self.assertEqual(data['proof_image_status'], 'ready')
+        self.assertTrue(data['proof_image'].startswith('/media/uploads/proof_image/'))
+        self.assertEqual(os.listdir(self.spool_root), [])
+
+    def test_failed_upload_is_retried_then_marked_failed(self):
+        payment = self.create_payment()
+
+        with self.settings(MEDIA_UPLOAD_BACKEND='chungcu.tests.FailingBackend'):
+            results = [media.process_pending() for _ in range(media.MAX_ATTEMPTS)]
+
+        self.assertEqual([r['retry'] for r in results], [1] * (media.MAX_ATTEMPTS - 1) + [0])
+        self.assertEqual(results[-1]['failed'], 1)
+        self.assertEqual(self.client.get(f"/payments/{payment['id']}/").data['proof_image_status'], 'failed')
+
+    def test_failed_upload_changes_etag(self):
+        self.create_payment()
+        etag = self.client.get('/payments/')['ETag']
+
+        with self.settings(MEDIA_UPLOAD_BACKEND='chungcu.tests.FailingBackend'):
+            for _ in range(media.MAX_ATTEMPTS):
+                media.process_pending()
+
+        response = self.client.get('/payments/', headers={'if_none_match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['proof_image_status'], 'failed')
+
+    def test_update_spools_upload(self):
+        payment = self.create_payment()
+
+        with mock.patch('cloudinary.uploader.upload_resource') as upload:
+            response = self.client.patch(f"/payments/{payment['id']}/", {
+                'proof_image': SimpleUploadedFile('bien-lai-2.jpg', b'fake-image', content_type='image/jpeg'),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 200, response.data)
+        upload.assert_not_called()
+        self.assertEqual(response.data['proof_image_status'], 'pending')
+        self.assertEqual(MediaUpload.objects.filter(status='pending').count(), 2)
+        self.assertFalse(Payment.objects.get(pk=payment['id']).proof_image)
+
+
+class ComplaintSearchTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', password='123', is_staff=True)
+        self.user = User.objects.create_user(username='cudan', password='123')
+        self.buildings = [create_building(name) for name in ('A', 'B')]
+        self.residents = [create_resident(create_apartment(building, f'{i}01'), f'Cư dân {i}', f'00{i}',
+                                          user=self.user if i == 0 else None)
+                          for i, building in enumerate(self.buildings)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def complaint(self, title, content='<p>.</p>', resident=0, **kwargs):
+        return Complaint.objects.create(resident=self.residents[resident], title=title, content=content, **kwargs)
+
+    def search(self, **params):
+        response = self.client.get('/complaints/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_ranked_by_relevance_without_html(self):
+        weak = self.complaint('Thang máy', '<p>Cần kiểm tra định kỳ</p>')
+        strong = self.complaint('Thang máy hỏng', '<p>Thang <b>máy</b> kẹt, thang máy rung</p>')
+        self.complaint('Mất nước', '<p>Thang bộ tối</p>')
+
+        data = self.search(q='thang máy')
+
+        self.assertEqual(data['count'], 2)
+        self.assertEqual([row['id'] for row in data['results']], [strong.id, weak.id])
+        self.assertGreater(data['results'][0]['score'], data['results'][1]['score'])
+        self.assertEqual(self.search(q='b p')['count'], 0)  # thẻ HTML không được index
+
+    def test_filters_and_pagination(self):
+        for i in range(3):
+            self.complaint(f'Ồn ào {i}', resident=i % 2)
+        self.complaint('Ồn ào', resident=0, status='resolved', is_resolved=True)
+
+        self.assertEqual(self.search(q='on ao')['count'], 4)  # không dấu vẫn khớp
+        self.assertEqual(self.search(q='ồn ào', status='resolved')['count'], 1)
+        self.assertEqual(self.search(q='ồn ào', building_id=self.buildings[1].id)['count'], 1)
+
+        data = self.search(q='ồn ào', page_size=3, page=2)
+        self.assertEqual(len(data['results']), 1)
+        self.assertIsNone(data['next'])
+
+    def test_index_follows_responses_and_moves(self):
+        complaint = self.complaint('Bãi xe')
+        response = ComplaintResponse.objects.create(complaint=complaint, responder=self.admin,
+                                                    content='<p>Đã thay đèn chiếu sáng</p>')
+        self.assertEqual(self.search(q='chiếu sáng')['count'], 1)
+
+        response.delete()
+        self.assertEqual(self.search(q='chiếu sáng')['count'], 0)
+
+        resident = self.residents[0]
+        resident.apartment = self.residents[1].apartment
+        resident.relationship_to_head = 'child'
+        resident.save()
+        self.assertEqual(self.search(q='bãi xe', building_id=self.buildings[1].id)['count'], 1)
+
+        complaint.delete()
+        self.assertEqual(self.search(q='bãi xe')['count'], 0)
+        self.assertEqual(search.rebuild(), 0)
+
+    def test_residents_cannot_search(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/complaints/search/', {'q': 'x'}).status_code, 403)
+
+
+class DirectoryLookupTests(TestCase):
+    def setUp(self):
+        building = create_building()
+        self.apartment = create_apartment(building)
+        self.resident = create_resident(self.apartment, 'Nguyễn Văn Đức', '079090000001', phone='0901234567')
+        Visitor.objects.create(resident=self.resident, full_name='Ngô Thị Hằng', identity_card='079090000002',
+                               phone='0911111111', relationship_to_resident='Chị')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='baove', password='123', is_staff=True))
+
+    def lookup(self, q):
+        response = self.client.get('/directory/', {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return [r['name'] for r in response.data['residents']], [v['full_name'] for v in response.data['visitors']]
+
+    def test_accent_insensitive_prefix(self):
+        self.assertEqual(self.lookup('nguyen van d'), (['Nguyễn Văn Đức'], []))
+        self.assertEqual(self.lookup('NGÔ  thi'), ([], ['Ngô Thị Hằng']))
+        self.assertEqual(self.lookup('ng'), (['Nguyễn Văn Đức'], ['Ngô Thị Hằng']))
+        self.assertEqual(self.lookup('van duc'), ([], []))  # chỉ khớp phần đầu
+
+    def test_phone_and_identity_card(self):
+        self.assertEqual(self.lookup('0901'), (['Nguyễn Văn Đức'], []))
+        self.assertEqual(self.lookup('07909'), (['Nguyễn Văn Đức'], ['Ngô Thị Hằng']))
+
+    def test_search_name_maintained_on_save_and_bulk_create(self):
+        self.resident.name = 'Trần Thị Bích'
+        self.resident.save()
+        Resident.objects.bulk_create([Resident(name='Đặng Văn Lâm', identity_card='079090000003', gender='Male',
+                                               birthday=date(1990, 1, 1), phone='0900000000',
+                                               relationship_to_head='child', apartment=self.apartment)])
+
+        self.assertEqual(self.lookup('tran'), (['Trần Thị Bích'], []))
+        self.assertEqual(Resident.objects.get(identity_card='079090000003').search_name, 'dang van lam')
+
+    def test_search_name_maintained_with_update_fields(self):
+        self.resident.name = 'Lê Văn Tám'
+        self.resident.save(update_fields=['name'])
+        visitor = Visitor.objects.get()
+        visitor.full_name = 'Phạm Thị Hoa'
+        visitor.save(update_fields=['full_name'])
+
+        self.assertEqual(self.lookup('le van'), (['Lê Văn Tám'], []))
+        self.assertEqual(self.lookup('pham'), ([], ['Phạm Thị Hoa']))
+
+
+class GateCheckTests(TestCase):
+    def setUp(self):
+        # đồng bộ generation theo thời gian sẽ làm số câu SQL thay đổi tuỳ tốc độ chạy test
+        self.addCleanup(setattr, gate.plates, 'sync_interval', gate.plates.sync_interval)
+        gate.plates.sync_interval = 60
+        gate.invalidate()
+        building = create_building()
+        self.apartment = create_apartment(building)
+        resident = create_resident(self.apartment)
+        self.visitor = Visitor.objects.create(resident=resident, full_name='Khách', identity_card='002',
+                                              phone='0911111111', relationship_to_resident='Bạn', is_approved=True)
+        ParkingCard.objects.create(resident=resident, card_number='R1', license_plate='51F-123.45',
+                                   vehicle_type='car')
+        ParkingCard.objects.create(visitor=self.visitor, card_number='V1', license_plate='59X1-678.90',
+                                   vehicle_type='motorbike')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='cong', password='123', is_staff=True))
+
+    def check(self, plate):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/parkingcards/gate-check/', {'plate': plate})
+        self.assertEqual(response.status_code, 200)
+        return response.data, len(ctx.captured_queries)
+
+    def test_normalized_plate_and_holder(self):
+        data, _ = self.check('51f 12345')
+        self.assertEqual((data['plate'], data['allowed'], data['holder']), ('51F12345', True, 'resident'))
+        self.assertEqual(data['apartment'], self.apartment.id)
+
+        data, _ = self.check('59x1-67890')
+        self.assertEqual((data['allowed'], data['holder'], data['card_number']), (True, 'visitor', 'V1'))
+
+        data, _ = self.check('30A-000.00')
+        self.assertEqual((data['allowed'], data['holder']), (False, None))
+
+    def test_cached_until_card_or_visitor_changes(self):
+        self.check('59X1-678.90')
+        data, queries = self.check('59x1 678 90')
+        self.assertTrue(data['allowed'])
+        self.assertEqual(queries, 0)  # trả lời từ LRU
+
+        self.visitor.is_approved = False
+        self.visitor.save()
+        data, queries = self.check('59X1-678.90')
+        self.assertFalse(data['allowed'])
+        self.assertEqual(queries, 1)
+
+        ParkingCard.objects.get(card_number='V1').delete()
+        self.assertIsNone(self.check('59X1-678.90')[0]['holder'])
+
+    def test_bump_reaches_other_processes(self):
+        # 2 PlateCache thay cho 2 worker: generation nằm trong DB nên worker kia thấy được
+        worker, other = gate.PlateCache(sync_interval=0), gate.PlateCache(sync_interval=0)
+        other.get('51F12345')
+        other.put('51F12345', gate.lookup('51F12345'), other.epoch)
+        self.assertIsNotNone(other.get('51F12345'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            worker.bump()
+        self.assertIsNone(other.get('51F12345'))
+
+    def test_entries_expire(self):
+        plates = gate.PlateCache(sync_interval=60, ttl=0)
+        plates.put('51F12345', gate.lookup('51F12345'), plates.epoch)
+        self.assertIsNone(plates.get('51F12345'))
+
+
+class VisitorApprovalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        gate.invalidate()
+        building = create_building()
+        apartment = create_apartment(building)
+        self.resident = create_resident(apartment)
+        self.visitors = [Visitor.objects.create(resident=self.resident, full_name=f'Khách {i}',
+                                                identity_card=f'10{i}', phone='0911111111',
+                                                relationship_to_resident='Bạn') for i in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='admin', password='123', is_staff=True))
+
+    def approve(self, visitors, cards=()):
+        return self.client.post('/visitors/approve/', {
+            'visitor_ids': [v.id for v in visitors],
+            'cards': [{'visitor': v.id, 'license_plate': f'51F-00{i}.00', 'vehicle_type': 'motorbike'}
+                      for i, v in enumerate(cards)],
+        }, format='json')
+
+    def test_bulk_approve_issues_cards_from_pool(self):
+        visitors.allocate_card_numbers('K', 3)
+        self.assertEqual(gate.check('51F-001.00')['holder'], None)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.approve(self.visitors, cards=self.visitors[:2])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['approved'], 3)
+        self.assertEqual([c['card_number'] for c in response.data['cards']], ['K000001', 'K000002'])
+        self.assertLessEqual(len(ctx.captured_queries), 10)  # không phụ thuộc số người thân
+        self.assertTrue(gate.check('51f 001 00')['allowed'])
+        self.assertEqual(CardNumber.objects.filter(issued=False).count(), 1)
+
+        # chạy lại: đã duyệt, đã có thẻ thì bỏ qua
+        response = self.approve(self.visitors, cards=self.visitors[:1])
+        self.assertEqual((response.data['approved'], response.data['cards']), (0, []))
+        self.assertEqual(response.data['already_has_card'], [self.visitors[0].id])
+
+    def test_exhausted_pool_rolls_back(self):
+        visitors.allocate_card_numbers('K', 1)
+
+        response = self.approve(self.visitors, cards=self.visitors[:2])
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Visitor.objects.filter(is_approved=True).exists())
+        self.assertFalse(CardNumber.objects.filter(issued=True).exists())
+
+    def test_single_owner_enforced_by_database(self):
+        with self.assertRaises(IntegrityError):
+            ParkingCard.objects.bulk_create([ParkingCard(card_number='X1', license_plate='1', vehicle_type='car',
+                                                         resident=self.resident, visitor=self.visitors[0])])
+
+    def test_single_owner_validated_by_api(self):
+        card = {'card_number': 'X1', 'license_plate': '51F-000.01', 'vehicle_type': 'car'}
+        for owners in ({}, {'resident': self.resident.id, 'visitor': self.visitors[0].id}):
+            response = self.client.post('/parkingcards/', {**card, **owners}, format='json')
+            self.assertEqual(response.status_code, 400)
+
+        response = self.client.post('/parkingcards/', {**card, 'resident': self.resident.id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.patch(f'/parkingcards/{response.data["id"]}/', {'resident': None}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class PendingPackageTests(TestCase):
+    def setUp(self):
+        self.buildings = [create_building(name) for name in ('A', 'B')]
+        self.lockers = []
+        for i, (building, floor) in enumerate([(0, 1), (0, 1), (0, 2), (1, 5)]):
+            apartment = create_apartment(self.buildings[building], f'{floor}0{i}', floor)
+            resident = create_resident(apartment, f'Cư dân {i}', f'00{i}')
+            self.lockers.append(LockerItem.objects.create(resident=resident, locker_number=f'L{i}',
+                                                          description='Tủ'))
+        now = timezone.now()
+        for locker, waiting, received in [(0, 2, 1), (1, 1, 0), (2, 0, 3), (3, 3, 0)]:
+            for j in range(waiting + received):
+                item = Item.objects.create(locker_item=self.lockers[locker], name_item='Bưu phẩm',
+                                           status='waiting' if j < waiting else 'received')
+                Item.objects.filter(pk=item.pk).update(create_time=now - timedelta(days=10 * locker + j))
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='letan', password='123', is_staff=True))
+
+    def test_grouped_counts_in_one_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get('/lockeritems/pending/').data
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        self.assertEqual(data['waiting'], 6)
+        a, b = data['buildings']
+        self.assertEqual((a['name'], a['waiting'], b['name'], b['waiting']), ('A', 3, 'B', 3))
+        self.assertEqual([(f['floor'], f['waiting']) for f in a['floors']], [(1, 3)])  # tầng 2 không còn đồ chờ
+        self.assertEqual([(l['locker_number'], l['waiting']) for l in a['floors'][0]['lockers']],
+                         [('L0', 2), ('L1', 1)])
+        oldest = Item.objects.filter(status='waiting').order_by('create_time').first()
+        self.assertEqual(oldest.locker_item_id, self.lockers[3].id)
+        self.assertEqual((data['oldest'], b['oldest']), (oldest.create_time, oldest.create_time))
+
+    def test_filter_by_building(self):
+        data = self.client.get('/lockeritems/pending/', {'building_id': self.buildings[1].id}).data
+        self.assertEqual([b['name'] for b in data['buildings']], ['B'])
+        self.assertEqual(data['waiting'], 3)
+
+
+class SurveyCreateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='admin', password='123', is_staff=True))
+
+    def payload(self, questions, choices):
+        return {'title': 'Khảo sát', 'description': 'Mô tả', 'questions': [
+            {'text': f'Câu {i}', 'type': 'single', 'choices': [{'text': f'Lựa chọn {i}.{j}'} for j in range(choices)]}
+            for i in range(questions)]}
+
+    def create(self, questions, choices):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/surveys/', self.payload(questions, choices), format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data, len(ctx.captured_queries)
+
+    def test_fixed_number_of_queries(self):
+        _, small = self.create(2, 2)
+        data, large = self.create(40, 5)
+
+        self.assertEqual(small, large)
+        self.assertEqual(Question.objects.filter(survey_id=data['id']).count(), 40)
+        self.assertEqual(Choice.objects.filter(question__survey_id=data['id']).count(), 200)
+        question = Question.objects.get(survey_id=data['id'], text='Câu 7')
+        returned = next(q for q in data['questions'] if q['id'] == question.id)
+        self.assertEqual(sorted(c['id'] for c in returned['choices']),
+                         sorted(question.choices.values_list('id', flat=True)))
+
+    def test_clone_keeps_order_and_skips_responses(self):
+        data, _ = self.create(3, 2)
+        survey = Survey.objects.get(pk=data['id'])
+        SurveyResponse.objects.create(survey=survey, user=User.objects.create_user(username='cudan', password='1'))
+
+        response = self.client.post(f'/surveys/{survey.id}/clone/', {'title': 'Khảo sát quý 2'}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        clone = Survey.objects.get(pk=response.data['id'])
+        self.assertEqual((clone.title, clone.description), ('Khảo sát quý 2', 'Mô tả'))
+        self.assertEqual(list(clone.questions.order_by('id').values_list('text', flat=True)),
+                         ['Câu 0', 'Câu 1', 'Câu 2'])
+        self.assertEqual(list(Choice.objects.filter(question__survey=clone).order_by('id')
+                              .values_list('text', flat=True))[:2], ['Lựa chọn 0.0', 'Lựa chọn 0.1'])
+        self.assertFalse(clone.responses.exists())
+
+
+class SurveySubmitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='cudan', password='123')
+        building = create_building()
+        apartment = create_apartment(building)
+        self.resident = create_resident(apartment, user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def survey(self, questions):
+        return surveys.create_survey([{'text': f'Câu {i}', 'type': 'multiple' if i % 2 else 'single',
+                                       'choices': [{'text': f'{i}.{j}'} for j in range(4)]}
+                                      for i in range(questions)], title='Khảo sát')
+
+    def answers(self, survey):
+        return [{'question': q.id, 'choices': list(q.choices.order_by('id').values_list('id', flat=True))
+                 [:1 if q.type == 'single' else 2]} for q in survey.questions.all()]
+
+    def submit(self, survey, answers):
+        url = f'/residents/{self.resident.id}/surveys/{survey.id}/responses/'
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url, {'answers': answers}, format='json')
+        return response, len(ctx.captured_queries)
+
+    def test_constant_queries(self):
+        small, large = self.survey(3), self.survey(40)
+
+        response, small_queries = self.submit(small, self.answers(small))
+        self.assertEqual(response.status_code, 201)
+        response, large_queries = self.submit(large, self.answers(large))
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(small_queries, large_queries)
+        self.assertEqual(len(response.data['answers']), 40)
+        self.assertEqual(Answer.choices.through.objects.filter(answer__response__survey=large).count(), 60)
+        self.assertEqual(surveys.get_results(large)['questions'][1]['total'], 1)
+
+    def test_choices_checked_against_survey(self):
+        survey, other = self.survey(2), self.survey(1)
+        single, multiple = survey.questions.order_by('id')
+        foreign = other.questions.get().choices.first()
+
+        for answers in ([{'question': single.id, 'choices': [foreign.id]}],
+                        [{'question': other.questions.get().id, 'choices': [foreign.id]}],
+                        [{'question': single.id, 'choices': list(single.choices.values_list('id', flat=True)[:2])}],
+                        [{'question': multiple.id, 'choices': [multiple.choices.first().id] * 2}]):
+            response, _ = self.submit(survey, answers)
+            self.assertEqual(response.status_code, 400, answers)
+        self.assertFalse(SurveyResponse.objects.exists())
+
+
+class AdminChangelistTests(TestCase):
+    # Số câu SQL của mỗi trang danh sách admin (session, user, COUNT, trang dữ liệu, bộ lọc...),
+    # không phụ thuộc số dòng trong trang
+    QUERIES = {
+        'building': 5, 'apartment': 5, 'resident': 5, 'lockeritem': 4, 'item': 4, 'visitor': 4,
+        'parkingcard': 4, 'cardnumber': 4, 'feetype': 5, 'invoice': 5, 'payment': 4, 'complaint': 4,
+        'complaintresponse': 4, 'survey': 5, 'surveyresponse': 5, 'answer': 6,
+    }
+
+    def test_changelist_queries(self):
+        seeding.seed(scale=0.02)
+        admin = benchmark.seed_probe()['admin']
+        admin.is_superuser = True
+        admin.save()
+        self.client.force_login(admin)
+
+        self.assertEqual({model._meta.model_name for model in admin_site._registry}, set(self.QUERIES))
+        for model in admin_site._registry:
+            name = model._meta.model_name
+            with self.subTest(name), CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(f'/admin/chungcu/{name}/')
+                self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(ctx.captured_queries), self.QUERIES[name], name)
+
+
+class AdminChangeFormTests(TestCase):
+    def setUp(self):
+        self.data = benchmark.seed_probe()
+        admin = self.data['admin']
+        admin.is_superuser = True
+        admin.save()
+        self.client.force_login(admin)
+
+    def survey(self, questions):
+        return surveys.create_survey([{'text': f'Câu {i}', 'type': 'single',
+                                       'choices': [{'text': f'{i}.{j}'} for j in range(4)]}
+                                      for i in range(questions)], title='Khảo sát')
+
+    def change_form_queries(self, survey):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/admin/chungcu/survey/{survey.id}/change/')
+            self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_survey_change_form_queries_do_not_grow_with_questions(self):
+        self.change_form_queries(self.survey(1))  # lần đầu còn nạp ContentType vào cache
+        self.assertEqual(self.change_form_queries(self.survey(2)), self.change_form_queries(self.survey(10)))
+
+    def test_autocomplete_uses_folded_name(self):
+        response = self.client.get('/admin/autocomplete/', {'app_label': 'chungcu', 'model_name': 'parkingcard',
+                                                            'field_name': 'resident', 'term': 'cu dan bench'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['text'] for item in response.json()['results']], ['Cư dân benchmark'])
+
+    def test_parking_card_search_by_plate(self):
+        response = self.client.get('/admin/chungcu/parkingcard/', {'q': '51f 999'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([card.card_number for card in response.context['cl'].result_list], ['BENCH-R'])
+
+
+class HouseholdHeadTests(TestCase):
+    def setUp(self):
+        building = create_building()
+        self.apartments = [create_apartment(building, f'{i}01') for i in range(3)]
+        self.owners = [self.resident(f'0{i}', 'owner', apartment) for i, apartment in enumerate(self.apartments)]
+        self.members = [self.resident(f'1{i}', 'child', apartment) for i, apartment in enumerate(self.apartments)]
+        self.admin = User.objects.create_user(username='admin', password='123', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def resident(self, card, relationship, apartment):
+        return create_resident(apartment, f'Cư dân {card}', card, relationship_to_head=relationship)
+
+    def heads(self):
+        return list(Apartment.objects.order_by('id').values_list('household_head_id', flat=True))
+
+    def test_owner_save_writes_only_household_head(self):
+        self.assertEqual(self.heads(), [owner.id for owner in self.owners])
+        with CaptureQueriesContext(connection) as ctx:
+            self.resident('20', 'owner', create_apartment(self.apartments[0].building, '901', 9))
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"household_head_id" =', updates[0])
+        self.assertNotIn('"number"', updates[0])
+
+    def test_second_owner_rejected(self):
+        with self.assertRaisesMessage(ValidationError, 'Căn hộ này đã có chủ hộ.'):
+            self.resident('20', 'owner', self.apartments[0])
+        # bỏ qua Resident.save (bulk_create) thì ràng buộc trong DB vẫn chặn
+        with self.assertRaises(IntegrityError):
+            Resident.objects.bulk_create([Resident(name='Chủ hộ 2', identity_card='21', birthday=date(1990, 1, 1),
+                                                   phone='0900000000', relationship_to_head='owner',
+                                                   apartment=self.apartments[0])])
+
+    def test_reassign_heads(self):
+        response = self.client.post('/apartments/reassign-heads/', {
+            'heads': [{'apartment': apartment.id, 'resident': member.id}
+                      for apartment, member in zip(self.apartments[:2], self.members)]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'apartments': 2, 'demoted': 2, 'promoted': 2})
+        self.assertEqual(self.heads(), [self.members[0].id, self.members[1].id, self.owners[2].id])
+        self.assertEqual(Resident.objects.get(pk=self.owners[0].pk).relationship_to_head, 'other')
+        self.assertEqual(Resident.objects.filter(relationship_to_head='owner').count(), 3)
+
+    def test_reassign_rejects_resident_of_other_apartment(self):
+        response = self.client.post('/apartments/reassign-heads/', {
+            'heads': [{'apartment': self.apartments[0].id, 'resident': self.members[1].id}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.heads(), [owner.id for owner in self.owners])
+
+
+class IdentityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        building = create_building()
+        self.apartments = [create_apartment(building, f'{i}01') for i in range(2)]
+        self.user = User.objects.create_user(username='cudan', password='123')
+        self.resident = create_resident(self.apartments[0], relationship_to_head='child', user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_resolve_is_cached_and_invalidated_on_move(self):
+        self.assertEqual(identity.resolve(self.user),
+                         (self.resident.id, self.apartments[0].id, self.apartments[0].building_id))
+        with CaptureQueriesContext(connection) as ctx:
+            identity.resolve(self.user)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        self.resident.apartment = self.apartments[1]
+        self.resident.save()
+        self.assertEqual(identity.resolve(self.user).apartment_id, self.apartments[1].id)
+
+        self.resident.user = None
+        self.resident.save()
+        self.assertEqual(identity.resolve(self.user), identity.EMPTY)
+
+    def test_save_of_loaded_resident_does_not_reselect(self):
+        resident = Resident.objects.get(pk=self.resident.pk)
+        resident.phone = '0911111111'
+        with CaptureQueriesContext(connection) as ctx:
+            resident.save()
+        self.assertEqual([q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT')], [])
+
+    def test_apartment_permission_follows_resident(self):
+        own, other = (f'/apartments/{apartment.id}/' for apartment in self.apartments)
+        self.assertEqual(self.client.get(own).status_code, 200)
+        self.assertEqual(self.client.get(other).status_code, 403)
+
+        self.resident.apartment = self.apartments[1]
+        self.resident.save()
+        self.assertEqual(self.client.get(own).status_code, 403)
+        self.assertEqual(self.client.get(other).status_code, 200)
+
+    def test_owner_permission_compares_resident_id(self):
+        other = create_resident(self.apartments[1], 'Cư dân khác', '002', relationship_to_head='child')
+        request = SimpleNamespace(user=self.user)
+        permission = perms.IsOwner()
+        self.assertTrue(permission.has_object_permission(request, None, Complaint(resident=self.resident)))
+        self.assertFalse(permission.has_object_permission(request, None, Complaint(resident=other)))
+
+
+class PaymentApprovalTests(TestCase):
+    def setUp(self):
+        building = create_building()
+        apartment = create_apartment(building)
+        self.resident = create_resident(apartment)
+        self.fee_type = FeeType.objects.create(name='Phí quản lý')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='admin', password='123', is_staff=True))
+
+    def payments(self, count, per_invoice=1):
+        invoices = Invoice.objects.bulk_create([
+            Invoice(apartment=self.resident.apartment, resident=self.resident, fee_type=self.fee_type,
+                    amount=100000, due_date=date(2025, 1, 10)) for _ in range(count)])
+        invoice_ids = [invoice.id for invoice in invoices]
+        Payment.objects.bulk_create([Payment(resident=self.resident, invoice_id=invoice_id, method='momo')
+                                     for invoice_id in invoice_ids for _ in range(per_invoice)])
+        return list(Payment.objects.filter(invoice_id__in=invoice_ids).order_by('id').values_list('id', flat=True))
+
+    def bulk_queries(self, url, ids):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url, {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        # SQLite giới hạn số tham số nên bulk_create công nợ bị tách thành nhiều INSERT, MySQL thì 1 câu / 1000 dòng
+        return response.data, len([q for q in ctx.captured_queries
+                                   if not q['sql'].startswith('INSERT INTO "chungcu_ledgerentry"')])
+
+    def test_bulk_queries_do_not_grow_with_ids(self):
+        few, many = self.payments(10), self.payments(1000)
+        data, few_queries = self.bulk_queries('/payments/bulk-approve/', few)
+        self.assertEqual(set(data.values()), {'approved'})
+        data, many_queries = self.bulk_queries('/payments/bulk-approve/', many)
+        self.assertEqual(set(data.values()), {'approved'})
+        self.assertEqual(few_queries, many_queries)
+        self.assertFalse(Invoice.objects.filter(paid=False).exists())
+
+        data, _ = self.bulk_queries('/payments/bulk-reject/', many + [0])
+        self.assertEqual(data[0], 'not_found')
+        self.assertEqual(Invoice.objects.filter(paid=False).count(), 1000)
+
+    def test_single_action_reports_conflicts(self):
+        payment_id, = self.payments(1)
+        response = self.client.post(f'/payments/{payment_id}/approve/')
+        self.assertEqual((response.status_code, response.data['result']), (200, 'approved'))
+        response = self.client.post(f'/payments/{payment_id}/approve/')
+        self.assertEqual((response.status_code, response.data['result']), (409, 'already_approved'))
+
+        self.client.post(f'/payments/{payment_id}/reject/')
+        response = self.client.post(f'/payments/{payment_id}/reject/')
+        self.assertEqual((response.status_code, response.data['result']), (409, 'already_rejected'))
+
+    def test_reject_keeps_invoice_paid_by_other_payment(self):
+        first, second = self.payments(1, per_invoice=2)
+        billing.approve_payments([first, second])
+
+        billing.reject_payments([first])
+        self.assertTrue(Invoice.objects.get().paid)
+        billing.reject_payments([second])
+        self.assertFalse(Invoice.objects.get().paid)
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        building = create_building()
+        self.apartment = create_apartment(building)
+        self.resident = create_resident(self.apartment)
+        self.fee_type = FeeType.objects.create(name='Phí quản lý')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='admin', password='123', is_staff=True))
+
+    def create_invoice(self, amount, due_date):
+        response = self.client.post('/invoices/', {'resident': self.resident.id, 'fee_type_id': self.fee_type.id,
+                                                   'amount': amount, 'due_date': due_date}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def balance(self):
+        summary = ledger.summary(apartment_id=self.apartment.id)
+        self.assertEqual(summary, ledger.summary(resident_id=self.resident.id))
+        return summary['outstanding'], summary['overdue']
+
+    def test_charge_payment_and_reversal(self):
+        past = timezone.localdate() - timedelta(days=5)
+        first = self.create_invoice(100, past)
+        self.create_invoice(50, timezone.localdate() + timedelta(days=30))
+        self.assertEqual(self.balance(), (150, 100))
+
+        payment = Payment.objects.create(resident=self.resident, invoice_id=first, method='momo')
+        billing.approve_payments([payment.id])
+        self.assertEqual(self.balance(), (50, 0))
+        billing.reject_payments([payment.id])
+        self.assertEqual(self.balance(), (150, 100))
+        self.assertEqual(ledger.reconcile(fix=False), [])
+
+    def test_api_update_and_delete_go_through_ledger(self):
+        invoice = self.create_invoice(100, date(2030, 1, 10))
+        self.assertEqual(self.client.patch(f'/invoices/{invoice}/', {'amount': 120}, format='json').status_code, 200)
+        self.assertEqual(self.balance()[0], 120)
+        self.client.patch(f'/invoices/{invoice}/', {'paid': True}, format='json')
+        self.assertEqual(self.balance()[0], 0)
+        self.client.patch(f'/invoices/{invoice}/', {'paid': False}, format='json')
+        self.assertEqual(self.balance()[0], 120)
+
+        self.assertEqual(self.client.delete(f'/invoices/{invoice}/').status_code, 204)
+        self.assertEqual(self.balance()[0], 0)
+        self.assertEqual(ledger.reconcile(fix=False), [])
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        invoice = self.create_invoice(100, date(2030, 1, 10))
+        Invoice.objects.filter(pk=invoice).update(amount=80)  # update() bỏ qua ledger
+
+        drift = ledger.reconcile(fix=False)
+        self.assertEqual({(row['owner'], row['expected'], row['actual']) for row in drift},
+                         {('apartment', 80, 100), ('resident', 80, 100)})
+        ledger.reconcile()
+        self.assertEqual(ledger.reconcile(fix=False), [])
+        self.assertEqual(self.balance()[0], 80)
+        self.assertEqual(LedgerEntry.objects.get().amount, 80)
+
+
+class InvoiceGenerationTests(TestCase):
+    def setUp(self):
+        building = create_building()
+        self.apartments = [create_apartment(building, f'{i}01') for i in range(3)]
+        for i, apartment in enumerate(self.apartments[:2]):
+            create_resident(apartment, f'Chủ hộ {i}', f'00{i}')
+        self.fee_type = FeeType.objects.create(name='Phí quản lý')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='admin', password='123', is_staff=True))
+
+    def generate(self):
+        response = self.client.post('/invoices/generate/', {'fee_type': self.fee_type.id, 'period': '2025-03',
+                                                            'amount': '100000', 'due_date': '2025-03-15'},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def test_rerun_is_idempotent(self):
+        result = self.generate()
+        self.assertEqual((result['created'], result['skipped'], result['without_head']), (2, 0, 1))
+        self.assertEqual(set(Invoice.objects.values_list('period', flat=True)), {date(2025, 3, 1)})
+        self.assertEqual(LedgerEntry.objects.filter(kind='charge').count(), 2)
+
+        result = self.generate()
+        self.assertEqual((result['created'], result['skipped'], result['without_head']), (0, 2, 1))
+        self.assertEqual(Invoice.objects.count(), 2)
+        self.assertEqual(LedgerEntry.objects.filter(kind='charge').count(), 2)
+
+    def test_unique_invoice_period(self):
+        self.generate()
+        invoice = Invoice.objects.first()
+        with self.assertRaises(IntegrityError):
+            Invoice.objects.create(apartment=invoice.apartment, resident=invoice.resident, fee_type=self.fee_type,
+                                   amount=1, due_date=invoice.due_date, period=invoice.period)
+
+
+class SurveyResultsTests(TestCase):
+    def setUp(self):
+        self.survey = surveys.create_survey([{'text': 'Đánh giá', 'type': 'single',
+                                              'choices': [{'text': 'Tốt'}, {'text': 'Chưa tốt'}]},
+                                             {'text': 'Tiện ích', 'type': 'multiple',
+                                              'choices': [{'text': 'Hồ bơi'}, {'text': 'Phòng gym'}]}],
+                                            title='Khảo sát')
+        self.questions = list(self.survey.questions.order_by('id').prefetch_related('choices'))
+        self.choices = [sorted(c.id for c in q.choices.all()) for q in self.questions]
+        rating, amenities = (q.id for q in self.questions)
+        for i, answers in enumerate([[(rating, [self.choices[0][0]]), (amenities, self.choices[1])],
+                                     [(rating, [self.choices[0][0]]), (amenities, [self.choices[1][1]])],
+                                     [(rating, [self.choices[0][1]])]]):
+            surveys.submit_response(self.survey.id, User.objects.create_user(username=f'cudan{i}'), answers)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='admin', password='123', is_staff=True))
+
+    def results(self):
+        response = self.client.get(f'/surveys/{self.survey.id}/results/')
+        self.assertEqual(response.status_code, 200)
+        return [(q['total'], [(c['count'], c['percent']) for c in q['choices']]) for q in response.data['questions']]
+
+    def test_tallies_after_submissions(self):
+        # câu hỏi / lựa chọn theo thứ tự mặc định -id
+        self.assertEqual(self.results(), [(2, [(2, 100.0), (1, 50.0)]), (3, [(1, 33.33), (2, 66.67)])])
+
+    def test_rebuild_tallies(self):
+        expected = self.results()
+        QuestionTally.objects.update(count=0)
+        ChoiceTally.objects.filter(choice_id=self.choices[1][0]).delete()
+        self.assertNotEqual(self.results(), expected)
+
+        surveys.rebuild_tallies(self.survey)
+        self.assertEqual(self.results(), expected)
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        building = create_building()
+        apartment = create_apartment(building)
+        self.resident = create_resident(apartment)
+        fee_type = FeeType.objects.create(name='Phí quản lý')
+        Invoice.objects.bulk_create([Invoice(apartment=apartment, resident=self.resident, fee_type=fee_type,
+                                             amount=100000, due_date=date(2025, 1, 10)) for _ in range(25)])
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='admin', password='123', is_staff=True))
+
+    def walk(self, url):
+        ids, queries = [], []
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)  # không COUNT(*) cả bảng
+            ids += [row['id'] for row in response.data['results']]
+            queries.append(len(ctx.captured_queries))
+            url = response.data['next']
+        return ids, queries
+
+    def assertPagesCover(self, url):
+        ids, queries = self.walk(url)
+        self.assertEqual(ids, sorted(Invoice.objects.values_list('id', flat=True), reverse=True))
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(len(set(queries)), 1)  # trang sau cùng số câu SQL với trang đầu
+
+    def test_router_list(self):
+        self.assertPagesCover('/invoices/?page_size=10')
 
-# Create your tests here.
+    def test_nested_action(self):
+        self.assertPagesCover(f'/residents/{self.resident.id}/invoices/?page_size=10')
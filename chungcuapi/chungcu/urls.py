@@ -17,6 +17,8 @@ router.register('complaints', views.ComplaintViewSet, basename='complaint')
 router.register('complaintresponses', views.ComplaintResponseViewSet, basename='complaintresponse')
 router.register('surveys', views.SurveyViewSet, basename='survey')
 router.register('users', views.UserViewSet, basename='user')
+router.register('directory', views.DirectoryViewSet, basename='directory')
+router.register('cache-stats', views.CacheStatsViewSet, basename='cache-stats')
 
 
 
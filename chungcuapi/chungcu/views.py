@@ -1,19 +1,84 @@
+import codecs
+
 from rest_framework.decorators import action
 from rest_framework.generics import RetrieveAPIView, ListAPIView
 from rest_framework.response import Response
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, OuterRef, Q
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 
-from chungcu import serializers, paginators, perms
-from rest_framework import viewsets, generics, status, parsers, permissions
+from chungcu import serializers, paginators, perms, billing, surveys, identity, ledger, exports, imports, caching, \
+    conditional, media, search, directory, gate, visitors, packages, households
+from rest_framework import viewsets, generics, status, parsers, permissions, exceptions
 from  chungcu.models import *
 
-class BuildingViewSet(viewsets.ViewSet, generics.RetrieveAPIView, generics.CreateAPIView,
-                      generics.DestroyAPIView, generics.UpdateAPIView):
+class PaginatedActionMixin:
+    # Phân trang cho các danh sách trả về từ @action
+    def paginated_response(self, queryset, serializer_class, conditional_get=True, related=()):
+        page = self.paginate_queryset(queryset)
+
+        def render():
+            return self.get_paginated_response(serializer_class(page, many=True).data)
+
+        # conditional_get=False khi dữ liệu trả về phụ thuộc bảng khác (annotate...) mà update_time không phản ánh
+        if not conditional_get:
+            return render()
+        etag, last_modified, _ = conditional.page_validators(page, related)
+        return conditional.respond(self.request, etag, last_modified, render)
+
+
+def list_filters(request):
+    # Đọc bộ lọc từ query params, sai định dạng thì trả về 400
+    serializer = serializers.ListFilterSerializer(data=request.query_params.dict())
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data
+
+
+def import_response(request, importer):
+    # Đọc file CSV tải lên theo từng dòng và trả về báo cáo lỗi theo dòng
+    serializer = serializers.ImportSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+
+    lines = codecs.iterdecode(serializer.validated_data['file'], 'utf-8-sig')
+    try:
+        result = importer(lines, dry_run=serializer.validated_data['dry_run'])
+    except UnicodeDecodeError:
+        raise exceptions.ValidationError({'file': 'File phải là CSV mã hoá UTF-8.'})
+
+    if result['errors']:
+        return Response(result, status=status.HTTP_400_BAD_REQUEST)
+    return Response(result, status=status.HTTP_201_CREATED if result['created'] else status.HTTP_200_OK)
+
+# Kết quả của billing.approve_payments / reject_payments cho 1 thanh toán -> mã HTTP và thông báo
+PAYMENT_RESULTS = {
+    'approved': (status.HTTP_200_OK, 'Thanh toán đã được duyệt.'),
+    'rejected': (status.HTTP_200_OK, 'Thanh toán đã bị từ chối.'),
+    'already_approved': (status.HTTP_409_CONFLICT, 'Thanh toán đã được duyệt trước đó.'),
+    'already_rejected': (status.HTTP_409_CONFLICT, 'Thanh toán đã bị từ chối trước đó.'),
+    'locked': (status.HTTP_409_CONFLICT, 'Thanh toán đang được xử lý, vui lòng thử lại.'),
+    'not_found': (status.HTTP_404_NOT_FOUND, 'Không tìm thấy thanh toán.'),
+}
+
+
+def payment_result_response(result):
+    code, detail = PAYMENT_RESULTS[result]
+    return Response({'detail': detail, 'result': result}, status=code)
+
+class BuildingViewSet(caching.ResponseCacheMixin, conditional.ConditionalRetrieveMixin, PaginatedActionMixin,
+                      viewsets.ViewSet, generics.RetrieveAPIView, generics.CreateAPIView, generics.DestroyAPIView,
+                      generics.UpdateAPIView):
     queryset =  Building.objects.filter(active = True)
     serializer_class = serializers.BuildingSerializer
-    pagination_class = paginators.ItemPaginator
+    cache_actions = ('retrieve',)
+    cache_models = (Building,)
+    pagination_class = paginators.CursorPaginator
     permission_classes = [perms.IsAdminUser,permissions.IsAuthenticated]
 
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
     def get_queryset(self):
         query = self.queryset
 
@@ -29,13 +94,20 @@ class BuildingViewSet(viewsets.ViewSet, generics.RetrieveAPIView, generics.Creat
     @action(detail=True, methods=['get'], url_path='apartments')
     def get_apartments(self, request, pk):
         apartments = self.get_object().apartments.all()
-        return Response(serializers.ApartmentSerializer(apartments, many=True).data, status=status.HTTP_200_OK)
+        return self.paginated_response(apartments, serializers.ApartmentSerializer)
 
-class ApartmentViewSet(viewsets.ViewSet, generics.RetrieveAPIView, generics.UpdateAPIView,
-                       generics.DestroyAPIView, generics.ListAPIView, generics.CreateAPIView):
+class ApartmentViewSet(caching.ResponseCacheMixin, conditional.ConditionalListMixin,
+                       conditional.ConditionalRetrieveMixin, PaginatedActionMixin, viewsets.ViewSet,
+                       generics.RetrieveAPIView, generics.UpdateAPIView, generics.DestroyAPIView, generics.ListAPIView,
+                       generics.CreateAPIView):
     queryset =  Apartment.objects.filter(active = True)
     serializer_class = serializers.ApartmentSerializer
-    pagination_class = paginators.ItemPaginator
+    cache_actions = ('list',)
+    cache_models = (Apartment,)
+    pagination_class = paginators.CursorPaginator
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
 
     def get_permissions(self):
         # Nếu admin đang thao tác, cho phép tất cả
@@ -43,7 +115,7 @@ class ApartmentViewSet(viewsets.ViewSet, generics.RetrieveAPIView, generics.Upda
             return [permissions.IsAuthenticated()]
 
         # Nếu là cư dân, kiểm tra quyền sở hữu
-        if self.action in ['get_residents','retrieve']:
+        if self.action in ['get_residents','retrieve','get_balance']:
             return [permissions.IsAuthenticated(), perms.IsResidentOfApartment()]
 
         return [perms.IsAdminUser()]
@@ -60,14 +132,40 @@ class ApartmentViewSet(viewsets.ViewSet, generics.RetrieveAPIView, generics.Upda
 
         return query
 
+    # Nhập căn hộ hàng loạt từ CSV: building_id, number, floor, price, area
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[parsers.MultiPartParser])
+    def import_csv(self, request):
+        return import_response(request, imports.import_apartments)
+
+    # Đổi chủ hộ nhiều căn hộ một lúc: {"heads": [{"apartment": 1, "resident": 5}], "previous_relationship": "other"}
+    @action(detail=False, methods=['post'], url_path='reassign-heads')
+    def reassign_heads(self, request):
+        serializer = serializers.HouseholdReassignSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            result = households.reassign_household_heads(serializer.validated_data['heads'],
+                                                         serializer.validated_data['previous_relationship'])
+        except DjangoValidationError as e:
+            raise exceptions.ValidationError({'heads': e.message_dict})
+        return Response(result, status=status.HTTP_200_OK)
+
     @action(detail=True, methods=['get'], url_path='residents',)
     def get_residents(self, request, pk):
         residents = self.get_object().residents.all()
-        return Response(serializers.ResidentSerializer(residents, many=True).data, status=status.HTTP_200_OK)
+        return self.paginated_response(residents, serializers.ResidentSerializer)
 
-class ResidentViewSet(viewsets.ViewSet, generics.RetrieveAPIView, generics.CreateAPIView, generics.UpdateAPIView,
+    @action(detail=True, methods=['get'], url_path='balance')
+    def get_balance(self, request, pk):
+        apartment = self.get_object()
+        summary = ledger.summary(apartment_id=apartment.id)
+        return Response(serializers.BalanceSummarySerializer(summary).data, status=status.HTTP_200_OK)
+
+class ResidentViewSet(conditional.ConditionalListMixin, conditional.ConditionalRetrieveMixin, PaginatedActionMixin,
+                      viewsets.ViewSet, generics.RetrieveAPIView, generics.CreateAPIView, generics.UpdateAPIView,
                       generics.DestroyAPIView, generics.ListAPIView):
     queryset =  Resident.objects.select_related('apartment').all()
+    conditional_related = ('apartment',)
+    pagination_class = paginators.CursorPaginator
 
     def get_serializer_class(self):
         if self.action  == 'retrieve':
@@ -86,22 +184,50 @@ class ResidentViewSet(viewsets.ViewSet, generics.RetrieveAPIView, generics.Creat
                            'get_parkingcard', 'get_lockeritem', 'get_item_detail',
                            'get_complaints','get_complaint_detail', 'get_answers','get_answer_detail',
                            'get_visitors','get_visitors_detail','add_visitor','submit_survey_response',
-                           'get_survey_response','get_surveys']:
+                           'get_survey_response','get_surveys','get_balance']:
             return [permissions.IsAuthenticated(), perms.IsOwner()]
 
         return [perms.IsAdminUser()]
 
+    def get_queryset(self):
+        query = self.queryset
+
+        if self.action in ['list', 'export']:
+            filters = list_filters(self.request)
+            if 'building_id' in filters:
+                query = query.filter(apartment__building_id=filters['building_id'])
+            if 'apartment_id' in filters:
+                query = query.filter(apartment_id=filters['apartment_id'])
+
+        return query
+
+    # Xuất danh sách cư dân ra CSV (stream, không nạp toàn bộ vào bộ nhớ)
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        return exports.csv_response(self.get_queryset(), exports.RESIDENT_COLUMNS, 'residents.csv')
+
+    # Nhập cư dân hàng loạt từ CSV: building_id, apartment_number, name, identity_card, gender, birthday,
+    # phone, relationship_to_head
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[parsers.MultiPartParser])
+    def import_csv(self, request):
+        return import_response(request, imports.import_residents)
+
     @action(detail=True, methods=['get'], url_path='invoices')
     def get_invoices(self, request, pk):
-        invoices = self.get_object().invoices.all()
-        return Response(serializers.InvoiceSerializer(invoices, many=True).data, status=status.HTTP_200_OK)
+        invoices = self.get_object().invoices.select_related('fee_type')
+        return self.paginated_response(invoices, serializers.InvoiceSerializer, related=('fee_type',))
+
+    @action(detail=True, methods=['get'], url_path='balance')
+    def get_balance(self, request, pk):
+        resident = self.get_object()
+        summary = ledger.summary(resident_id=resident.id)
+        return Response(serializers.BalanceSummarySerializer(summary).data, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['get'], url_path='invoices/(?P<invoice_id>[^/.]+)')
     def get_invoice_detail(self, request, pk, invoice_id):
         resident = self.get_object()
         invoice = get_object_or_404(resident.invoices, pk=invoice_id)
-        serializer = serializers.InvoiceDetailSerializer(invoice)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.detail_response(invoice, serializers.InvoiceDetailSerializer, InvoiceViewSet.conditional_related)
 
     @action(detail=True, methods=['get'], url_path='parkingcard')
     def get_parkingcard(self, request, pk):
@@ -117,41 +243,39 @@ class ResidentViewSet(viewsets.ViewSet, generics.RetrieveAPIView, generics.Creat
     def get_item_detail(self, request, pk, item_id):
         resident = self.get_object()
         item = get_object_or_404(resident.lockeritem.items, pk=item_id)
-        serializer = serializers.ItemDetailSerializer(item)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.detail_response(item, serializers.ItemDetailSerializer)
 
     @action(detail=True, methods=['get'], url_path='complaints')
     def get_complaints(self, request, pk):
         complaints = self.get_object().complaint_set.all()
-        return Response(serializers.ComplaintSerializer(complaints, many=True).data, status=status.HTTP_200_OK)
+        return self.paginated_response(complaints, serializers.ComplaintSerializer)
 
     @action(detail=True, methods=['get'], url_path='complaints/(?P<complaint_id>[^/.]+)')
     def get_complaint_detail(self, request, pk, complaint_id):
         resident = self.get_object()
         complaint = get_object_or_404(resident.complaint_set, pk=complaint_id)
-        serializer = serializers.ComplaintDetailSerializer(complaint)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.detail_response(complaint, serializers.ComplaintDetailSerializer, ('responses',))
 
     @action(detail=True, methods=['get'], url_path='visitors')
     def get_visitors(self, request, pk):
         visitors = self.get_object().visitor_set.all()
-        return Response(serializers.VisitorSerializer(visitors, many=True).data, status=status.HTTP_200_OK)
+        return self.paginated_response(visitors, serializers.VisitorSerializer)
 
     @action(detail=True, methods=['get'], url_path='visitors/(?P<visitor_id>[^/.]+)')
     def get_visitors_detail(self, request, pk, visitor_id):
         resident = self.get_object()
         visitor = get_object_or_404(resident.visitor_set, pk=visitor_id)
-        serializer = serializers.VisitorDetailSerializer(visitor)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.detail_response(visitor, serializers.VisitorDetailSerializer, ('parking_card',))
 
     @action(detail=True, methods=['post'], url_path='visitor')
     def add_visitor(self, request, pk=None):
-
-        resident = Resident.objects.get(pk=pk, user=request.user)
+        resident_id = identity.resolve(request.user).resident_id
+        if resident_id is None or str(resident_id) != str(pk):
+            return Response({'detail': 'Resident not found.'}, status=status.HTTP_404_NOT_FOUND)
 
         serializer = serializers.VisitorSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(resident=resident, is_approved=False)
+            serializer.save(resident_id=resident_id, is_approved=False)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -161,32 +285,37 @@ class ResidentViewSet(viewsets.ViewSet, generics.RetrieveAPIView, generics.Creat
 
         survey = get_object_or_404(Survey, id=survey_id)
 
-        # Kiểm tra đã trả lời chưa
-        if SurveyResponse.objects.filter(user=request.user, survey=survey).exists():
-            return Response({'detail': 'You have already submitted this survey.'}, status=status.HTTP_400_BAD_REQUEST)
-
-        serializer = serializers.SurveyResponseSerializer(data=request.data, context={'request': request})
+        serializer = serializers.SurveyResponseSerializer(data=request.data,
+                                                          context={'request': request, 'survey': survey})
         if serializer.is_valid():
-            serializer.save(survey=survey)
+            # Ràng buộc unique_survey_response chặn việc trả lời 2 lần (kể cả khi gửi đồng thời),
+            # lỗi toàn vẹn khác thì để lộ ra
+            try:
+                with transaction.atomic():
+                    serializer.save(survey=survey)
+            except IntegrityError:
+                if not SurveyResponse.objects.filter(user=request.user, survey=survey).exists():
+                    raise
+                return Response({'detail': 'You have already submitted this survey.'},
+                                status=status.HTTP_400_BAD_REQUEST)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=True, methods=['get'], url_path='surveys')
     def get_surveys(self, request, pk=None):
-        surveys = Survey.objects.all().prefetch_related('responses')
+        resident = self.get_object()
+        surveys = Survey.objects.annotate(has_responded=Exists(
+            SurveyResponse.objects.filter(survey=OuterRef('pk'), user_id=resident.user_id)))
 
-        result = []
-        for survey in surveys:
-            has_responded = survey.responses.filter(user=request.user).exists()
-            result.append({
-                'id': survey.id,
-                'title': survey.title,
-                'description': survey.description,
-                'deadline': survey.deadline,
-                'has_responded': has_responded
-            })
+        # Lọc khảo sát còn hạn (open) hoặc đã hết hạn (closed)
+        survey_status = request.query_params.get('status')
+        now = timezone.now()
+        if survey_status == 'open':
+            surveys = surveys.filter(Q(deadline__isnull=True) | Q(deadline__gte=now))
+        elif survey_status == 'closed':
+            surveys = surveys.filter(deadline__lt=now)
 
-        return Response(result)
+        return self.paginated_response(surveys, serializers.SurveyStatusSerializer, conditional_get=False)
 
     @action(detail=True, methods=['get'], url_path='surveys/(?P<survey_id>[^/.]+)')
     def get_survey_response(self, request, pk=None, survey_id=None):
@@ -201,11 +330,18 @@ class ResidentViewSet(viewsets.ViewSet, generics.RetrieveAPIView, generics.Creat
         serializer = serializers.SurveyResponseDisplaySerializer(response)
         return Response(serializer.data)
 
-class LockerItemViewSet(viewsets.ModelViewSet):
+class LockerItemViewSet(conditional.ConditionalListMixin, conditional.ConditionalRetrieveMixin, viewsets.ModelViewSet):
     queryset =  LockerItem.objects.prefetch_related('items').all()
+    conditional_related = ('items',)
+    pagination_class = paginators.CursorPaginator
     serializer_class = serializers.LockerItemSerializer
     permission_classes = [perms.IsAdminUser]
 
+    # Bảng tổng hợp bưu phẩm chờ nhận cho quầy lễ tân, 1 câu SQL thay vì duyệt từng tủ đồ
+    @action(detail=False, methods=['get'], url_path='pending')
+    def pending(self, request):
+        return Response(packages.pending_summary(list_filters(request).get('building_id')), status=status.HTTP_200_OK)
+
     @action(detail=True, methods=['post'], url_path='item')
     def add_item(self, request, pk=None):
         locker_item = self.get_object()
@@ -237,25 +373,54 @@ class ItemViewSet(viewsets.ViewSet, generics.DestroyAPIView):
     serializer_class = serializers.ItemSerializer
     permission_classes = [perms.IsAdminUser]
 
-class ParkingCardViewSet(viewsets.ModelViewSet):
+class ParkingCardViewSet(conditional.ConditionalListMixin, conditional.ConditionalRetrieveMixin,
+                         viewsets.ModelViewSet):
     queryset = ParkingCard.objects.all()
+    pagination_class = paginators.CursorPaginator
     serializer_class = serializers.ParkingCardDetailSerializer
     permission_classes = [perms.IsAdminUser]
 
-class VisitorViewSet(viewsets.ModelViewSet):
-    queryset = Visitor.objects.prefetch_related('resident').all()
+    # Cổng bãi xe hỏi biển số có được vào không, trả lời từ LRU trong process, không cần đọc DB
+    @action(detail=False, methods=['get'], url_path='gate-check')
+    def gate_check(self, request):
+        params = serializers.GateCheckSerializer(data=request.query_params.dict())
+        params.is_valid(raise_exception=True)
+        return Response(gate.check(params.validated_data['plate']), status=status.HTTP_200_OK)
+
+class VisitorViewSet(conditional.ConditionalListMixin, conditional.ConditionalRetrieveMixin, viewsets.ModelViewSet):
+    queryset = Visitor.objects.select_related('parking_card').all()
+    conditional_related = ('parking_card',)
+    pagination_class = paginators.CursorPaginator
     serializer_class = serializers.VisitorDetailSerializer
 
     permission_classes = [perms.IsAdminUser]
 
     @action(detail=True, methods=['get'], url_path='parkingcard')
     def get_parkingcard(self, request, pk):
-        parkingcard = self.get_object().parkingcard
+        parkingcard = self.get_object().parking_card
         return Response(serializers.ParkingCardDetailSerializer(parkingcard).data, status=status.HTTP_200_OK)
 
+    # Duyệt nhiều người thân và cấp thẻ xe từ kho số thẻ in sẵn trong 1 lần
+    @action(detail=False, methods=['post'], url_path='approve')
+    def approve(self, request):
+        serializer = serializers.VisitorApprovalSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            result = visitors.approve(serializer.validated_data['visitor_ids'],
+                                      serializer.validated_data.get('cards', []))
+        except visitors.CardPoolExhausted as e:
+            return Response({'detail': str(e)}, status=status.HTTP_409_CONFLICT)
+        except IntegrityError:
+            return Response({'detail': 'Số thẻ hoặc chủ thẻ bị trùng, vui lòng thử lại.'},
+                            status=status.HTTP_409_CONFLICT)
+        return Response(result, status=status.HTTP_200_OK)
 
-class InvoiceViewSet(viewsets.ModelViewSet):
-    queryset = Invoice.objects.prefetch_related('fee_type').all()
+
+class InvoiceViewSet(conditional.ConditionalListMixin, conditional.ConditionalRetrieveMixin, viewsets.ModelViewSet):
+    queryset = Invoice.objects.select_related('fee_type').all()
+    pagination_class = paginators.CursorPaginator
+    conditional_related = ('fee_type', 'resident', 'apartment')
 
     def get_permissions(self):
         # Nếu admin đang thao tác, cho phép tất cả
@@ -277,23 +442,81 @@ class InvoiceViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        if user.is_staff:
-            return Invoice.objects.all()
-        elif hasattr(user, 'resident'):
-            return Invoice.objects.filter(resident=user.resident)
-        return Invoice.objects.none()
+        query = self.queryset
+        if not user.is_staff:
+            resident_id = identity.resolve(user).resident_id
+            if not resident_id:
+                return Invoice.objects.none()
+            query = query.filter(resident_id=resident_id)
+
+        if self.action in ['list', 'export']:
+            filters = list_filters(self.request)
+            if 'building_id' in filters:
+                query = query.filter(apartment__building_id=filters['building_id'])
+            if 'fee_type_id' in filters:
+                query = query.filter(fee_type_id=filters['fee_type_id'])
+            if 'paid' in filters:
+                query = query.filter(paid=filters['paid'])
+            if 'from_date' in filters:
+                query = query.filter(due_date__gte=filters['from_date'])
+            if 'to_date' in filters:
+                query = query.filter(due_date__lte=filters['to_date'])
+
+        return query
+
+    # Xuất hoá đơn ra CSV với cùng bộ lọc như danh sách
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        return exports.csv_response(self.get_queryset(), exports.INVOICE_COLUMNS, 'invoices.csv')
+
+    def perform_destroy(self, instance):
+        ledger.delete_invoices(Invoice.objects.filter(pk=instance.pk))
+
+    # Tạo hoá đơn hàng loạt cho kỳ thu phí
+    @action(detail=False, methods=['post'], url_path='generate')
+    def generate(self, request):
+        serializer = serializers.InvoiceGenerateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
 
+        result = billing.generate_invoices(fee_type=data['fee_type'], period=data['period'], amount=data['amount'],
+                                           due_date=data['due_date'], building_ids=data.get('buildings'),
+                                           batch_size=data['batch_size'])
+        return Response(result, status=status.HTTP_201_CREATED)
 
-class PaymentViewSet(viewsets.ModelViewSet):
-    queryset = Payment.objects.all()
+
+class PaymentViewSet(conditional.ConditionalListMixin, conditional.ConditionalRetrieveMixin, viewsets.ModelViewSet):
+    queryset = media.annotate(Payment.objects.select_related('resident', 'invoice__fee_type'), 'proof_image')
+    pagination_class = paginators.CursorPaginator
     serializer_class = serializers.PaymentSerializer
+    conditional_related = ('invoice', 'invoice__fee_type', 'resident')
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
         user = self.request.user
-        if user.is_staff:
-            return Payment.objects.all()
-        return Payment.objects.filter(resident__user=user)
+        query = self.queryset
+        if not user.is_staff:
+            query = query.filter(resident_id=identity.resolve(user).resident_id)
+
+        if self.action in ['list', 'export']:
+            filters = list_filters(self.request)
+            if 'building_id' in filters:
+                query = query.filter(invoice__apartment__building_id=filters['building_id'])
+            if 'fee_type_id' in filters:
+                query = query.filter(invoice__fee_type_id=filters['fee_type_id'])
+            if 'status' in filters:
+                query = query.filter(status=filters['status'])
+            if 'from_date' in filters:
+                query = query.filter(create_time__date__gte=filters['from_date'])
+            if 'to_date' in filters:
+                query = query.filter(create_time__date__lte=filters['to_date'])
+
+        return query
+
+    # Xuất thanh toán ra CSV với cùng bộ lọc như danh sách
+    @action(detail=False, methods=['get'], url_path='export', permission_classes=[perms.IsAdminUser])
+    def export(self, request):
+        return exports.csv_response(self.get_queryset(), exports.PAYMENT_COLUMNS, 'payments.csv')
 
     def perform_create(self, serializer):
         serializer.save()
@@ -301,33 +524,31 @@ class PaymentViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'], permission_classes=[perms.IsAdminUser])
     def approve(self, request, pk=None):
         payment = self.get_object()
-        invoice = payment.invoice
-
-        payment.status = 'approved'
-        payment.save()
-
-        invoice.paid = True
-        invoice.status = 'approved'
-        invoice.save()
-
-        return Response({'detail': 'Thanh toán đã được duyệt.'})
+        return payment_result_response(billing.approve_payments([payment.id])[payment.id])
 
     @action(detail=True, methods=['post'], permission_classes=[perms.IsAdminUser])
     def reject(self, request, pk=None):
         payment = self.get_object()
-        invoice = payment.invoice
+        return payment_result_response(billing.reject_payments([payment.id])[payment.id])
 
-        payment.status = 'rejected'
-        payment.save()
+    # Duyệt / từ chối nhiều thanh toán một lúc: {"ids": [1, 2, 3]}
+    @action(detail=False, methods=['post'], url_path='bulk-approve', permission_classes=[perms.IsAdminUser])
+    def bulk_approve(self, request):
+        serializer = serializers.PaymentBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(billing.approve_payments(serializer.validated_data['ids']), status=status.HTTP_200_OK)
 
-        invoice.status = 'rejected'
-        invoice.save()
+    @action(detail=False, methods=['post'], url_path='bulk-reject', permission_classes=[perms.IsAdminUser])
+    def bulk_reject(self, request):
+        serializer = serializers.PaymentBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(billing.reject_payments(serializer.validated_data['ids']), status=status.HTTP_200_OK)
 
-        return Response({'detail': 'Thanh toán đã bị từ chối.'})
 
-
-class ComplaintViewSet(viewsets.ModelViewSet):
+class ComplaintViewSet(conditional.ConditionalListMixin, conditional.ConditionalRetrieveMixin, viewsets.ModelViewSet):
     queryset = Complaint.objects.all()
+    conditional_related = ('responses',)
+    pagination_class = paginators.CursorPaginator
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -338,7 +559,7 @@ class ComplaintViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         if self.request.user.is_staff:
             return Complaint.objects.all()
-        return Complaint.objects.filter(resident__user=self.request.user)
+        return Complaint.objects.filter(resident_id=identity.resolve(self.request.user).resident_id)
 
     def get_permissions(self):
         # Nếu admin đang thao tác, cho phép tất cả
@@ -364,13 +585,29 @@ class ComplaintViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    # Tìm kiếm toàn văn trong tiêu đề, nội dung và phản hồi, xếp theo độ liên quan
+    @action(detail=False, methods=['get'], url_path='search', permission_classes=[permissions.IsAdminUser])
+    def search_complaints(self, request):
+        params = serializers.ComplaintSearchQuerySerializer(data=request.query_params.dict())
+        params.is_valid(raise_exception=True)
+
+        results = search.RankedResults(**params.validated_data)
+        paginator = paginators.SearchPaginator()
+        page = paginator.paginate_queryset(results, request, view=self)
+        return paginator.get_paginated_response(serializers.ComplaintSearchSerializer(page, many=True).data)
+
     #gán user khi cư dân tạo phản ánh
     def perform_create(self, serializer):
-        resident = Resident.objects.get(user=self.request.user)
-        serializer.save(resident=resident)
+        resident_id = identity.resolve(self.request.user).resident_id
+        if resident_id is None:
+            raise exceptions.ValidationError({'resident': 'User is not linked to any resident.'})
+        serializer.save(resident_id=resident_id)
 
-class ComplaintResponseViewSet(viewsets.ModelViewSet):
+class ComplaintResponseViewSet(conditional.ConditionalListMixin, conditional.ConditionalRetrieveMixin,
+                               viewsets.ModelViewSet):
     queryset = ComplaintResponse.objects.all()
+    conditional_related = ('complaint',)
+    pagination_class = paginators.CursorPaginator
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return serializers.ComplaintResponseDetailSerializer
@@ -378,8 +615,26 @@ class ComplaintResponseViewSet(viewsets.ModelViewSet):
 
     permission_classes = [perms.IsAdminUser]
 
-class SurveyViewSet(viewsets.ModelViewSet):
+class SurveyViewSet(caching.ResponseCacheMixin, conditional.ConditionalListMixin,
+                    conditional.ConditionalRetrieveMixin, viewsets.ModelViewSet):
     queryset = Survey.objects.all()
+    conditional_related = ('questions', 'questions__choices')
+    pagination_class = paginators.CursorPaginator
+    cache_actions = ('retrieve',)
+    cache_models = (Survey, Question, Choice)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    # Trả về khảo sát vừa tạo kèm id của câu hỏi / lựa chọn (3 câu SQL, không phụ thuộc số câu hỏi)
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return self.created_response(serializer.save())
+
+    def created_response(self, survey):
+        survey = Survey.objects.prefetch_related('questions__choices').get(pk=survey.pk)
+        return Response(serializers.SurveyDetailSerializer(survey).data, status=status.HTTP_201_CREATED)
 
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -388,6 +643,11 @@ class SurveyViewSet(viewsets.ModelViewSet):
             return serializers.SurveyCreateSerializer
         return serializers.SurveySerializer
 
+    def get_queryset(self):
+        if self.action == 'retrieve':
+            return self.queryset.prefetch_related('questions__choices')
+        return self.queryset
+
     def get_permissions(self):
         # Nếu admin đang thao tác, cho phép tất cả
         if self.request.user.is_staff:
@@ -397,6 +657,8 @@ class SurveyViewSet(viewsets.ModelViewSet):
         if self.action in ['retrieve', 'list']:
             return [permissions.IsAuthenticated()]
 
+        return [perms.IsAdminUser()]
+
     @action(detail=True, methods=['get'], url_path='responses')
     def get_responses(self, request, pk=None):
         survey = self.get_object()
@@ -408,8 +670,21 @@ class SurveyViewSet(viewsets.ModelViewSet):
         serializer = serializers.SurveyResponseDisplaySerializer(responses, many=True)
         return Response(serializer.data)
 
+    # Tạo khảo sát mới từ 1 khảo sát có sẵn (làm mẫu), có thể đổi tiêu đề / hạn chót
+    @action(detail=True, methods=['post'], url_path='clone')
+    def clone(self, request, pk=None):
+        serializer = serializers.SurveyCloneSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return self.created_response(surveys.clone_survey(self.get_object(), **serializer.validated_data))
+
+    # Thống kê số lượt chọn của từng câu hỏi / lựa chọn
+    @action(detail=True, methods=['get'], url_path='results')
+    def get_results(self, request, pk=None):
+        return Response(surveys.get_results(self.get_object()), status=status.HTTP_200_OK)
+
 class UserViewSet(viewsets.ViewSet, generics.CreateAPIView, RetrieveAPIView, ListAPIView ):
-    queryset = User.objects.filter(is_active = True)
+    queryset = media.annotate(User.objects.filter(is_active = True).select_related('resident'), 'avatar')
+    pagination_class = paginators.CursorPaginator
     serializer_class = serializers.UserSerializer
     parser_classes = [parsers.MultiPartParser]
 
@@ -429,14 +704,18 @@ class UserViewSet(viewsets.ViewSet, generics.CreateAPIView, RetrieveAPIView, Lis
         u = request.user
         if request.method.__eq__('PATCH'):
             for k,v in request.data.items():
-                if k in ['first_name', 'last_name','username','avatar']:
+                if k in ['first_name', 'last_name','username']:
                     setattr(u, k, v)
                 elif k.__eq__('password'):
                      u.set_password(v)
 
             u.save()
+            # Ảnh đại diện được tải lên nền, không chờ storage trong request
+            if request.FILES.get('avatar'):
+                media.spool(u, 'avatar', request.FILES['avatar'])
 
-        return Response(serializers.UserSerializer(request.user).data)
+        # Đọc lại qua queryset để có sẵn trạng thái ảnh đại diện (media.annotate)
+        return Response(serializers.UserSerializer(self.get_queryset().get(pk=u.pk)).data)
 
     def partial_update(self, request, pk=None):
         print("===> Bắt đầu partial_update")
@@ -455,3 +734,26 @@ class UserViewSet(viewsets.ViewSet, generics.CreateAPIView, RetrieveAPIView, Lis
             return Response(serializer.data)
         print("===> Lỗi validate:", serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+# Tra cứu cư dân / khách theo tên không dấu, số điện thoại hoặc CCCD (khớp phần đầu)
+class DirectoryViewSet(viewsets.ViewSet):
+    permission_classes = [perms.IsAdminUser]
+
+    def list(self, request):
+        params = serializers.DirectoryQuerySerializer(data=request.query_params.dict())
+        params.is_valid(raise_exception=True)
+
+        residents, visitors = directory.lookup(params.validated_data['q'], params.validated_data['limit'])
+        return Response({
+            'residents': serializers.DirectoryResidentSerializer(residents, many=True).data,
+            'visitors': serializers.DirectoryVisitorSerializer(visitors, many=True).data,
+        }, status=status.HTTP_200_OK)
+
+
+# Thống kê hit / miss của response cache
+class CacheStatsViewSet(viewsets.ViewSet):
+    permission_classes = [perms.IsAdminUser]
+
+    def list(self, request):
+        return Response(caching.stats(), status=status.HTTP_200_OK)
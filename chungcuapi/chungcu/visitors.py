@@ -0,0 +1,71 @@
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from chungcu import gate
+from chungcu.models import CardNumber, ParkingCard, Visitor
+
+
+class CardPoolExhausted(Exception):
+    pass
+
+
+def allocate_card_numbers(prefix, count, width=6):
+    """Thêm count số thẻ mới vào kho: prefix + số thứ tự, bỏ qua số đã có trong kho hoặc đã in trên thẻ."""
+    if len(prefix) + width > CardNumber._meta.get_field('number').max_length:
+        raise ValueError('Tiền tố quá dài so với độ dài số thẻ')
+
+    last = CardNumber.objects.filter(number__startswith=prefix).aggregate(last=Max('number'))['last']
+    start = int(last[len(prefix):]) + 1 if last and last[len(prefix):].isdigit() else 1
+    numbers = [f'{prefix}{n:0{width}d}' for n in range(start, start + count)]
+    used = set(ParkingCard.objects.filter(card_number__in=numbers).values_list('card_number', flat=True))
+
+    created = CardNumber.objects.bulk_create([CardNumber(number=number) for number in numbers if number not in used],
+                                             batch_size=1000, ignore_conflicts=True)
+    return len(created)
+
+
+def take_card_numbers(count):
+    """
+    Lấy count số thẻ chưa phát theo thứ tự trong kho, phải gọi trong transaction.
+    skip_locked: 2 lần duyệt chạy song song không lấy trùng số.
+    """
+    if not count:
+        return []
+    rows = list(CardNumber.objects.select_for_update(skip_locked=True).filter(issued=False)
+                .order_by('id').values_list('id', 'number')[:count])
+    if len(rows) < count:
+        raise CardPoolExhausted(f'Kho chỉ còn {len(rows)} số thẻ, cần {count}')
+    CardNumber.objects.filter(id__in=[row_id for row_id, _ in rows]).update(issued=True, update_time=timezone.now())
+    return [number for _, number in rows]
+
+
+def approve(visitor_ids, cards=()):
+    """
+    Duyệt nhiều khách và phát thẻ xe cho các khách trong cards (dict visitor, license_plate, vehicle_type,
+    color) trong 1 transaction: 1 câu UPDATE cho việc duyệt, 1 bulk_create cho thẻ. Khách đã có thẻ thì bỏ qua.
+    """
+    with transaction.atomic():
+        found = set(Visitor.objects.filter(id__in=visitor_ids).values_list('id', flat=True))
+        approved = Visitor.objects.filter(id__in=found, is_approved=False) \
+            .update(is_approved=True, update_time=timezone.now())
+
+        requested = [card for card in cards if card['visitor'] in found]
+        has_card = set(ParkingCard.objects.filter(visitor_id__in=[card['visitor'] for card in requested])
+                       .values_list('visitor_id', flat=True))
+        pending = [card for card in requested if card['visitor'] not in has_card]
+
+        # plate_key được PlateKeyField tính trong bulk_create, ràng buộc parkingcard_single_owner do DB kiểm tra
+        issued = ParkingCard.objects.bulk_create([
+            ParkingCard(visitor_id=card['visitor'], card_number=number, license_plate=card['license_plate'],
+                        vehicle_type=card['vehicle_type'], color=card.get('color') or 'Trắng')
+            for card, number in zip(pending, take_card_numbers(len(pending)))])
+
+    # update() / bulk_create không gửi signal
+    gate.invalidate()
+    return {
+        'approved': approved,
+        'not_found': sorted(set(visitor_ids) - found),
+        'cards': [{'visitor': card.visitor_id, 'card_number': card.card_number} for card in issued],
+        'already_has_card': sorted(has_card),
+    }
@@ -17,6 +17,11 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 MEDIA_ROOT = '%s/chungcu/static/' % BASE_DIR
 
+# Ảnh tải lên được lưu tạm ở đây rồi worker process_media_uploads đẩy lên storage
+MEDIA_SPOOL_ROOT = '%s/media_spool/' % BASE_DIR
+# chungcu.media.LocalBackend: lưu vào MEDIA_ROOT (dùng khi test / không có mạng)
+MEDIA_UPLOAD_BACKEND = 'chungcu.media.CloudinaryBackend'
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
@@ -128,6 +133,13 @@ DATABASES = {
 
 AUTH_USER_MODEL = 'chungcu.User'
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'chungcu',
+    }
+}
+
 import pymysql
 pymysql.install_as_MySQLdb()
 